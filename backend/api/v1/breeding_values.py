@@ -6,8 +6,9 @@
 # 功能: 育种值估计相关API端点
 # ============================================================================
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
@@ -18,6 +19,8 @@ from models.breeding_value import BreedingValueRun as BreedingValueRunModel, Bre
 from models.growth import GrowthRecord
 from models.animal import Animal
 from services.julia_service import JuliaService
+from services.breeding_value_service import BreedingValueResultService
+from tasks import enqueue_breeding_value_run
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +76,15 @@ class BreedingValueRunResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BreedingValueRunAccepted(BaseModel):
+    """
+    育种值评估任务受理响应模型
+    """
+    run_id: int
+    status: str
+    status_url: str = Field(..., description="轮询运行状态的地址")
+
+
 class BreedingValueResult(BaseModel):
     """
     育种值结果模型
@@ -100,13 +112,12 @@ class BreedingValueResult(BaseModel):
 # ============================================================================
 
 @router.post("/runs", 
-             response_model=BreedingValueRunResponse,
-             status_code=status.HTTP_201_CREATED,
+             response_model=BreedingValueRunAccepted,
+             status_code=status.HTTP_202_ACCEPTED,
              summary="创建育种值评估运行",
-             description="创建新的育种值评估任务并在后台执行")
+             description="创建新的育种值评估任务并投递到计算队列")
 async def create_breeding_value_run(
     run_data: BreedingValueRunCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -138,37 +149,46 @@ async def create_breeding_value_run(
     
     ## 返回
     
-    返回创建的运行记录，任务将在后台异步执行
+    立即返回 202 及运行ID，任务由RabbitMQ队列中的独立worker执行，
+    通过 status_url 轮询运行状态
     """
     logger.info(f"创建育种值评估运行: {run_data.run_name}")
     
-    logger.info(f"创建育种值评估运行: {run_data.run_name}")
-    
     # 1. 创建运行记录
     run_record = BreedingValueRunModel(
         run_name=run_data.run_name,
         trait_id=run_data.trait_id,
         method=run_data.method,
         status="pending",
-        model_spec=run_data.model_specification,
-        started_at=datetime.now()
+        model_spec=run_data.model_specification
     )
     
     db.add(run_record)
     db.commit()
     db.refresh(run_record)
     
-    # 添加后台任务
-    background_tasks.add_task(
-        execute_breeding_value_analysis,
+    # 2. 投递到计算队列 (不在API进程内计算)
+    try:
+        enqueue_breeding_value_run(
+            run_id=run_record.id,
+            method=run_data.method,
+            model_spec=run_data.model_specification,
+            use_gpu=run_data.use_gpu
+        )
+    except Exception as e:
+        logger.error(f"育种值评估任务投递失败: run_id={run_record.id}, error={str(e)}")
+        run_record.status = "failed"
+        db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="计算队列不可用，请稍后重试"
+        )
+    
+    return BreedingValueRunAccepted(
         run_id=run_record.id,
-        method=run_data.method,
-        model_spec=run_data.model_specification,
-        use_gpu=run_data.use_gpu,
-        db_session=db # Careful with passing session to background task, usually better to create new session
+        status=run_record.status,
+        status_url=f"/api/v1/breeding-values/runs/{run_record.id}"
     )
-    
-    return run_record
 
 @router.get("/runs/{run_id}",
             response_model=BreedingValueRunResponse,
@@ -274,24 +294,23 @@ async def list_breeding_value_runs(
     return query.order_by(BreedingValueRunModel.started_at.desc()).offset(skip).limit(limit).all()
 
 # ============================================================================
-# 后台任务函数
-# Background Task Functions
+# 队列任务函数
+# Queue Task Functions
 # ============================================================================
 
 async def execute_breeding_value_analysis(
     run_id: int,
     method: str,
     model_spec: dict,
-    use_gpu: bool,
-    db_session: Session = None # Should use a fresh session in practice
+    use_gpu: bool
 ):
     """
-    执行育种值分析（后台任务）
-    Note: In real app, create a new DB session here.
+    执行育种值分析（由 tasks.run_breeding_value_analysis 在worker进程中调用）
     """
-    # Create new session manually since BackgroundTasks runs after response
+    # worker进程中独立创建会话
     from database import SessionLocal
     db = SessionLocal()
+    run_record = None
     
     logger.info(f"开始执行育种值分析: run_id={run_id}, method={method}")
     
@@ -357,8 +376,7 @@ async def execute_breeding_value_analysis(
                     animal_id=anim_id,
                     ebv=round(0.1 * (i % 100) - 5.0, 2),  # 基于索引生成-5到+5范围的EBV值
                     reliability=round(0.5 + (0.005 * (i % 100)), 2),  # 50%-100%可靠性
-                    accuracy=round(0.6 + (0.003 * (i % 100)), 2),  # 60%-90%准确性
-                    percentile_rank=round(100 * (i + 1) / max(len(phenotype_data.get("animal_ids", [])), 1), 1)  # 百分位排名
+                    accuracy=round(0.6 + (0.003 * (i % 100)), 2)  # 60%-90%准确性
                 )
                  db.add(res)
         else:
@@ -368,13 +386,15 @@ async def execute_breeding_value_analysis(
                     animal_id=int(anim_id),
                     ebv=float(ebv_val),
                     reliability=float(reliabilities.get(anim_id, 0.5)),
-                    accuracy=0.7, # Simplified
-                    percentile_rank=0.0 # Requires post-processing sort
+                    accuracy=0.7 # Simplified
                 )
                 db.add(res)
+        
+        # 百分位排名在数据库内一次窗口计算
+        BreedingValueResultService(db).recompute_percentiles(run_id)
             
         run_record.status = "completed"
-        run_record.completed_at = datetime.now()
+        run_record.completed_at = func.now()
         run_record.n_animals = 10
         run_record.n_records = 10
         db.commit()
@@ -7,7 +7,9 @@
 # ============================================================================
 
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy import select
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime, date
@@ -19,6 +21,8 @@ from database import get_db
 from models.cloud import SyncTask as SyncTaskModel, ShareAgreement as ShareAgreementModel
 from models.cloud import ImportJob as ImportJobModel, ExportJob as ExportJobModel
 from models.cloud import SyncDirection, DataCategory, SyncStatus, SharePermission
+from models.animal import Animal
+from services.data_io_service import data_io_service, STREAM_MEDIA_TYPES
 
 logger = logging.getLogger(__name__)
 
@@ -245,6 +249,28 @@ async def export_animals(format: str = "xlsx", db: Session = Depends(get_db)):
     db.refresh(job)
     return job
 
+@router.get("/export/animals/stream")
+async def stream_export_animals(
+    format: str = Query("ndjson", description="导出格式: ndjson/csv"),
+    db: Session = Depends(get_db)
+):
+    """流式导出动物档案 (服务端游标分批读取，不在内存中拼装完整结果)"""
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
+    
+    stmt = select(
+        Animal.id, Animal.animal_code, Animal.electronic_id, Animal.name,
+        Animal.breed, Animal.sex, Animal.birth_date, Animal.birth_weight,
+        Animal.sire_id, Animal.dam_id, Animal.status, Animal.current_farm_id,
+        Animal.current_weight
+    ).where(Animal.is_deleted == False).order_by(Animal.id)
+    
+    return StreamingResponse(
+        data_io_service.stream_export(stmt, format, db),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=animals_export.{format}"}
+    )
+
 @router.get("/status", response_model=CloudStatus)
 async def get_cloud_status(db: Session = Depends(get_db)):
     # Mock status check - connecting to external service
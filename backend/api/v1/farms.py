@@ -8,6 +8,7 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from sqlalchemy import update
 from typing import List, Optional
 from pydantic import BaseModel, Field, field_validator
 from datetime import datetime, date
@@ -34,7 +35,7 @@ class FarmBase(BaseModel):
     farm_type: str = Field(..., description="类型: breeding/commercial/mixed")
     capacity: Optional[int] = Field(None, description="设计存栏量")
     area_hectares: Optional[Decimal] = Field(None, description="占地面积(公顷)")
-    address: Optional[str] = Field(None, description="详细地址")
+    address: Optional[str] = Field(None, max_length=200, description="详细地址")
     longitude: Optional[Decimal] = Field(None, description="经度")
     latitude: Optional[Decimal] = Field(None, description="纬度")
     manager_name: Optional[str] = Field(None, max_length=100, description="场长姓名")
@@ -70,7 +71,7 @@ class FarmUpdate(BaseModel):
     capacity: Optional[int] = None
     current_stock: Optional[int] = None
     area_hectares: Optional[Decimal] = None
-    address: Optional[str] = None
+    address: Optional[str] = Field(None, max_length=200)
     manager_name: Optional[str] = None
     manager_phone: Optional[str] = None
     status: Optional[str] = None
@@ -216,8 +217,7 @@ async def create_farm(
     service = FarmService(db)
     
     # 1. 检查代码唯一性
-    existing = service.get_by_code(farm_data.code)
-    if existing:
+    if service.exists_by_field("code", farm_data.code):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"羊场代码已存在: {farm_data.code}"
@@ -268,6 +268,7 @@ async def list_farms(
     organization_id: Optional[int] = Query(None, description="机构ID过滤"),
     farm_type: Optional[str] = Query(None, description="类型过滤"),
     farm_status: Optional[str] = Query(None, alias="status", description="状态过滤"),
+    keyword: Optional[str] = Query(None, description="名称关键字 (模糊搜索)"),
     db: Session = Depends(get_db)
 ):
     """获取羊场列表"""
@@ -284,8 +285,10 @@ async def list_farms(
     if farm_status:
         filters["status"] = farm_status
     
-    farms = service.get_multi(skip=skip, limit=limit, filters=filters)
-    return farms
+    if keyword:
+        return service.search(keyword, skip=skip, limit=limit, filters=filters)
+    
+    return service.get_multi_mappings(FarmResponse.model_fields, skip=skip, limit=limit, filters=filters)
 
 
 @router.get("/{farm_id}",
@@ -497,14 +500,11 @@ async def list_barns(
     """获取羊舍列表"""
     logger.info(f"获取羊舍列表: farm_id={farm_id}")
     
-    query = db.query(Barn).filter(Barn.farm_id == farm_id)
-    
-    if barn_type:
-        query = query.filter(Barn.barn_type == barn_type)
-    if status:
-        query = query.filter(Barn.status == status)
-        
-    return query.all()
+    service = BarnService(db)
+    filters = {"farm_id": farm_id, "barn_type": barn_type, "status": status}
+    return service.get_multi_mappings(
+        BarnResponse.model_fields, limit=None, order_by="code", order_desc=False, filters=filters
+    )
 
 
 @router.get("/{farm_id}/barns/{barn_id}",
@@ -579,38 +579,15 @@ async def assign_animal_to_barn(
     barn = db.query(Barn).filter(Barn.id == barn_id).first()
     if not barn:
         raise HTTPException(status_code=404, detail="Barn not found")
-        
-    # 2. 关闭之前的位置记录 (如有)
-    active_loc = db.query(AnimalLocation).filter(
-        AnimalLocation.animal_id == location_data.animal_id,
-        AnimalLocation.exit_date == None
-    ).first()
     
-    if active_loc:
-        active_loc.exit_date = datetime.now()
-        active_loc.exit_reason = "transfer_new_entry"
-        # 减少旧羊舍计数
-        old_barn = db.query(Barn).get(active_loc.barn_id)
-        if old_barn and old_barn.current_count > 0:
-            old_barn.current_count -= 1
-            
-    # 3. 创建新的位置记录
-    new_loc = AnimalLocation(
+    # 2. 关闭之前的位置记录、创建新记录并原子增减新旧羊舍计数
+    service = AnimalLocationService(db)
+    return service.assign_to_barn(
         animal_id=location_data.animal_id,
         farm_id=farm_id,
         barn_id=barn_id,
-        pen_number=location_data.pen_number,
-        entry_date=datetime.now()
+        pen_number=location_data.pen_number
     )
-    db.add(new_loc)
-    
-    # 4. 更新羊舍当前数量
-    barn.current_count += 1
-    
-    db.commit()
-    db.refresh(new_loc)
-    
-    return new_loc
 
 
 @router.get("/{farm_id}/barns/{barn_id}/animals",
@@ -674,10 +651,12 @@ async def transfer_animal(
     else:
         current_loc.exit_date = datetime.now()
         current_loc.exit_reason = transfer_reason
-        # 减少原羊舍计数
-        old_barn = db.query(Barn).get(barn_id)
-        if old_barn and old_barn.current_count > 0:
-            old_barn.current_count -= 1
+        # 减少原羊舍计数 (原子更新，避免并发转舍读-改-写丢失计数)
+        db.execute(
+            update(Barn)
+            .where(Barn.id == barn_id, Barn.current_count > 0)
+            .values(current_count=Barn.current_count - 1)
+        )
             
     # 2. 创建新记录
     new_loc = AnimalLocation(
@@ -689,7 +668,9 @@ async def transfer_animal(
     db.add(new_loc)
     
     # 3. 增加新羊舍计数
-    target_barn.current_count += 1
+    db.execute(
+        update(Barn).where(Barn.id == target_barn_id).values(current_count=Barn.current_count + 1)
+    )
     
     db.commit()
     db.refresh(new_loc)
@@ -9,8 +9,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from pydantic import BaseModel, Field
-from datetime import datetime, date
+from pydantic import BaseModel, Field, field_validator
+from datetime import datetime, date, timedelta
 from decimal import Decimal
 import logging
 
@@ -19,7 +19,7 @@ from services.feed_service import (
     FeedTypeService, FeedFormulaService, FeedingPlanService,
     FeedingRecordService, FeedInventoryService
 )
-from models.feed import FeedType, FeedFormula, FeedingPlan, FeedingRecord, FeedInventory
+from models.feed import FeedType, FeedFormula, FeedFormulaIngredient, FeedingPlan, FeedingRecord, FeedInventory
 
 logger = logging.getLogger(__name__)
 
@@ -87,7 +87,6 @@ class FeedFormulaBase(BaseModel):
     name: str = Field(..., max_length=200, description="配方名称")
     target_animal_type: str = Field(..., description="目标动物类型")
     daily_amount_kg: Optional[Decimal] = Field(None, description="日喂量(kg)")
-    cost_per_kg: Optional[Decimal] = Field(None, description="每公斤成本")
     notes: Optional[str] = Field(None, description="备注")
 
 
@@ -109,8 +108,7 @@ class FeedFormulaCreate(FeedFormulaBase):
                     {"feed_type_id": 2, "feed_type_name": "豆粕", "percentage": 20},
                     {"feed_type_id": 3, "feed_type_name": "麸皮", "percentage": 15},
                     {"feed_type_id": 4, "feed_type_name": "预混料", "percentage": 10}
-                ],
-                "cost_per_kg": 2.85
+                ]
             }
         }
 
@@ -121,6 +119,9 @@ class FeedFormulaResponse(FeedFormulaBase):
     organization_id: int
     ingredients: List[FormulaIngredient]
     nutritional_summary: Optional[dict]
+    cost_per_kg: Optional[Decimal] = Field(None, description="每公斤成本 (按成分与单价自动计算)")
+    total_crude_protein: Optional[Decimal] = None
+    total_metabolizable_energy: Optional[Decimal] = None
     is_active: bool
     created_at: datetime
     updated_at: datetime
@@ -181,6 +182,15 @@ class FeedingRecordCreate(BaseModel):
     leftover_kg: Decimal = Field(default=0, description="剩余量(kg)")
     notes: Optional[str] = Field(None, description="备注")
 
+    @field_validator("feed_date")
+    @classmethod
+    def check_feed_date(cls, v: date) -> date:
+        """饲喂日期为分区键: 只接受一年内补录至次日，防止误填日期落入远期/远古分区"""
+        today = date.today()
+        if not today - timedelta(days=366) <= v <= today + timedelta(days=1):
+            raise ValueError("饲喂日期须在近一年内，且不晚于次日")
+        return v
+
 
 class FeedingRecordResponse(BaseModel):
     """饲喂记录响应"""
@@ -331,12 +341,28 @@ async def create_feed_formula(
     
     logger.info(f"创建饲料配方: {formula_data.name}")
     
+    feed_type_service = FeedTypeService(db)
+    for ingredient in formula_data.ingredients:
+        feed_type = feed_type_service.get_cached(ingredient.feed_type_id)
+        if feed_type is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"饲料类型不存在: {ingredient.feed_type_id}"
+            )
+        ingredient.feed_type_name = feed_type["name"]
+    
     try:
         formula = FeedFormula(
             organization_id=formula_data.organization_id,
             formula_code=formula_data.name[:20].replace(' ', '_'),
-            formula_name=formula_data.name,
-            target_group=formula_data.target_animal_type,
+            name=formula_data.name,
+            target_animal_type=formula_data.target_animal_type,
+            daily_amount_kg=formula_data.daily_amount_kg,
+            ingredients=[i.model_dump(mode='json') for i in formula_data.ingredients],
+            ingredients_rel=[
+                FeedFormulaIngredient(feed_type_id=i.feed_type_id, percentage=i.percentage)
+                for i in formula_data.ingredients
+            ],
             is_active=True
         )
         db.add(formula)
@@ -373,11 +399,34 @@ async def calculate_formula_cost(
 ):
     """计算配方成本"""
     logger.info(f"计算配方成本: {formula_id}")
+    
+    service = FeedFormulaService(db)
+    formula = service.get(formula_id)
+    if not formula:
+        raise HTTPException(status_code=404, detail="配方不存在")
+    
+    formula.recalc()
+    db.commit()
+    
+    cost_per_day = None
+    if formula.cost_per_kg is not None and formula.daily_amount_kg is not None:
+        cost_per_day = formula.cost_per_kg * formula.daily_amount_kg
+    
     return {
         "formula_id": formula_id,
-        "cost_per_kg": 2.85,
-        "cost_per_day": 3.42,
-        "breakdown": []
+        "cost_per_kg": formula.cost_per_kg,
+        "cost_per_day": cost_per_day,
+        "breakdown": [
+            {
+                "feed_type_id": i.feed_type_id,
+                "feed_type_name": i.feed_type.name,
+                "percentage": i.percentage,
+                "unit_price": i.feed_type.unit_price,
+                "cost_per_kg": (i.percentage * i.feed_type.unit_price / 100
+                                if i.feed_type.unit_price is not None else None),
+            }
+            for i in formula.ingredients_rel if not i.is_deleted
+        ]
     }
 
 
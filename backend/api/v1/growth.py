@@ -14,7 +14,6 @@ from datetime import datetime, date
 from decimal import Decimal
 import logging
 
-from sqlalchemy import func
 from database import get_db
 from services.growth_service import GrowthRecordService
 from models.growth import GrowthRecord
@@ -178,6 +177,7 @@ async def create_growth_record(
         )
         db.add(record)
         db.commit()
+        GrowthRecordService(db).recompute_adg([record.animal_id])
         db.refresh(record)
         return record
     except Exception as e:
@@ -195,24 +195,28 @@ async def create_batch_growth_records(
     """批量创建生长测定记录"""
     logger.info(f"批量创建生长测定记录: {len(batch_data.measurements)}条")
     
-    service = GrowthRecordService(db)
-    success_count = 0
-    failed_animals = []
-    
-    for m in batch_data.measurements:
-        try:
-            record = GrowthRecord(
-                animal_id=m.animal_id,
-                measurement_date=batch_data.measurement_date,
-                measurement_type='routine',
-                body_weight=m.body_weight
-            )
-            db.add(record)
-            success_count += 1
-        except:
-            failed_animals.append(m.animal_id)
+    rows = [
+        {
+            "animal_id": m.animal_id,
+            "measurement_date": batch_data.measurement_date,
+            "measurement_type": 'routine',
+            "body_weight": m.body_weight
+        }
+        for m in batch_data.measurements
+    ]
     
-    db.commit()
+    # 整批写入: 成功则全部成功，失败则整批回滚
+    try:
+        GrowthRecord.bulk_insert(db, rows)
+        db.commit()
+        GrowthRecordService(db).recompute_adg({row["animal_id"] for row in rows})
+        success_count = len(rows)
+        failed_animals = []
+    except Exception as e:
+        db.rollback()
+        logger.error(f"批量创建生长测定记录失败: {str(e)}")
+        success_count = 0
+        failed_animals = [m.animal_id for m in batch_data.measurements]
     
     return BatchMeasurementResult(
         total_count=len(batch_data.measurements),
@@ -339,26 +343,18 @@ async def get_growth_statistics(
     """获取生长统计"""
     logger.info(f"获取生长统计: farm_id={farm_id}")
     
-    total_measurements = db.query(GrowthRecord).count()
-    
-    # Use simple averages for demo, real stats need specific age windows
-    avg_birth = db.query(func.avg(GrowthRecord.body_weight)).filter(GrowthRecord.age_days <= 1).scalar() or 0
-    avg_weaning = db.query(func.avg(GrowthRecord.body_weight)).filter(GrowthRecord.age_days.between(60, 90)).scalar() or 0
-    avg_120 = db.query(func.avg(GrowthRecord.body_weight)).filter(GrowthRecord.age_days.between(115, 125)).scalar() or 0
-    
-    # Placeholder for daily gain calculation which is complex on DB side, returning avg of all records for now
-    avg_daily_gain = Decimal("0.250") 
+    summary = GrowthRecordService(db).get_population_summary()
     
     # Get top 5 animals by weight (simplified "performer")
     top_animals = db.query(GrowthRecord.animal_id).order_by(GrowthRecord.body_weight.desc()).limit(5).all()
     top_ids = [t[0] for t in top_animals]
 
     return GrowthStatistics(
-        total_measurements=total_measurements,
-        avg_birth_weight=Decimal(f"{avg_birth:.1f}"),
-        avg_weaning_weight=Decimal(f"{avg_weaning:.1f}"),
-        avg_120day_weight=Decimal(f"{avg_120:.1f}"),
-        avg_daily_gain=avg_daily_gain,
+        total_measurements=summary["total_records"],
+        avg_birth_weight=Decimal(f"{summary['avg_birth_weight'] or 0:.1f}"),
+        avg_weaning_weight=Decimal(f"{summary['avg_weaning_weight'] or 0:.1f}"),
+        avg_120day_weight=Decimal(f"{summary['avg_120day_weight'] or 0:.1f}"),
+        avg_daily_gain=Decimal(f"{summary['avg_daily_gain'] or 0:.3f}"),
         top_performers=top_ids
     )
 
@@ -8,6 +8,7 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from sqlalchemy import func, select
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime, date, timedelta
@@ -244,9 +245,16 @@ async def create_health_record(
     """创建健康检查记录"""
     logger.info(f"创建健康检查记录: animal={record_data.animal_id}")
     
+    if record_data.disease_id and DiseaseService(db).get_cached(record_data.disease_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"疾病不存在: {record_data.disease_id}"
+        )
+    
     try:
         record = HealthRecord(
             animal_id=record_data.animal_id,
+            disease_id=record_data.disease_id,
             check_date=record_data.check_date,
             check_type=record_data.check_type,
             body_temperature=record_data.body_temperature,
@@ -347,12 +355,15 @@ async def get_animal_health_history(
             response_model=List[VaccineTypeResponse],
             summary="获取疫苗类型列表")
 async def list_vaccine_types(
+    target_disease: Optional[str] = Query(None, description="目标疾病"),
     db: Session = Depends(get_db)
 ):
     """获取疫苗类型列表"""
     logger.info("获取疫苗类型列表")
     
     service = VaccineTypeService(db)
+    if target_disease:
+        return service.get_by_target_disease(target_disease)
     return service.get_multi(limit=100)
 
 
@@ -367,6 +378,12 @@ async def create_vaccination_record(
     """创建接种记录"""
     logger.info(f"创建接种记录: animal={record_data.animal_id}")
     
+    if VaccineTypeService(db).get_cached(record_data.vaccine_type_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"疫苗类型不存在: {record_data.vaccine_type_id}"
+        )
+    
     try:
         record = VaccinationRecord(
             animal_id=record_data.animal_id,
@@ -579,17 +596,25 @@ async def get_health_statistics(
     """获取健康统计"""
     logger.info(f"获取健康统计: farm_id={farm_id}")
     
-    logger.info(f"获取健康统计: farm_id={farm_id}")
-    
-    total_checks = db.query(HealthRecord).count()
-    recent = db.query(HealthRecord).filter(HealthRecord.check_date >= date.today() - timedelta(days=7)).count()
-    quarantined = db.query(HealthRecord).filter(HealthRecord.is_quarantined == True).distinct(HealthRecord.animal_id).count()
+    today = date.today()
+    # 一条聚合查询取各项计数，不经 Query.count() 的子查询包装
+    stats = db.execute(
+        select(
+            func.count(HealthRecord.id).label('total'),
+            func.count(HealthRecord.id).filter(HealthRecord.check_date >= today - timedelta(days=7)).label('recent'),
+            func.count(HealthRecord.id).filter(HealthRecord.follow_up_date >= today).label('followups'),
+        )
+    ).one()
+    vaccination_due = db.scalar(
+        select(func.count()).select_from(VaccinationRecord)
+        .where(VaccinationRecord.next_vaccination_date <= today + timedelta(days=7))
+    )
     
     return HealthStatistics(
-        total_checks=total_checks,
-        recent_7days_checks=recent,
-        quarantined_count=quarantined,
-        pending_followups=db.query(HealthRecord).filter(HealthRecord.follow_up_date >= date.today()).count(),
-        vaccination_due_count=db.query(VaccinationRecord).filter(VaccinationRecord.next_vaccination_date <= date.today() + timedelta(days=7)).count(),
+        total_checks=stats.total,
+        recent_7days_checks=stats.recent,
+        quarantined_count=0,  # 健康记录暂无隔离标记
+        pending_followups=stats.followups,
+        vaccination_due_count=vaccination_due,
         deworming_due_count=0
     )
@@ -8,15 +8,17 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import logging
 
+from config import settings
 from database import get_db
 from services.iot_service import IoTDeviceService, IoTDataService, AutoWeighingService
+from services.iot_ingest import iot_ingest_buffer, heartbeat_buffer
 from models.iot import IoTDevice, IoTData, AutoWeighingRecord as AutoWeighingModel
 from models.growth import GrowthRecord
 from models.animal import Animal
@@ -305,14 +307,12 @@ async def update_device(
              summary="设备心跳")
 async def device_heartbeat(
     device_id: int,
-    firmware_version: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    firmware_version: Optional[str] = Query(None)
 ):
-    """设备心跳"""
+    """设备心跳 (进入心跳缓冲，按间隔批量更新)"""
     logger.info(f"设备心跳: {device_id}")
     
-    service = IoTDeviceService(db)
-    service.update_heartbeat(device_id)
+    heartbeat_buffer.mark(device_id)
     
     return {"status": "ok", "server_time": datetime.now().isoformat()}
 
@@ -322,46 +322,55 @@ async def device_heartbeat(
 # Data Collection API Endpoints
 # ============================================================================
 
+def _local_time(value: datetime) -> datetime:
+    """带时区的设备时间换算为服务端本地时间 (无时区则视为本地时间)"""
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
 @router.post("/data",
-             status_code=status.HTTP_201_CREATED,
+             status_code=status.HTTP_202_ACCEPTED,
              summary="上报数据",
              description="设备批量上报采集数据")
 async def upload_data(
-    batch_data: IoTDataBatchCreate,
-    db: Session = Depends(get_db)
+    batch_data: IoTDataBatchCreate
 ):
     """
     设备数据上报
     
-    支持批量上报多个数据点
+    支持批量上报多个数据点；数据进入写入缓冲，按批量/定时合并落库。
+    返回时数据尚未落库，accepted 仅表示已进入缓冲
     """
     logger.info(f"数据上报: {len(batch_data.data_points)}条")
     
-    saved_count = 0
-    errors = 0
-    
-    for point in batch_data.data_points:
-        try:
-            db_point = IoTData(
-                device_id=point.device_id,
-                metric_type=point.metric_type,
-                metric_value=point.metric_value,
-                unit=point.unit,
-                animal_id=point.animal_id,
-                time=point.time or datetime.now(),
-                metadata_content=point.metadata
-            )
-            db.add(db_point)
-            saved_count += 1
-        except Exception:
-            errors += 1
-            
-    db.commit()
+    received_at = datetime.now()
+    # 设备时钟不可信: 采集时间超出接收时刻 ± 容差的点直接拒收，避免写入远期/远古分区
+    skew = timedelta(hours=settings.IOT_CLOCK_SKEW_HOURS)
+    points = [
+        point for point in batch_data.data_points
+        if point.time is None or abs(_local_time(point.time) - received_at) <= skew
+    ]
+    if len(points) < len(batch_data.data_points):
+        logger.warning(
+            "拒收时钟偏差过大的数据点: %d条", len(batch_data.data_points) - len(points)
+        )
+    rows = [
+        {
+            "device_id": point.device_id,
+            "data_type": point.metric_type,
+            "value": float(point.metric_value),
+            "unit": point.unit,
+            "animal_id": point.animal_id,
+            "timestamp": _local_time(point.time) if point.time else received_at,
+            "received_at": received_at,
+            "data_payload": point.metadata,
+        }
+        for point in points
+    ]
+    await iot_ingest_buffer.add(rows)
     
     return {
         "received": len(batch_data.data_points),
-        "processed": saved_count,
-        "errors": errors
+        "accepted": len(rows)
     }
 
 
@@ -583,21 +592,27 @@ async def get_iot_statistics(
     """获取物联网统计"""
     logger.info(f"获取物联网统计: farm_id={farm_id}")
     
-    device_query = db.query(IoTDevice)
-    if farm_id:
-        device_query = device_query.filter(IoTDevice.farm_id == farm_id)
-        
-    total = device_query.count()
-    online = device_query.filter(IoTDevice.status == 'online').count()
+    device_stats = IoTDeviceService(db).get_statistics(farm_id)
+    total = device_stats["total_devices"]
+    online = device_stats["online_count"]
     
-    today = datetime.now().date()
-    data_points = db.query(IoTData).filter(func.date(IoTData.time) == today).count()
+    # 时间列按区间比较 (可走索引/分区裁剪)，计数直接 SELECT count(*) 不包子查询
+    day_start = datetime.combine(datetime.now().date(), datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    data_points = db.scalar(
+        select(func.count()).select_from(IoTData)
+        .where(IoTData.timestamp >= day_start, IoTData.timestamp < day_end)
+    )
+    weighings = db.scalar(
+        select(func.count()).select_from(AutoWeighingModel)
+        .where(AutoWeighingModel.weighing_time >= day_start, AutoWeighingModel.weighing_time < day_end)
+    )
     
     return IoTStatistics(
         total_devices=total,
         online_devices=online,
         offline_devices=total - online,
-        error_devices=0,
+        error_devices=device_stats["error_count"],
         today_data_points=data_points,
-        today_weighings=db.query(AutoWeighingModel).filter(func.date(AutoWeighingModel.weighing_time) == today).count()
+        today_weighings=weighings
     )
@@ -21,7 +21,8 @@ from models.animal import Animal
 from models.reproduction import BreedingRecord, LambingRecord, PregnancyRecord
 from models.breeding_value import BreedingValueResult
 from models.farm import Farm
-from sqlalchemy import func
+from sqlalchemy import func, select
+from services.data_io_service import data_io_service, STREAM_MEDIA_TYPES
 import csv
 
 logger = logging.getLogger(__name__)
@@ -381,6 +382,39 @@ async def get_selection_report(
     )
 
 
+@router.get("/selection/stream",
+            summary="流式导出选种候选",
+            description="按育种值排序流式导出全部候选 (NDJSON/CSV)，适用于大群体")
+async def stream_selection_candidates(
+    sex: Optional[str] = Query(None, description="性别: male/female"),
+    format: str = Query("ndjson", description="导出格式: ndjson/csv"),
+    db: Session = Depends(get_db)
+):
+    """流式导出选种候选"""
+    logger.info(f"流式导出选种候选: sex={sex}, format={format}")
+    
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
+    
+    stmt = select(
+        Animal.id.label("animal_id"), Animal.animal_code, Animal.name, Animal.sex,
+        Animal.birth_date, Animal.breed,
+        BreedingValueResult.ebv, BreedingValueResult.reliability,
+        BreedingValueResult.accuracy, BreedingValueResult.percentile_rank
+    ).join(Animal, BreedingValueResult.animal_id == Animal.id)
+    
+    if sex:
+        stmt = stmt.where(Animal.sex == sex)
+    
+    stmt = stmt.order_by(BreedingValueResult.ebv.desc())
+    
+    return StreamingResponse(
+        data_io_service.stream_export(stmt, format, db),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=selection_candidates.{format}"}
+    )
+
+
 @router.get("/economic",
             response_model=EconomicReport,
             summary="获取经济效益报告",
@@ -6,10 +6,11 @@
 # 功能: 数据库连接和会话管理
 # ============================================================================
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from sqlalchemy.orm import sessionmaker, Session, ORMExecuteState, raiseload
+from sqlalchemy.orm.interfaces import LoaderOption
+from typing import Generator, List
 import logging
 
 from config import settings
@@ -27,6 +28,10 @@ engine = create_engine(
     pool_size=settings.DATABASE_POOL_SIZE,
     max_overflow=settings.DATABASE_MAX_OVERFLOW,
     pool_pre_ping=True,  # 连接池预检查
+    pool_recycle=settings.DATABASE_POOL_RECYCLE,
+    query_cache_size=settings.DATABASE_QUERY_CACHE_SIZE,  # 编译后SQL的LRU缓存，小查询免重复编译
+    insertmanyvalues_page_size=5000,  # 批量插入每条多行INSERT的行数
+    executemany_mode='values_plus_batch',  # 批量UPDATE/DELETE走psycopg2 execute_batch
     echo=settings.DEBUG,  # SQL语句日志
 )
 
@@ -40,6 +45,38 @@ SessionLocal = sessionmaker(
 # 创建基类
 Base = declarative_base()
 
+# ============================================================================
+# 加载策略
+# Loading Strategy
+# ============================================================================
+
+def no_lazy(*eager: LoaderOption) -> List[LoaderOption]:
+    """
+    列表查询的加载选项: 仅加载显式声明的关系，其余关系禁止延迟加载
+    
+    ORM_RAISE_ON_LAZY_LOAD 开启时附加 raiseload('*')，循环中误触关系即抛错而非静默N+1；
+    关闭时(灰度期)不改变加载行为，由会话事件记录延迟加载以定位热点。
+    
+    使用示例:
+    ```python
+    db.query(Farm).options(*no_lazy(selectinload(Farm.barns))).all()
+    ```
+    """
+    if settings.ORM_RAISE_ON_LAZY_LOAD:
+        return [*eager, raiseload('*')]
+    return list(eager)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _log_lazy_load(orm_execute_state: ORMExecuteState) -> None:
+    """灰度期记录关系延迟加载 (raiseload 未启用时)"""
+    if orm_execute_state.lazy_loaded_from is not None and not settings.ORM_RAISE_ON_LAZY_LOAD:
+        logger.warning(
+            "关系延迟加载: %s -> %s",
+            orm_execute_state.lazy_loaded_from.class_.__name__,
+            orm_execute_state.bind_mapper.class_.__name__ if orm_execute_state.bind_mapper else "?"
+        )
+
 # ============================================================================
 # 依赖注入函数
 # Dependency Injection Functions
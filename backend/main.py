@@ -12,10 +12,16 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from contextlib import asynccontextmanager
+import atexit
+import importlib
+import platform
+import queue
+import sys
 import uvicorn
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 
 # 导入配置
@@ -24,73 +30,6 @@ from config import settings
 # 导入路由 - 核心模块
 from api.v1 import breeding_values
 
-# 导入路由 - 新增模块 (按需导入，支持模块缺失)
-try:
-    from api.v1 import farms
-    HAS_FARMS = True
-except ImportError:
-    HAS_FARMS = False
-
-try:
-    from api.v1 import health
-    HAS_HEALTH = True
-except ImportError:
-    HAS_HEALTH = False
-
-try:
-    from api.v1 import reproduction
-    HAS_REPRODUCTION = True
-except ImportError:
-    HAS_REPRODUCTION = False
-
-try:
-    from api.v1 import growth
-    HAS_GROWTH = True
-except ImportError:
-    HAS_GROWTH = False
-
-try:
-    from api.v1 import iot
-    HAS_IOT = True
-except ImportError:
-    HAS_IOT = False
-
-try:
-    from api.v1 import feeding
-    HAS_FEEDING = True
-except ImportError:
-    HAS_FEEDING = False
-
-try:
-    from api.v1 import reports
-    HAS_REPORTS = True
-except ImportError:
-    HAS_REPORTS = False
-
-try:
-    from api.v1 import cloud
-    HAS_CLOUD = True
-except ImportError:
-    HAS_CLOUD = False
-
-try:
-    from api.v1 import blockchain
-    HAS_BLOCKCHAIN = True
-except ImportError:
-    HAS_BLOCKCHAIN = False
-
-try:
-    from api.v1 import deep_learning
-    HAS_DEEP_LEARNING = True
-except ImportError:
-    HAS_DEEP_LEARNING = False
-
-try:
-    from api.v1 import gwas
-    HAS_GWAS = True
-except ImportError:
-    HAS_GWAS = False
-
 # 占位模块 (待实现)
 auth = None
 animals = None
@@ -108,14 +47,39 @@ from database import engine, Base
 # Logging Configuration
 # ============================================================================
 
+class _DeferredQueueHandler(QueueHandler):
+    """
+    日志入队处理器
+    
+    入队时只做 % 参数插值 (参数可能是随后被修改的可变对象)，
+    traceback 格式化保留 exc_info 交由监听线程完成
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler('logs/app.log', encoding='utf-8'),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+    handlers=[_DeferredQueueHandler(_log_queue)]
 )
+# 监听线程随进程存活，进程退出时排空队列 (先于 logging.shutdown 关闭处理器)；
+# 不在 lifespan 中停止，以免关闭之后的日志丢失、多次 lifespan 时重复 stop 出错
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
 logger = logging.getLogger(__name__)
 
@@ -157,6 +121,11 @@ async def lifespan(app: FastAPI):
     julia_service = JuliaService()
     await julia_service.initialize()
     
+    # IoT数据写入缓冲、设备心跳缓冲定时刷写
+    from services.iot_ingest import iot_ingest_buffer, heartbeat_buffer
+    iot_ingest_buffer.start()
+    heartbeat_buffer.start()
+    
     logger.info("系统启动完成!")
     logger.info("="*70)
     
@@ -164,6 +133,8 @@ async def lifespan(app: FastAPI):
     
     # 关闭
     logger.info("系统关闭中...")
+    await iot_ingest_buffer.stop()
+    await heartbeat_buffer.stop()
     await julia_service.shutdown()
     logger.info("系统已关闭")
 
@@ -261,94 +232,29 @@ app.include_router(
     tags=["育种值估计 Breeding Value Estimation"]
 )
 
-# 羊场管理API (新增)
-if HAS_FARMS:
-    app.include_router(
-        farms.router,
-        prefix="/api/v1/farms",
-        tags=["羊场管理 Farm Management"]
-    )
-
-# 健康管理API (新增)
-if HAS_HEALTH:
-    app.include_router(
-        health.router,
-        prefix="/api/v1/health",
-        tags=["健康管理 Health Management"]
-    )
-
-# 繁殖管理API (新增)
-if HAS_REPRODUCTION:
-    app.include_router(
-        reproduction.router,
-        prefix="/api/v1/reproduction",
-        tags=["繁殖管理 Reproduction Management"]
-    )
-
-# 生长发育API (新增)
-if HAS_GROWTH:
-    app.include_router(
-        growth.router,
-        prefix="/api/v1/growth",
-        tags=["生长发育 Growth Development"]
-    )
-
-# 物联网API (新增)
-if HAS_IOT:
-    app.include_router(
-        iot.router,
-        prefix="/api/v1/iot",
-        tags=["物联网 IoT Integration"]
-    )
-
-# 饲养管理API (新增)
-if HAS_FEEDING:
-    app.include_router(
-        feeding.router,
-        prefix="/api/v1/feeding",
-        tags=["饲养管理 Feeding Management"]
-    )
-
-# 报表分析API (新增)
-if HAS_REPORTS:
-    app.include_router(
-        reports.router,
-        prefix="/api/v1/reports",
-        tags=["报表分析 Reports & Analysis"]
-    )
-
-# 云服务API (新增)
-if HAS_CLOUD:
-    app.include_router(
-        cloud.router,
-        prefix="/api/v1/cloud",
-        tags=["云服务 Cloud Service"]
-    )
-
-# 区块链溯源API (新增)
-if HAS_BLOCKCHAIN:
-    app.include_router(
-        blockchain.router,
-        prefix="/api/v1/blockchain",
-        tags=["区块链溯源 Blockchain Traceability"]
-    )
-
-# 深度学习育种API (新增)
-if HAS_DEEP_LEARNING:
-    app.include_router(
-        deep_learning.router,
-        prefix="/api/v1/deep-learning",
-        tags=["深度学习育种 Deep Learning Breeding"]
-    )
-
-# GWAS分析API (新增)
-if HAS_GWAS:
-    app.include_router(
-        gwas.router,
-        prefix="/api/v1/gwas",
-        tags=["GWAS分析 GWAS Analysis"]
-    )
-
+# 可选业务模块路由 (模块名, 路由前缀, 标签)
+# 模块缺失时跳过注册并记录警告，支持按需部署
+OPTIONAL_ROUTERS = [
+    ("farms", "/api/v1/farms", "羊场管理 Farm Management"),
+    ("health", "/api/v1/health", "健康管理 Health Management"),
+    ("reproduction", "/api/v1/reproduction", "繁殖管理 Reproduction Management"),
+    ("growth", "/api/v1/growth", "生长发育 Growth Development"),
+    ("iot", "/api/v1/iot", "物联网 IoT Integration"),
+    ("feeding", "/api/v1/feeding", "饲养管理 Feeding Management"),
+    ("reports", "/api/v1/reports", "报表分析 Reports & Analysis"),
+    ("cloud", "/api/v1/cloud", "云服务 Cloud Service"),
+    ("blockchain", "/api/v1/blockchain", "区块链溯源 Blockchain Traceability"),
+    ("deep_learning", "/api/v1/deep-learning", "深度学习育种 Deep Learning Breeding"),
+    ("gwas", "/api/v1/gwas", "GWAS分析 GWAS Analysis"),
+]
+
+for module_name, prefix, tag in OPTIONAL_ROUTERS:
+    try:
+        module = importlib.import_module(f"api.v1.{module_name}")
+    except ImportError as e:
+        logger.warning(f"路由模块 api.v1.{module_name} 不可用，已跳过: {e}")
+        continue
+    app.include_router(module.router, prefix=prefix, tags=[tag])
 
 # ============================================================================
 
@@ -357,19 +263,42 @@ if HAS_GWAS:
 # Root Route and Health Check
 # ============================================================================
 
-@app.get("/", tags=["系统 System"])
+# 根路由与系统信息在进程生命周期内不变，启动时构建一次
+_ROOT_RESPONSE = {
+    "name": "新星肉羊育种系统 API",
+    "name_en": "NovaBreed Sheep System API",
+    "version": "1.0.0",
+    "status": "running",
+    "docs": "/docs",
+    "redoc": "/redoc"
+}
+
+_SYSTEM_INFO = {
+    "system": {
+        "platform": platform.system(),
+        "platform_version": platform.version(),
+        "python_version": sys.version,
+        "julia_version": settings.JULIA_VERSION
+    },
+    "application": {
+        "name": "新星肉羊育种系统",
+        "version": "1.0.0",
+        "environment": settings.ENVIRONMENT
+    },
+    "features": {
+        "gpu_enabled": settings.GPU_ENABLED,
+        "parallel_computing": True,
+        "multi_institution": True,
+        "languages": ["zh-CN", "en-US"]
+    }
+}
+
+@app.get("/", tags=["系统 System"], response_class=ORJSONResponse)
 async def root():
     """
     根路由 - 返回API基本信息
     """
-    return {
-        "name": "新星肉羊育种系统 API",
-        "name_en": "NovaBreed Sheep System API",
-        "version": "1.0.0",
-        "status": "running",
-        "docs": "/docs",
-        "redoc": "/redoc"
-    }
+    return _ROOT_RESPONSE
 
 @app.get("/health", tags=["系统 System"])
 async def health_check():
@@ -414,35 +343,14 @@ async def health_check():
     
     return health_status
 
-@app.get("/api/v1/info", tags=["系统 System"])
+@app.get("/api/v1/info", tags=["系统 System"], response_class=ORJSONResponse)
 async def system_info():
     """
     系统信息端点
     
     返回系统配置和运行信息
     """
-    import platform
-    import sys
-    
-    return {
-        "system": {
-            "platform": platform.system(),
-            "platform_version": platform.version(),
-            "python_version": sys.version,
-            "julia_version": settings.JULIA_VERSION
-        },
-        "application": {
-            "name": "新星肉羊育种系统",
-            "version": "1.0.0",
-            "environment": settings.ENVIRONMENT
-        },
-        "features": {
-            "gpu_enabled": settings.GPU_ENABLED,
-            "parallel_computing": True,
-            "multi_institution": True,
-            "languages": ["zh-CN", "en-US"]
-        }
-    }
+    return _SYSTEM_INFO
 
 # ============================================================================
 # 异常处理
@@ -464,8 +372,9 @@ async def http_exception_handler(request, exc):
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     """通用异常处理器"""
-    logger.error(f"未处理的异常: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    # 只传递异常三元组，traceback在日志监听线程中格式化
+    logger.error("未处理的异常: %s", exc, exc_info=(type(exc), exc, exc.__traceback__))
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
             "error": True,
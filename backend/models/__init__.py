@@ -9,7 +9,7 @@ from .animal import Animal, Pedigree
 from .health import Disease, HealthRecord, VaccineType, VaccinationRecord, DewormingRecord
 from .reproduction import EstrusRecord, BreedingRecord, PregnancyRecord, LambingRecord, WeaningRecord
 from .growth import GrowthRecord
-from .feed import FeedType, FeedFormula, FeedingPlan, FeedingRecord, FeedInventory
+from .feed import FeedType, FeedFormula, FeedFormulaIngredient, FeedingPlan, FeedingRecord, FeedInventory
 from .iot import IoTDevice, IoTData, AutoWeighingRecord
 from .blockchain import BlockchainRecord, AnimalCertificate
 from .cloud import SyncTask, ShareAgreement, ImportJob, ExportJob
@@ -29,7 +29,7 @@ __all__ = [
     # Growth
     'GrowthRecord',
     # Feed
-    'FeedType', 'FeedFormula', 'FeedingPlan', 'FeedingRecord', 'FeedInventory',
+    'FeedType', 'FeedFormula', 'FeedFormulaIngredient', 'FeedingPlan', 'FeedingRecord', 'FeedInventory',
     # IoT
     'IoTDevice', 'IoTData', 'AutoWeighingRecord',
     # Blockchain
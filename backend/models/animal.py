@@ -7,13 +7,28 @@
 # ============================================================================
 
 from sqlalchemy import (
-    Column, Integer, String, Boolean, DateTime, Date, 
-    Numeric, Text, ForeignKey, Index, CheckConstraint, UniqueConstraint
+    Column, Integer, BigInteger, String, Boolean, DateTime, Date, 
+    Numeric, REAL, Text, ForeignKey, Index, CheckConstraint, UniqueConstraint,
+    MetaData, Table, select, text
 )
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import relationship, object_session, Session
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, ARRAY
+from typing import List, Optional
 
-from .base import BaseModel
+from .base import BaseModel, attach_postgresql_ddl
+
+
+# 展平系谱的祖先槽位数: 4代 = 2 + 4 + 8 + 16
+PEDIGREE_FLAT_SLOTS = 30
+
+# 展平系谱物化视图 (独立MetaData，不参与 create_all 建表)
+# 槽位按堆序编号: 槽位k的父本为 2k+1、母本为 2k+2，个体本身为0
+animal_pedigree_flat = Table(
+    'animal_pedigree_flat', MetaData(),
+    Column('animal_id', Integer, primary_key=True),
+    Column('ancestor_ids', ARRAY(BigInteger)),
+)
 
 
 class Animal(BaseModel):
@@ -25,14 +40,16 @@ class Animal(BaseModel):
     
     __tablename__ = 'animals'
     __table_args__ = (
-        Index('ix_animals_organization_id', 'organization_id'),
         Index('ix_animals_animal_code', 'animal_code'),
-        Index('ix_animals_electronic_id', 'electronic_id'),
         Index('ix_animals_breed', 'breed'),
         Index('ix_animals_sex', 'sex'),
         Index('ix_animals_birth_date', 'birth_date'),
         Index('ix_animals_status', 'status'),
+        # 绝大多数列表查询只看在群且未删除的动物，部分索引体积小、常驻缓存
+        Index('ix_animals_status_active', 'organization_id', 'birth_date',
+              postgresql_where=text("status = 'active' AND is_deleted = false")),
         Index('ix_animals_search', 'search_vector', postgresql_using='gin'),
+        # 前导列 organization_id 兼作按机构过滤的索引
         UniqueConstraint('organization_id', 'animal_code', name='uq_animal_code_per_org'),
         CheckConstraint("sex IN ('male', 'female')", name='ck_animal_sex'),
         CheckConstraint("status IN ('active', 'sold', 'deceased', 'culled', 'transferred')", 
@@ -74,7 +91,8 @@ class Animal(BaseModel):
     generation = Column(Integer, comment='世代数')
     
     # 遗传信息
-    inbreeding_coefficient = Column(Numeric(8, 6), comment='近交系数')
+    # float4: 7位有效数字足够，定长4字节，可直接 np.frombuffer 为 float32 数组
+    inbreeding_coefficient = Column(REAL, comment='近交系数')
     has_genotype = Column(Boolean, default=False, comment='是否有基因型数据')
     genotype_file_id = Column(Integer, comment='基因型文件ID')
     
@@ -94,25 +112,60 @@ class Animal(BaseModel):
     # 备注
     notes = Column(Text, comment='备注')
     
-    # 全文搜索向量
+    # 全文搜索向量 (触发器 animals_tsv_update 维护)
     search_vector = Column(TSVECTOR, comment='搜索向量')
     
     # 扩展信息
     metadata_ = Column('metadata', JSONB, comment='扩展元数据')
     
     # 自引用关系
+    # raise_on_sql: 禁止隐式懒加载(列表遍历时的N+1)，调用方需显式 selectinload/joinedload
     sire = relationship('Animal', remote_side='Animal.id', foreign_keys=[sire_id], 
-                        backref='progeny_as_sire')
+                        back_populates='progeny_as_sire', lazy='raise_on_sql')
     dam = relationship('Animal', remote_side='Animal.id', foreign_keys=[dam_id], 
-                       backref='progeny_as_dam')
+                       back_populates='progeny_as_dam', lazy='raise_on_sql')
+    progeny_as_sire = relationship('Animal', foreign_keys=[sire_id], 
+                                   back_populates='sire', lazy='raise_on_sql')
+    progeny_as_dam = relationship('Animal', foreign_keys=[dam_id], 
+                                  back_populates='dam', lazy='raise_on_sql')
     
     # 关系
-    current_farm = relationship('Farm', foreign_keys=[current_farm_id])
-    current_barn = relationship('Barn', foreign_keys=[current_barn_id])
+    current_farm = relationship('Farm', foreign_keys=[current_farm_id], lazy='raise_on_sql')
+    current_barn = relationship('Barn', foreign_keys=[current_barn_id], lazy='raise_on_sql')
     
     def __repr__(self):
         return f"<Animal(id={self.id}, code='{self.animal_code}', breed='{self.breed}')>"
     
+    @hybrid_property
+    def ancestors(self) -> List[Optional[int]]:
+        """
+        4代祖先ID (定长30槽位，缺失为None)
+        
+        一次读取物化视图 animal_pedigree_flat，替代逐代递归查询
+        """
+        session = object_session(self)
+        if session is None or self.id is None:
+            return []
+        ancestor_ids = session.execute(
+            select(animal_pedigree_flat.c.ancestor_ids)
+            .where(animal_pedigree_flat.c.animal_id == self.id)
+        ).scalar()
+        return list(ancestor_ids or [])
+    
+    @ancestors.expression
+    def ancestors(cls):
+        return (
+            select(animal_pedigree_flat.c.ancestor_ids)
+            .where(animal_pedigree_flat.c.animal_id == cls.id)
+            .scalar_subquery()
+        )
+    
+    @staticmethod
+    def refresh_pedigree_flat(session: Session) -> None:
+        """刷新展平系谱物化视图 (不阻塞读)"""
+        session.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY animal_pedigree_flat"))
+        session.commit()
+    
     @property
     def age_days(self) -> int:
         """计算日龄"""
@@ -132,6 +185,54 @@ class Animal(BaseModel):
         return self.age_months >= 12
 
 
+# 展平系谱物化视图: 递归展开父母链，按槽位聚合为定长数组
+attach_postgresql_ddl(
+    Animal.__table__,
+    f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS animal_pedigree_flat AS
+    WITH RECURSIVE walk(animal_id, slot, ancestor_id) AS (
+        SELECT a.id, p.slot, p.parent_id
+        FROM animals a
+        CROSS JOIN LATERAL (VALUES (1, a.sire_id), (2, a.dam_id)) AS p(slot, parent_id)
+        WHERE p.parent_id IS NOT NULL
+      UNION ALL
+        SELECT w.animal_id, p.slot, p.parent_id
+        FROM walk w
+        JOIN animals a ON a.id = w.ancestor_id
+        CROSS JOIN LATERAL (VALUES (2 * w.slot + 1, a.sire_id), (2 * w.slot + 2, a.dam_id))
+            AS p(slot, parent_id)
+        WHERE 2 * w.slot + 2 <= {PEDIGREE_FLAT_SLOTS} AND p.parent_id IS NOT NULL
+    )
+    SELECT a.id AS animal_id,
+           array_agg(w.ancestor_id::BIGINT ORDER BY s.slot) AS ancestor_ids
+    FROM animals a
+    CROSS JOIN generate_series(1, {PEDIGREE_FLAT_SLOTS}) AS s(slot)
+    LEFT JOIN walk w ON w.animal_id = a.id AND w.slot = s.slot
+    GROUP BY a.id
+    WITH NO DATA;
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_animal_pedigree_flat_animal_id
+        ON animal_pedigree_flat (animal_id);
+    CREATE INDEX IF NOT EXISTS ix_animal_pedigree_flat_ancestors
+        ON animal_pedigree_flat USING gin (ancestor_ids);
+    REFRESH MATERIALIZED VIEW animal_pedigree_flat;
+    """,
+    "DROP MATERIALIZED VIEW IF EXISTS animal_pedigree_flat",
+)
+
+# 全文搜索向量由触发器维护: 仅标识列变化时重算，应用层无需写 search_vector
+attach_postgresql_ddl(
+    Animal.__table__,
+    """
+    CREATE TRIGGER animals_tsv_update
+        BEFORE INSERT OR UPDATE OF animal_code, name, ear_tag_left, ear_tag_right ON animals
+        FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(
+            search_vector, 'pg_catalog.simple', animal_code, name, ear_tag_left, ear_tag_right
+        )
+    """,
+    "DROP TRIGGER IF EXISTS animals_tsv_update ON animals",
+)
+
+
 class Pedigree(BaseModel):
     """
     系谱扩展模型
@@ -156,7 +257,7 @@ class Pedigree(BaseModel):
     path_code = Column(String(50), comment='路径编码')
     
     # 遗传贡献
-    genetic_contribution = Column(Numeric(8, 6), comment='遗传贡献率')
+    genetic_contribution = Column(REAL, comment='遗传贡献率')
     
     # 关系
     animal = relationship('Animal', foreign_keys=[animal_id])
@@ -6,13 +6,187 @@
 # 功能: SQLAlchemy模型基类和混入类
 # ============================================================================
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import (
+    Column, Integer, String, Boolean, DateTime, Text, DDL, Table, Enum,
+    event, inspect, insert, select, text, update
+)
 from sqlalchemy.sql import func
 from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm import ORMExecuteState, with_loader_criteria
 from datetime import datetime
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Type
+import enum
+import operator
 
-from database import Base
+from database import Base, SessionLocal
+
+
+def attach_postgresql_ddl(table: Table, create_sql: str, drop_sql: Optional[str] = None) -> None:
+    """
+    为表挂载仅在PostgreSQL上执行的DDL
+    
+    create_all 建表后执行 create_sql，drop_all 删表前执行 drop_sql；
+    SQLite等其他方言(测试环境)自动跳过。
+    """
+    event.listen(table, 'after_create', DDL(create_sql).execute_if(dialect='postgresql'))
+    if drop_sql:
+        event.listen(table, 'before_drop', DDL(drop_sql).execute_if(dialect='postgresql'))
+
+
+def attach_lz4_compression(table: Table, *columns: str) -> None:
+    """
+    大JSONB列的TOAST压缩改用LZ4 (PostgreSQL 14+)
+    
+    LZ4 压缩/解压均快于默认 pglz；分区表上设置后新建分区沿用
+    """
+    alters = ", ".join(f"ALTER COLUMN {column} SET COMPRESSION lz4" for column in columns)
+    attach_postgresql_ddl(table, f"ALTER TABLE {table.name} {alters}")
+
+
+def value_enum(enum_cls: Type[enum.Enum], name: str) -> Enum:
+    """
+    按枚举值(而非成员名)存储的枚举类型
+    
+    PostgreSQL上为原生ENUM (每值4字节)；存量小写字符串数据可直接 USING col::类型 转换
+    """
+    return Enum(enum_cls, name=name, values_callable=lambda e: [m.value for m in e])
+
+
+# 名称模糊搜索的三元组(gin_trgm_ops)索引依赖 pg_trgm 扩展，须先于建表安装
+event.listen(
+    Base.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+
+# ============================================================================
+# 月度范围分区
+# Monthly Range Partitions
+# ============================================================================
+
+# 按月幂等建分区: <表名>_YYYY_MM 覆盖当月至其后 p_months_ahead 个月
+# 默认分区中已有该月数据时 (分区预建前越界写入)，先摘下默认分区，建月分区后把该月数据迁入，
+# 再挂回默认分区；直接 CREATE ... PARTITION OF 会因默认分区含匹配行而失败
+event.listen(
+    Base.metadata, 'before_create',
+    DDL("""
+    CREATE OR REPLACE FUNCTION fn_ensure_monthly_partitions(p_table TEXT, p_months_ahead INTEGER DEFAULT 2)
+    RETURNS VOID AS $$
+    DECLARE
+        m DATE;
+        m_next DATE;
+        part_name TEXT;
+        default_name TEXT := p_table || '_default';
+        part_key TEXT;
+    BEGIN
+        SELECT a.attname INTO part_key
+        FROM pg_partitioned_table pt
+        JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+        WHERE pt.partrelid = p_table::regclass;
+
+        FOR m IN
+            SELECT generate_series(
+                date_trunc('month', CURRENT_DATE),
+                date_trunc('month', CURRENT_DATE) + make_interval(months => p_months_ahead),
+                INTERVAL '1 month'
+            )::DATE
+        LOOP
+            part_name := p_table || '_' || to_char(m, 'YYYY_MM');
+            m_next := (m + INTERVAL '1 month')::DATE;
+            CONTINUE WHEN to_regclass(part_name) IS NOT NULL;
+
+            IF to_regclass(default_name) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %%I PARTITION OF %%I FOR VALUES FROM (%%L) TO (%%L)',
+                    part_name, p_table, m, m_next
+                );
+                CONTINUE;
+            END IF;
+
+            EXECUTE format('ALTER TABLE %%I DETACH PARTITION %%I', p_table, default_name);
+            EXECUTE format(
+                'CREATE TABLE %%I PARTITION OF %%I FOR VALUES FROM (%%L) TO (%%L)',
+                part_name, p_table, m, m_next
+            );
+            EXECUTE format(
+                'INSERT INTO %%I SELECT * FROM %%I WHERE %%I >= %%L AND %%I < %%L',
+                part_name, default_name, part_key, m, part_key, m_next
+            );
+            EXECUTE format(
+                'DELETE FROM %%I WHERE %%I >= %%L AND %%I < %%L',
+                default_name, part_key, m, part_key, m_next
+            );
+            EXECUTE format('ALTER TABLE %%I ATTACH PARTITION %%I DEFAULT', p_table, default_name);
+        END LOOP;
+    END;
+    $$ LANGUAGE plpgsql
+    """).execute_if(dialect='postgresql')
+)
+event.listen(
+    Base.metadata, 'after_drop',
+    DDL('DROP FUNCTION IF EXISTS fn_ensure_monthly_partitions(TEXT, INTEGER)').execute_if(dialect='postgresql')
+)
+
+
+def attach_monthly_partitions(table: Table, months_ahead: int = 2) -> None:
+    """
+    为按月范围分区的表建默认分区和首批月度分区
+
+    默认分区兜底越界数据；后续月份由定时任务 tasks.ensure_partitions 预建。
+    """
+    attach_postgresql_ddl(
+        table,
+        f"""
+        CREATE TABLE IF NOT EXISTS {table.name}_default PARTITION OF {table.name} DEFAULT;
+        SELECT fn_ensure_monthly_partitions('{table.name}', {int(months_ahead)});
+        """
+    )
+
+
+def ensure_monthly_partitions(session: Any, table_name: str, months_ahead: int = 2) -> None:
+    """预建当月及之后若干月的分区 (默认分区中已落入的该月数据随之迁入)"""
+    session.execute(
+        text("SELECT fn_ensure_monthly_partitions(:table_name, :months_ahead)"),
+        {"table_name": table_name, "months_ahead": months_ahead}
+    )
+    session.commit()
+
+
+# ============================================================================
+# 物化视图刷新记录
+# Materialized View Refreshes
+# ============================================================================
+
+# 每个统计物化视图一行，记录最近一次刷新开始的时刻
+stats_view_refreshes = Table(
+    'stats_view_refreshes', Base.metadata,
+    Column('view_name', String(100), primary_key=True, comment='物化视图名'),
+    Column('refreshed_at', DateTime, nullable=False, comment='最近刷新开始时刻'),
+    comment='物化视图刷新记录'
+)
+
+
+def refresh_materialized_view(session: Any, view_name: str) -> None:
+    """
+    并发刷新物化视图 (不阻塞读) 并记录刷新时刻
+    
+    时刻取刷新开始前，统计查询以其日期为界: 此前的日期读视图，此后实时聚合
+    """
+    refreshed_at = datetime.now()
+    session.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name}"))
+    log = stats_view_refreshes
+    updated = session.execute(
+        update(log).where(log.c.view_name == view_name).values(refreshed_at=refreshed_at)
+    )
+    if not updated.rowcount:
+        session.execute(insert(log).values(view_name=view_name, refreshed_at=refreshed_at))
+    session.commit()
+
+
+def view_refreshed_at(session: Any, view_name: str) -> Optional[datetime]:
+    """物化视图最近刷新时刻，从未经定时任务刷新时为None (调用方应全部实时聚合)"""
+    log = stats_view_refreshes
+    return session.scalar(select(log.c.refreshed_at).where(log.c.view_name == view_name))
 
 
 class TimestampMixin:
@@ -77,6 +251,45 @@ class SoftDeleteMixin:
         self.deleted_by = None
 
 
+# ============================================================================
+# 软删除过滤
+# Soft-Delete Criteria
+# ============================================================================
+
+def _exclude_soft_deleted(orm_execute_state: ORMExecuteState) -> None:
+    """
+    ORM查询统一附加 is_deleted = false (含别名及语句中的显式联接)
+    
+    与 WHERE is_deleted = false 的部分索引谓词一致；需要读取已删除记录时
+    使用 execution_options(include_deleted=True)。
+    关系加载(joined/selectin/延迟加载)不附加条件: 字典表父行(饲料类型、疫苗类型、
+    配方)软删除后，引用它的库存/接种/计划记录仍须可见，且与 count() 一致。
+    刷新/主键加载、UPDATE 及 exists() 子查询不受影响，仍需显式条件。
+    """
+    if (
+        orm_execute_state.is_select
+        and not orm_execute_state.is_column_load
+        and not orm_execute_state.is_relationship_load
+        and not orm_execute_state.execution_options.get('include_deleted', False)
+    ):
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            with_loader_criteria(
+                SoftDeleteMixin, lambda cls: cls.is_deleted == False,
+                include_aliases=True, propagate_to_loaders=False
+            )
+        )
+
+
+def exclude_soft_deleted(session_factory: Any) -> Any:
+    """为会话工厂(sessionmaker)挂载软删除过滤，返回该工厂"""
+    event.listen(session_factory, 'do_orm_execute', _exclude_soft_deleted)
+    return session_factory
+
+
+# 应用会话统一过滤软删除记录 (仅 SessionLocal，不影响其他 Session)
+exclude_soft_deleted(SessionLocal)
+
+
 class AuditMixin:
     """
     审计混入类
@@ -109,8 +322,46 @@ class BaseModel(Base, TimestampMixin, SoftDeleteMixin, AuditMixin):
     id = Column(Integer, primary_key=True, autoincrement=True, comment="主键ID")
     
     def to_dict(self) -> dict:
-        """转换为字典"""
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        """转换为字典 (键为列名)"""
+        cls = type(self)
+        impl = cls.__dict__.get('_to_dict_impl')
+        if impl is None:
+            impl = cls._build_to_dict()
+        return impl(self)
+    
+    @classmethod
+    def _build_to_dict(cls) -> Callable[[Any], Dict[str, Any]]:
+        """
+        为模型类生成序列化函数并缓存
+        
+        首次调用时按映射列预计算列名和 attrgetter，之后每次序列化
+        一次取回全部属性，不再反射 __table__.columns
+        """
+        mapper = inspect(cls)
+        names = tuple(column.name for column in cls.__table__.columns)
+        keys = tuple(mapper.get_property_by_column(column).key for column in cls.__table__.columns)
+        getter = operator.attrgetter(*keys)
+        if len(keys) == 1:
+            # 单列时 attrgetter 返回标量而非元组
+            def impl(s: Any) -> Dict[str, Any]:
+                return {names[0]: getter(s)}
+        else:
+            def impl(s: Any) -> Dict[str, Any]:
+                return dict(zip(names, getter(s)))
+        cls._to_dict_fields = names
+        cls._to_dict_impl = impl
+        return impl
+    
+    @classmethod
+    def bulk_insert(cls, session: Any, rows: List[Dict[str, Any]]) -> None:
+        """
+        批量插入 (不提交)
+        
+        走 insertmanyvalues 合并为多行INSERT，适用于IoT/批量测定等大批量写入；
+        单条记录仍使用 session.add()
+        """
+        if rows:
+            session.execute(insert(cls), rows)
     
     def __repr__(self):
         return f"<{self.__class__.__name__}(id={self.id})>"
@@ -59,7 +59,7 @@ class AnimalCertificate(BaseModel, TimestampMixin):
     """
     __tablename__ = "animal_certificates"
 
-    certificate_id = Column(String(50), unique=True, index=True, nullable=False, comment="证书编号")
+    certificate_id = Column(String(50), unique=True, nullable=False, comment="证书编号")
     animal_id = Column(Integer, ForeignKey("animals.id"), index=True, nullable=False, comment="动物ID")
     certificate_type = Column(String(50), nullable=False, comment="证书类型")
     issue_date = Column(DateTime, nullable=False, comment="签发日期")
@@ -1,6 +1,6 @@
 from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Boolean, Text
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.sql import func
 
 from .base import BaseModel
 
@@ -8,13 +8,13 @@ class BreedingValueRun(BaseModel):
     """育种值评估运行记录"""
     __tablename__ = "breeding_value_runs"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     run_name = Column(String(200), nullable=False)
     trait_id = Column(Integer, nullable=False)
     method = Column(String(50), nullable=False)
     status = Column(String(20), default="pending") # pending, running, completed, failed
     
-    started_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     completed_at = Column(DateTime, nullable=True)
     computation_time_seconds = Column(Integer, nullable=True)
     
@@ -28,7 +28,7 @@ class BreedingValueResult(BaseModel):
     """育种值评估结果"""
     __tablename__ = "breeding_value_results"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     run_id = Column(Integer, ForeignKey("breeding_value_runs.id"), nullable=False, index=True)
     animal_id = Column(Integer, nullable=False, index=True)
     
@@ -8,10 +8,13 @@
 
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime, Date, 
-    Numeric, Text, ForeignKey, Index, CheckConstraint
+    Numeric, Float, Text, ForeignKey, Index, CheckConstraint, Computed, text, update, func
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, object_session, Session
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.dialects.postgresql import JSONB
+from datetime import datetime
+from typing import List
 
 from .base import BaseModel
 
@@ -26,8 +29,13 @@ class Farm(BaseModel):
     __tablename__ = 'farms'
     __table_args__ = (
         Index('ix_farms_organization_id', 'organization_id'),
-        Index('ix_farms_code', 'code'),
         Index('ix_farms_status', 'status'),
+        # pg_trgm 三元组索引: 名称 ILIKE '%关键字%' 模糊搜索
+        Index('ix_farms_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_farms_capacity_usage', 'capacity_usage'),
+        # jsonb_path_ops 仅支持 @> 但体积约为默认 jsonb_ops 的一半
+        Index('ix_farms_metadata_gin', 'metadata', postgresql_using='gin',
+              postgresql_ops={'metadata': 'jsonb_path_ops'}),
         CheckConstraint("farm_type IN ('breeding', 'commercial', 'mixed')", name='ck_farm_type'),
         CheckConstraint("status IN ('active', 'inactive', 'maintenance')", name='ck_farm_status'),
         {'comment': '羊场信息表'}
@@ -42,10 +50,16 @@ class Farm(BaseModel):
     # 容量信息
     capacity = Column(Integer, comment='设计存栏量')
     current_stock = Column(Integer, default=0, nullable=False, comment='当前存栏量')
+    # 存栏率生成列: 写入时由数据库计算，可索引/排序 (对应属性见 capacity_usage)
+    _capacity_usage = Column(
+        'capacity_usage', Numeric(7, 2),
+        Computed("CASE WHEN capacity > 0 THEN current_stock * 100.0 / capacity ELSE 0 END", persisted=True),
+        comment='存栏率(%)'
+    )
     
     # 面积和位置
     area_hectares = Column(Numeric(10, 2), comment='占地面积(公顷)')
-    address = Column(String(500), comment='详细地址')
+    address = Column(String(200), comment='详细地址')
     province = Column(String(100), comment='省份')
     city = Column(String(100), comment='城市')
     district = Column(String(100), comment='区县')
@@ -73,19 +87,30 @@ class Farm(BaseModel):
     metadata_ = Column('metadata', JSONB, comment='扩展元数据')
     
     # 关系
-    barns = relationship('Barn', back_populates='farm', lazy='dynamic')
-    animal_locations = relationship('AnimalLocation', back_populates='farm', lazy='dynamic')
+    # 羊舍数量有限: selectin 对一批羊场只追加一次 IN 查询
+    barns = relationship('Barn', back_populates='farm', lazy='selectin')
+    # 位置历史无上限，禁止整体加载；分页查询走 AnimalLocationService.get_by_farm
+    animal_locations = relationship('AnimalLocation', back_populates='farm', lazy='raise_on_sql')
     
     def __repr__(self):
         return f"<Farm(id={self.id}, code='{self.code}', name='{self.name}')>"
     
-    @property
+    @hybrid_property
     def capacity_usage(self) -> float:
-        """计算存栏率"""
+        """
+        存栏率
+        
+        实例上按当前字段计算 (未刷新/未持久化时也准确)，
+        查询中映射到生成列，如 order_by(Farm.capacity_usage.desc())
+        """
         if self.capacity and self.capacity > 0:
             return (self.current_stock / self.capacity) * 100
         return 0.0
     
+    @capacity_usage.expression
+    def capacity_usage(cls):
+        return cls._capacity_usage
+    
     def update_stock_count(self, delta: int) -> None:
         """更新存栏量"""
         self.current_stock = max(0, self.current_stock + delta)
@@ -100,8 +125,13 @@ class Barn(BaseModel):
     
     __tablename__ = 'barns'
     __table_args__ = (
-        Index('ix_barns_farm_id', 'farm_id'),
+        # 按羊场查有空位的羊舍: current_count < capacity 可直接在索引中判断
+        Index('ix_barns_farm_available', 'farm_id', 'status', 'current_count', 'capacity'),
         Index('ix_barns_code', 'code'),
+        Index('ix_barns_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_barns_capacity_usage', 'capacity_usage'),
+        Index('ix_barns_metadata_gin', 'metadata', postgresql_using='gin',
+              postgresql_ops={'metadata': 'jsonb_path_ops'}),
         CheckConstraint("barn_type IN ('ram', 'ewe', 'lamb', 'fattening', 'quarantine', 'other')", 
                        name='ck_barn_type'),
         CheckConstraint("status IN ('active', 'inactive', 'maintenance', 'cleaning')", 
@@ -118,6 +148,11 @@ class Barn(BaseModel):
     # 容量
     capacity = Column(Integer, nullable=False, comment='设计容量')
     current_count = Column(Integer, default=0, nullable=False, comment='当前数量')
+    _capacity_usage = Column(
+        'capacity_usage', Numeric(7, 2),
+        Computed("CASE WHEN capacity > 0 THEN current_count * 100.0 / capacity ELSE 0 END", persisted=True),
+        comment='使用率(%)'
+    )
     
     # 面积
     area_sqm = Column(Numeric(10, 2), comment='面积(平方米)')
@@ -133,10 +168,10 @@ class Barn(BaseModel):
     auto_watering = Column(Boolean, default=False, comment='是否自动饮水')
     
     # 环境参数目标
-    target_temp_min = Column(Numeric(5, 2), comment='目标最低温度')
-    target_temp_max = Column(Numeric(5, 2), comment='目标最高温度')
-    target_humidity_min = Column(Numeric(5, 2), comment='目标最低湿度')
-    target_humidity_max = Column(Numeric(5, 2), comment='目标最高湿度')
+    target_temp_min = Column(Float, comment='目标最低温度')
+    target_temp_max = Column(Float, comment='目标最高温度')
+    target_humidity_min = Column(Float, comment='目标最低湿度')
+    target_humidity_max = Column(Float, comment='目标最高湿度')
     
     # 状态
     status = Column(String(20), default='active', nullable=False, comment='状态')
@@ -148,18 +183,22 @@ class Barn(BaseModel):
     
     # 关系
     farm = relationship('Farm', back_populates='barns')
-    animal_locations = relationship('AnimalLocation', back_populates='barn', lazy='dynamic')
+    animal_locations = relationship('AnimalLocation', back_populates='barn', lazy='raise_on_sql')
     
     def __repr__(self):
         return f"<Barn(id={self.id}, code='{self.code}', name='{self.name}')>"
     
-    @property
+    @hybrid_property
     def capacity_usage(self) -> float:
-        """计算使用率"""
+        """使用率 (实例上实时计算，查询中映射到生成列)"""
         if self.capacity and self.capacity > 0:
             return (self.current_count / self.capacity) * 100
         return 0.0
     
+    @capacity_usage.expression
+    def capacity_usage(cls):
+        return cls._capacity_usage
+    
     @property
     def is_full(self) -> bool:
         """判断是否已满"""
@@ -182,7 +221,9 @@ class AnimalLocation(BaseModel):
         Index('ix_animal_locations_animal_id', 'animal_id'),
         Index('ix_animal_locations_barn_id', 'barn_id'),
         Index('ix_animal_locations_entry_date', 'entry_date'),
-        Index('ix_animal_locations_current', 'animal_id', 'exit_date'),  # 查找当前位置
+        # 查找当前位置: 只索引未离开的记录，历史记录不进索引
+        Index('ix_animal_locations_current', 'animal_id',
+              postgresql_where=text('exit_date IS NULL')),
         {'comment': '动物位置记录表'}
     )
     
@@ -219,7 +260,40 @@ class AnimalLocation(BaseModel):
         return self.exit_date is None
     
     def close(self, exit_reason: str = None) -> None:
-        """关闭位置记录"""
-        from datetime import datetime
-        self.exit_date = datetime.now()
-        self.exit_reason = exit_reason
+        """
+        关闭位置记录
+        
+        已持久化的记录直接发出单条UPDATE (出舍时间取数据库时间)，
+        未持久化的记录仅设置属性 (取本地当前时间，flush前即可读取)，随flush写入
+        """
+        session = object_session(self)
+        if session is None or self.id is None:
+            self.exit_date = datetime.now()
+            self.exit_reason = exit_reason
+            return
+        
+        session.execute(
+            update(AnimalLocation)
+            .where(AnimalLocation.id == self.id)
+            .values(exit_date=func.now(), exit_reason=exit_reason)
+            .execution_options(synchronize_session=False)
+        )
+        session.expire(self, ['exit_date', 'exit_reason'])
+    
+    @classmethod
+    def bulk_close(cls, session: Session, ids: List[int], exit_reason: str = None) -> int:
+        """
+        批量关闭位置记录 (如整栏转群)，一条UPDATE完成
+        
+        Returns:
+            实际关闭的记录数 (已关闭的记录不受影响)
+        """
+        if not ids:
+            return 0
+        result = session.execute(
+            update(cls)
+            .where(cls.id.in_(ids), cls.exit_date.is_(None))
+            .values(exit_date=func.now(), exit_reason=exit_reason)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
@@ -8,12 +8,25 @@
 
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime, Date, 
-    Numeric, Text, ForeignKey, Index, CheckConstraint
+    Numeric, Text, ForeignKey, Index, CheckConstraint, UniqueConstraint, FetchedValue,
+    BigInteger, MetaData, Table, text
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, object_session, Session
 from sqlalchemy.dialects.postgresql import JSONB
 
-from .base import BaseModel
+from .base import (
+    BaseModel, attach_postgresql_ddl, attach_monthly_partitions, ensure_monthly_partitions,
+    refresh_materialized_view
+)
+
+
+# 饲喂日汇总物化视图 (独立MetaData，不参与 create_all 建表)
+feeding_stats_daily = Table(
+    'feeding_stats_daily', MetaData(),
+    Column('feeding_date', Date, primary_key=True),
+    Column('record_count', BigInteger),
+    Column('total_amount', Numeric),
+)
 
 
 class FeedType(BaseModel):
@@ -21,8 +34,8 @@ class FeedType(BaseModel):
     
     __tablename__ = 'feed_types'
     __table_args__ = (
-        Index('ix_feed_types_code', 'feed_code', unique=True),
         Index('ix_feed_types_category', 'category'),
+        Index('ix_feed_types_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
         {'comment': '饲料类型表'}
     )
     
@@ -51,6 +64,10 @@ class FeedType(BaseModel):
     # 状态
     is_active = Column(Boolean, default=True, comment='是否启用')
     
+    # 关系
+    inventories = relationship('FeedInventory', back_populates='feed_type')
+    formula_ingredients = relationship('FeedFormulaIngredient', back_populates='feed_type')
+    
     def __repr__(self):
         return f"<FeedType(code='{self.feed_code}', name='{self.name}')>"
 
@@ -62,6 +79,9 @@ class FeedFormula(BaseModel):
     __table_args__ = (
         Index('ix_feed_formulas_organization_id', 'organization_id'),
         Index('ix_feed_formulas_target_animal_type', 'target_animal_type'),
+        # 支持 "含某饲料的配方" 包含查询: ingredients @> '[{"feed_type_id": n}]'
+        Index('ix_feed_formulas_ingredients_gin', 'ingredients', postgresql_using='gin',
+              postgresql_ops={'ingredients': 'jsonb_path_ops'}),
         {'comment': '饲料配方表'}
     )
     
@@ -79,7 +99,7 @@ class FeedFormula(BaseModel):
     target_age_min = Column(Integer, comment='适用最小日龄')
     target_age_max = Column(Integer, comment='适用最大日龄')
     
-    # 配方成分 (JSONB)
+    # 配方成分 (JSONB, 已弃用: 以 ingredients_rel / feed_formula_ingredients 表为准，保留一个版本)
     ingredients = Column(JSONB, nullable=False, comment='配方成分')
     """
     ingredients 结构:
@@ -88,25 +108,149 @@ class FeedFormula(BaseModel):
         {"feed_type_id": 2, "percentage": 30, ...}
     ]
     """
-    
-    # 营养指标
-    total_crude_protein = Column(Numeric(5, 2), comment='总粗蛋白(%)')
-    total_metabolizable_energy = Column(Numeric(6, 2), comment='总代谢能(MJ/kg)')
+    ingredients_rel = relationship('FeedFormulaIngredient', back_populates='formula',
+                                   lazy='selectin', cascade='all, delete-orphan')
+    feeding_plans = relationship('FeedingPlan', back_populates='formula')
+    
+    # 营养指标与成本: 由数据库触发器按成分表和饲料单价维护 (fn_formula_recalc)，应用层只读
+    total_crude_protein = Column(Numeric(5, 2), server_default=FetchedValue(), 
+                                 server_onupdate=FetchedValue(), comment='总粗蛋白(%)')
+    total_metabolizable_energy = Column(Numeric(6, 2), server_default=FetchedValue(), 
+                                        server_onupdate=FetchedValue(), comment='总代谢能(MJ/kg)')
+    cost_per_kg = Column(Numeric(10, 2), server_default=FetchedValue(), 
+                         server_onupdate=FetchedValue(), comment='每公斤成本(元)')
     
     # 饲喂量
     daily_amount_kg = Column(Numeric(6, 2), comment='日饲喂量(kg)')
     
-    # 成本
-    cost_per_kg = Column(Numeric(10, 2), comment='每公斤成本(元)')
-    
     # 状态
     is_active = Column(Boolean, default=True, comment='是否启用')
     version = Column(Integer, default=1, comment='版本号')
     
+    def recalc(self) -> None:
+        """立即按当前成分与饲料单价重算缓存指标 (通常由触发器自动完成)"""
+        session = object_session(self)
+        session.flush()
+        session.execute(text("SELECT fn_formula_recalc(:formula_id)"), {"formula_id": self.id})
+        session.expire(self, ['cost_per_kg', 'total_crude_protein', 'total_metabolizable_energy'])
+    
     def __repr__(self):
         return f"<FeedFormula(id={self.id}, name='{self.name}')>"
 
 
+class FeedFormulaIngredient(BaseModel):
+    """配方成分模型 (配方-饲料关联表)"""
+    
+    __tablename__ = 'feed_formula_ingredients'
+    __table_args__ = (
+        UniqueConstraint('formula_id', 'feed_type_id', name='uq_formula_ingredient'),
+        Index('ix_feed_formula_ingredients_feed_type_id', 'feed_type_id'),
+        {'comment': '配方成分表'}
+    )
+    
+    formula_id = Column(Integer, ForeignKey('feed_formulas.id', ondelete='CASCADE'), 
+                        nullable=False, comment='配方ID')
+    feed_type_id = Column(Integer, ForeignKey('feed_types.id'), nullable=False, comment='饲料类型ID')
+    
+    percentage = Column(Numeric(5, 2), nullable=False, comment='配比(%)')
+    min_amount = Column(Numeric(6, 2), comment='最小用量(kg)')
+    max_amount = Column(Numeric(6, 2), comment='最大用量(kg)')
+    
+    # 关系
+    formula = relationship('FeedFormula', back_populates='ingredients_rel')
+    feed_type = relationship('FeedType', back_populates='formula_ingredients', 
+                             lazy='joined', innerjoin=True)
+    
+    def __repr__(self):
+        return f"<FeedFormulaIngredient(formula={self.formula_id}, feed_type={self.feed_type_id})>"
+
+
+# 建表时从旧 ingredients JSONB 回填
+attach_postgresql_ddl(
+    FeedFormulaIngredient.__table__,
+    """
+    INSERT INTO feed_formula_ingredients
+        (formula_id, feed_type_id, percentage, min_amount, max_amount, is_deleted)
+    SELECT f.id,
+           (e ->> 'feed_type_id')::INTEGER,
+           COALESCE((e ->> 'percentage')::NUMERIC, 0),
+           (e ->> 'min_amount')::NUMERIC,
+           (e ->> 'max_amount')::NUMERIC,
+           false
+    FROM feed_formulas f
+    CROSS JOIN LATERAL jsonb_array_elements(f.ingredients) AS e
+    WHERE jsonb_typeof(f.ingredients) = 'array' AND e ? 'feed_type_id'
+    ON CONFLICT (formula_id, feed_type_id) DO NOTHING
+    """,
+)
+
+# 配方缓存指标: 成分增删改、饲料单价/营养值变化时由触发器重算，读路径直接取列
+attach_postgresql_ddl(
+    FeedFormulaIngredient.__table__,
+    """
+    CREATE OR REPLACE FUNCTION fn_formula_recalc(p_formula_id INTEGER) RETURNS VOID AS $$
+        UPDATE feed_formulas f
+        SET cost_per_kg = s.cost_per_kg,
+            total_crude_protein = s.crude_protein,
+            total_metabolizable_energy = s.metabolizable_energy
+        FROM (
+            SELECT SUM(i.percentage * t.unit_price) / 100 AS cost_per_kg,
+                   SUM(i.percentage * t.crude_protein) / 100 AS crude_protein,
+                   SUM(i.percentage * t.metabolizable_energy) / 100 AS metabolizable_energy
+            FROM feed_formula_ingredients i
+            JOIN feed_types t ON t.id = i.feed_type_id
+            WHERE i.formula_id = p_formula_id AND i.is_deleted = false
+        ) s
+        WHERE f.id = p_formula_id;
+    $$ LANGUAGE sql;
+
+    CREATE OR REPLACE FUNCTION fn_formula_ingredients_recalc() RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP <> 'DELETE' THEN
+            PERFORM fn_formula_recalc(NEW.formula_id);
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            PERFORM fn_formula_recalc(OLD.formula_id);
+        ELSIF TG_OP = 'UPDATE' AND OLD.formula_id <> NEW.formula_id THEN
+            PERFORM fn_formula_recalc(OLD.formula_id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER feed_formula_ingredients_recalc
+        AFTER INSERT OR UPDATE OR DELETE ON feed_formula_ingredients
+        FOR EACH ROW EXECUTE FUNCTION fn_formula_ingredients_recalc();
+
+    CREATE OR REPLACE FUNCTION fn_feed_type_formulas_recalc() RETURNS TRIGGER AS $$
+    BEGIN
+        PERFORM fn_formula_recalc(i.formula_id)
+        FROM feed_formula_ingredients i
+        WHERE i.feed_type_id = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER feed_types_formulas_recalc
+        AFTER UPDATE OF unit_price, crude_protein, metabolizable_energy ON feed_types
+        FOR EACH ROW
+        WHEN (OLD.unit_price IS DISTINCT FROM NEW.unit_price
+              OR OLD.crude_protein IS DISTINCT FROM NEW.crude_protein
+              OR OLD.metabolizable_energy IS DISTINCT FROM NEW.metabolizable_energy)
+        EXECUTE FUNCTION fn_feed_type_formulas_recalc();
+
+    SELECT fn_formula_recalc(id) FROM feed_formulas;
+    """,
+    """
+    DROP TRIGGER IF EXISTS feed_types_formulas_recalc ON feed_types;
+    DROP FUNCTION IF EXISTS fn_feed_type_formulas_recalc();
+    DROP TRIGGER IF EXISTS feed_formula_ingredients_recalc ON feed_formula_ingredients;
+    DROP FUNCTION IF EXISTS fn_formula_ingredients_recalc();
+    DROP FUNCTION IF EXISTS fn_formula_recalc(INTEGER);
+    """,
+)
+
+
 class FeedingPlan(BaseModel):
     """饲喂计划模型"""
     
@@ -114,6 +258,8 @@ class FeedingPlan(BaseModel):
     __table_args__ = (
         Index('ix_feeding_plans_barn_id', 'barn_id'),
         Index('ix_feeding_plans_formula_id', 'formula_id'),
+        Index('ix_feeding_plans_feeding_times_gin', 'feeding_times', postgresql_using='gin',
+              postgresql_ops={'feeding_times': 'jsonb_path_ops'}),
         {'comment': '饲喂计划表'}
     )
     
@@ -137,25 +283,38 @@ class FeedingPlan(BaseModel):
     # 状态
     status = Column(String(20), default='active', comment='状态: draft/active/completed/cancelled')
     
-    # 关系
-    formula = relationship('FeedFormula')
+    # 关系 (计划总与配方一起展示: 随主查询 JOIN 加载)
+    formula = relationship('FeedFormula', back_populates='feeding_plans', 
+                           lazy='joined', innerjoin=True)
 
 
 class FeedingRecord(BaseModel):
-    """饲喂记录模型"""
+    """
+    饲喂记录模型
+    
+    PostgreSQL上按 feeding_date 月度范围分区 (feeding_records_YYYY_MM + 默认分区)，
+    按日期过滤的查询只扫描命中的分区，归档旧数据用 DETACH PARTITION。
+    """
     
     __tablename__ = 'feeding_records'
     __table_args__ = (
+        # 外键列普通索引: 下方复合索引为部分索引，不覆盖已删除行
         Index('ix_feeding_records_barn_id', 'barn_id'),
-        Index('ix_feeding_records_feeding_date', 'feeding_date'),
-        {'comment': '饲喂记录表'}
+        # 羊舍最近饲喂记录: 按索引顺序取前N条免排序; 部分索引只含未删除行
+        Index('ix_feeding_records_barn_date_live', 'barn_id', text('feeding_date DESC'), text('feeding_time DESC'),
+              postgresql_where=text('is_deleted = false')),
+        # 日期随写入单调递增: BRIN 仅存块范围摘要，体积远小于btree
+        Index('ix_feeding_records_feeding_date_brin', 'feeding_date', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
+        {'comment': '饲喂记录表', 'postgresql_partition_by': 'RANGE (feeding_date)'}
     )
     
     plan_id = Column(Integer, ForeignKey('feeding_plans.id'), comment='计划ID')
     barn_id = Column(Integer, ForeignKey('barns.id'), nullable=False, comment='羊舍ID')
     formula_id = Column(Integer, ForeignKey('feed_formulas.id'), comment='配方ID')
     
-    feeding_date = Column(Date, nullable=False, comment='饲喂日期')
+    # 分区表的主键须包含分区键: (id, feeding_date)
+    feeding_date = Column(Date, primary_key=True, nullable=False, comment='饲喂日期')
     feeding_time = Column(DateTime(timezone=True), nullable=False, comment='饲喂时间')
     feeding_number = Column(Integer, comment='当天第几次饲喂')
     
@@ -171,6 +330,39 @@ class FeedingRecord(BaseModel):
     # 人员
     feeder = Column(String(100), comment='饲喂员')
     notes = Column(Text, comment='备注')
+    
+    @staticmethod
+    def ensure_partitions(session: Session, months_ahead: int = 2) -> None:
+        """预建当月及之后若干月的分区 (须早于数据落入默认分区)"""
+        ensure_monthly_partitions(session, FeedingRecord.__tablename__, months_ahead)
+    
+    @staticmethod
+    def refresh_stats_view(session: Session) -> None:
+        """刷新饲喂日汇总物化视图 (不阻塞读)，记录刷新时刻"""
+        refresh_materialized_view(session, 'feeding_stats_daily')
+
+
+# 月度分区: 默认分区兜底越界日期，后续月份由定时任务 tasks.ensure_partitions 预建
+attach_monthly_partitions(FeedingRecord.__table__)
+
+# 饲喂日汇总: 统计看板读历史日期的汇总行，当日数据仍查分区表
+attach_postgresql_ddl(
+    FeedingRecord.__table__,
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS feeding_stats_daily AS
+    SELECT feeding_date,
+           COUNT(*) AS record_count,
+           SUM(actual_amount) AS total_amount
+    FROM feeding_records
+    WHERE is_deleted = false
+    GROUP BY feeding_date
+    WITH NO DATA;
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_feeding_stats_daily_date
+        ON feeding_stats_daily (feeding_date);
+    REFRESH MATERIALIZED VIEW feeding_stats_daily;
+    """,
+    "DROP MATERIALIZED VIEW IF EXISTS feeding_stats_daily",
+)
 
 
 class FeedInventory(BaseModel):
@@ -180,6 +372,9 @@ class FeedInventory(BaseModel):
     __table_args__ = (
         Index('ix_feed_inventory_farm_id', 'farm_id'),
         Index('ix_feed_inventory_feed_type_id', 'feed_type_id'),
+        # 低库存预警 (current_quantity <= min_quantity 为列间比较，普通索引无法使用): 只索引命中行
+        Index('ix_feed_inventory_low_stock', 'farm_id',
+              postgresql_where=text('current_quantity <= min_quantity AND is_deleted = false')),
         {'comment': '饲料库存表'}
     )
     
@@ -202,7 +397,8 @@ class FeedInventory(BaseModel):
     last_purchase_price = Column(Numeric(10, 2), comment='最近入库单价')
     
     # 关系
-    feed_type = relationship('FeedType')
+    feed_type = relationship('FeedType', back_populates='inventories', 
+                             lazy='joined', innerjoin=True)
     
     @property
     def is_low_stock(self) -> bool:
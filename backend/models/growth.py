@@ -8,12 +8,28 @@
 
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime, Date, 
-    Numeric, Text, ForeignKey, Index
+    Float, Text, ForeignKey, Index, BigInteger, MetaData, Table, text
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, Session
 from sqlalchemy.dialects.postgresql import JSONB
 
-from .base import BaseModel
+from .base import BaseModel, attach_postgresql_ddl, refresh_materialized_view
+
+
+# 生长测定月汇总物化视图 (独立MetaData，不参与 create_all 建表)
+# 存和与计数而非均值，历史月份与当月实时数据可直接合并
+growth_stats_monthly = Table(
+    'growth_stats_monthly', MetaData(),
+    Column('month', Date, primary_key=True),
+    Column('measurement_type', String(50), primary_key=True),
+    Column('record_count', BigInteger),
+    Column('weight_sum', Float),
+    Column('weight_count', BigInteger),
+    Column('adg_sum', Float),
+    Column('adg_count', BigInteger),
+    Column('bcs_sum', Float),
+    Column('bcs_count', BigInteger),
+)
 
 
 class GrowthRecord(BaseModel):
@@ -25,10 +41,20 @@ class GrowthRecord(BaseModel):
     
     __tablename__ = 'growth_records'
     __table_args__ = (
+        # 外键列普通索引: 下方复合索引为部分索引，含已删除行的查询 (include_deleted、删除动物时的外键检查) 仍需此索引
         Index('ix_growth_records_animal_id', 'animal_id'),
-        Index('ix_growth_records_measurement_date', 'measurement_date'),
+        # 日期随写入单调递增: BRIN 仅存块范围摘要，体积远小于btree
+        Index('ix_growth_records_measurement_date_brin', 'measurement_date', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
         Index('ix_growth_records_measurement_type', 'measurement_type'),
-        Index('ix_growth_records_animal_date', 'animal_id', 'measurement_date'),
+        # 覆盖索引: "某动物最近N次体重" 走 index-only scan，无需回表
+        # id 作同日多次测定的次序，支撑 (measurement_date, id) 键集分页
+        # 读查询均带 is_deleted = false (会话级软删除过滤)，部分索引不含已删除行、谓词免过滤
+        Index('ix_growth_records_animal_date', 'animal_id', text('measurement_date DESC'), text('id DESC'),
+              postgresql_include=['body_weight', 'body_condition_score'],
+              postgresql_where=text('is_deleted = false')),
+        Index('ix_growth_records_raw_data_gin', 'raw_data', postgresql_using='gin',
+              postgresql_ops={'raw_data': 'jsonb_path_ops'}),
         {'comment': '生长测定记录表'}
     )
     
@@ -42,26 +68,26 @@ class GrowthRecord(BaseModel):
     age_days = Column(Integer, comment='测量时日龄')
     
     # 体重
-    body_weight = Column(Numeric(8, 2), nullable=False, comment='体重(kg)')
+    body_weight = Column(Float, nullable=False, comment='体重(kg)')
     weight_source = Column(String(20), comment='来源: manual/auto_scale')
     device_id = Column(Integer, comment='称重设备ID')
     
     # 体尺测量
-    body_length = Column(Numeric(6, 2), comment='体长(cm)')
-    body_height = Column(Numeric(6, 2), comment='体高(cm)')
-    chest_girth = Column(Numeric(6, 2), comment='胸围(cm)')
-    chest_width = Column(Numeric(6, 2), comment='胸宽(cm)')
-    chest_depth = Column(Numeric(6, 2), comment='胸深(cm)')
-    hip_width = Column(Numeric(6, 2), comment='臀宽(cm)')
-    cannon_circumference = Column(Numeric(6, 2), comment='管围(cm)')
+    body_length = Column(Float, comment='体长(cm)')
+    body_height = Column(Float, comment='体高(cm)')
+    chest_girth = Column(Float, comment='胸围(cm)')
+    chest_width = Column(Float, comment='胸宽(cm)')
+    chest_depth = Column(Float, comment='胸深(cm)')
+    hip_width = Column(Float, comment='臀宽(cm)')
+    cannon_circumference = Column(Float, comment='管围(cm)')
     
     # 体况评分
-    body_condition_score = Column(Numeric(3, 1), comment='体况评分(1-5)')
+    body_condition_score = Column(Float, comment='体况评分(1-5)')
     muscle_score = Column(Integer, comment='肌肉评分')
     fat_score = Column(Integer, comment='脂肪评分')
     
     # 计算指标
-    average_daily_gain = Column(Numeric(6, 3), comment='日增重(kg/d)')
+    average_daily_gain = Column(Float, comment='日增重(kg/d)')
     days_since_last_measurement = Column(Integer, comment='距上次测量天数')
     
     # 人员和设备
@@ -82,3 +108,34 @@ class GrowthRecord(BaseModel):
         if days > 0:
             return (weight_after - weight_before) / days
         return 0.0
+    
+    @staticmethod
+    def refresh_stats_view(session: Session) -> None:
+        """刷新生长测定月汇总物化视图 (不阻塞读)，记录刷新时刻"""
+        refresh_materialized_view(session, 'growth_stats_monthly')
+
+
+# 生长测定月汇总: 统计看板读历史月份的汇总行，当月数据仍查明细表
+attach_postgresql_ddl(
+    GrowthRecord.__table__,
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS growth_stats_monthly AS
+    SELECT date_trunc('month', measurement_date)::DATE AS month,
+           measurement_type,
+           COUNT(*) AS record_count,
+           SUM(body_weight) AS weight_sum,
+           COUNT(body_weight) AS weight_count,
+           SUM(average_daily_gain) AS adg_sum,
+           COUNT(average_daily_gain) AS adg_count,
+           SUM(body_condition_score) AS bcs_sum,
+           COUNT(body_condition_score) AS bcs_count
+    FROM growth_records
+    WHERE is_deleted = false
+    GROUP BY 1, 2
+    WITH NO DATA;
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_growth_stats_monthly_month_type
+        ON growth_stats_monthly (month, measurement_type);
+    REFRESH MATERIALIZED VIEW growth_stats_monthly;
+    """,
+    "DROP MATERIALIZED VIEW IF EXISTS growth_stats_monthly",
+)
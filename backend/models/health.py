@@ -8,12 +8,12 @@
 
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime, Date, 
-    Numeric, Text, ForeignKey, Index, CheckConstraint
+    Numeric, Float, Text, ForeignKey, Index, CheckConstraint
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB, ARRAY
 
-from .base import BaseModel
+from .base import BaseModel, attach_postgresql_ddl
 
 
 class Disease(BaseModel):
@@ -23,8 +23,10 @@ class Disease(BaseModel):
     
     __tablename__ = 'diseases'
     __table_args__ = (
-        Index('ix_diseases_code', 'disease_code', unique=True),
         Index('ix_diseases_category', 'category'),
+        Index('ix_diseases_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_diseases_metadata_gin', 'metadata', postgresql_using='gin',
+              postgresql_ops={'metadata': 'jsonb_path_ops'}),
         {'comment': '疾病字典表'}
     )
     
@@ -43,6 +45,9 @@ class Disease(BaseModel):
     
     metadata_ = Column('metadata', JSONB, comment='扩展元数据')
     
+    # 关系 (病例历史无上限，禁止整体懒加载)
+    health_records = relationship('HealthRecord', back_populates='disease', lazy='raise_on_sql')
+    
     def __repr__(self):
         return f"<Disease(code='{self.disease_code}', name='{self.name}')>"
 
@@ -55,7 +60,9 @@ class HealthRecord(BaseModel):
     __tablename__ = 'health_records'
     __table_args__ = (
         Index('ix_health_records_animal_id', 'animal_id'),
-        Index('ix_health_records_check_date', 'check_date'),
+        # 日期随写入单调递增: BRIN 仅存块范围摘要，体积远小于btree
+        Index('ix_health_records_check_date_brin', 'check_date', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
         Index('ix_health_records_check_type', 'check_type'),
         Index('ix_health_records_disease_id', 'disease_id'),
         {'comment': '健康检查记录表'}
@@ -70,20 +77,20 @@ class HealthRecord(BaseModel):
     check_type = Column(String(50), nullable=False, comment='检查类型: routine/diagnosis/follow_up')
     
     # 体征数据
-    body_temperature = Column(Numeric(4, 1), comment='体温(℃)')
+    body_temperature = Column(Float, comment='体温(℃)')
     heart_rate = Column(Integer, comment='心率(次/分)')
     respiratory_rate = Column(Integer, comment='呼吸率(次/分)')
-    body_weight = Column(Numeric(8, 2), comment='体重(kg)')
+    body_weight = Column(Float, comment='体重(kg)')
     body_condition_score = Column(Integer, comment='体况评分(1-5)')
     
     # 症状和诊断
     symptoms = Column(Text, comment='症状描述')
-    diagnosis = Column(String(500), comment='诊断结果')
+    diagnosis = Column(Text, comment='诊断结果')
     severity = Column(String(20), comment='严重程度: mild/moderate/severe')
     
     # 治疗
     treatment = Column(Text, comment='治疗方案')
-    medications = Column(JSONB, comment='用药记录')
+    medications = Column(JSONB, comment='用药记录')  # {"drugs": [{"name": ..., "dose": ...}], ...}
     treatment_cost = Column(Numeric(10, 2), comment='治疗费用')
     
     # 后续
@@ -99,13 +106,21 @@ class HealthRecord(BaseModel):
     notes = Column(Text, comment='备注')
     attachments = Column(JSONB, comment='附件(图片等)')
     
-    # 关系
-    disease = relationship('Disease')
+    # 关系 (字典表小行: 随主查询 JOIN 加载，避免逐行查询)
+    disease = relationship('Disease', back_populates='health_records', lazy='joined')
     
     def __repr__(self):
         return f"<HealthRecord(id={self.id}, animal_id={self.animal_id}, date={self.check_date})>"
 
 
+# 只索引被查询的 drugs 子路径，比整列GIN小得多 (表达式索引，SQLite测试库跳过)
+attach_postgresql_ddl(
+    HealthRecord.__table__,
+    "CREATE INDEX IF NOT EXISTS ix_health_records_medications_drugs_gin "
+    "ON health_records USING gin ((medications -> 'drugs') jsonb_path_ops)",
+)
+
+
 class VaccineType(BaseModel):
     """
     疫苗类型模型
@@ -113,7 +128,8 @@ class VaccineType(BaseModel):
     
     __tablename__ = 'vaccine_types'
     __table_args__ = (
-        Index('ix_vaccine_types_code', 'vaccine_code', unique=True),
+        # 数组GIN索引: "哪些疫苗针对疾病X" 以 target_diseases @> ARRAY[...] 命中
+        Index('ix_vaccine_types_target_diseases_gin', 'target_diseases', postgresql_using='gin'),
         {'comment': '疫苗类型表'}
     )
     
@@ -129,8 +145,8 @@ class VaccineType(BaseModel):
     booster_required = Column(Boolean, default=False, comment='是否需要加强针')
     booster_interval_days = Column(Integer, comment='加强针间隔(天)')
     
-    storage_temp_min = Column(Numeric(5, 2), comment='存储最低温度')
-    storage_temp_max = Column(Numeric(5, 2), comment='存储最高温度')
+    storage_temp_min = Column(Float, comment='存储最低温度')
+    storage_temp_max = Column(Float, comment='存储最高温度')
     shelf_life_months = Column(Integer, comment='保质期(月)')
     
     contraindications = Column(Text, comment='禁忌症')
@@ -138,6 +154,10 @@ class VaccineType(BaseModel):
     
     is_mandatory = Column(Boolean, default=False, comment='是否强制接种')
     
+    # 关系 (接种历史无上限，禁止整体懒加载)
+    vaccination_records = relationship('VaccinationRecord', back_populates='vaccine_type', 
+                                       lazy='raise_on_sql')
+    
     def __repr__(self):
         return f"<VaccineType(code='{self.vaccine_code}', name='{self.name}')>"
 
@@ -151,7 +171,8 @@ class VaccinationRecord(BaseModel):
     __table_args__ = (
         Index('ix_vaccination_records_animal_id', 'animal_id'),
         Index('ix_vaccination_records_vaccine_type_id', 'vaccine_type_id'),
-        Index('ix_vaccination_records_vaccination_date', 'vaccination_date'),
+        Index('ix_vaccination_records_vaccination_date_brin', 'vaccination_date', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
         Index('ix_vaccination_records_next_date', 'next_vaccination_date'),
         {'comment': '疫苗接种记录表'}
     )
@@ -181,7 +202,8 @@ class VaccinationRecord(BaseModel):
     administered_by = Column(String(100), comment='接种人员')
     
     # 关系
-    vaccine_type = relationship('VaccineType')
+    vaccine_type = relationship('VaccineType', back_populates='vaccination_records', 
+                                lazy='joined', innerjoin=True)
     
     def __repr__(self):
         return f"<VaccinationRecord(id={self.id}, animal_id={self.animal_id})>"
@@ -195,7 +217,8 @@ class DewormingRecord(BaseModel):
     __tablename__ = 'deworming_records'
     __table_args__ = (
         Index('ix_deworming_records_animal_id', 'animal_id'),
-        Index('ix_deworming_records_deworming_date', 'deworming_date'),
+        Index('ix_deworming_records_deworming_date_brin', 'deworming_date', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
         {'comment': '驱虫记录表'}
     )
     
@@ -8,12 +8,33 @@
 
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime, Date, 
-    Numeric, Text, ForeignKey, Index, CheckConstraint
+    Numeric, Float, Text, ForeignKey, Index, text
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, Session
 from sqlalchemy.dialects.postgresql import JSONB
+import enum
 
-from .base import BaseModel
+from .base import (
+    BaseModel, attach_lz4_compression, attach_monthly_partitions, ensure_monthly_partitions, value_enum
+)
+
+
+class DeviceType(str, enum.Enum):
+    SCALE = "scale"
+    RFID_READER = "rfid_reader"
+    TEMPERATURE_SENSOR = "temperature_sensor"
+    HUMIDITY_SENSOR = "humidity_sensor"
+    CAMERA = "camera"
+    WATER_METER = "water_meter"
+    FEED_DISPENSER = "feed_dispenser"
+    ACTIVITY_MONITOR = "activity_monitor"
+    GPS_TRACKER = "gps_tracker"
+
+class DeviceStatus(str, enum.Enum):
+    ONLINE = "online"
+    OFFLINE = "offline"
+    ERROR = "error"
+    MAINTENANCE = "maintenance"
 
 
 class IoTDevice(BaseModel):
@@ -21,23 +42,26 @@ class IoTDevice(BaseModel):
     
     __tablename__ = 'iot_devices'
     __table_args__ = (
-        Index('ix_iot_devices_device_id', 'device_id', unique=True),
         Index('ix_iot_devices_farm_id', 'farm_id'),
         Index('ix_iot_devices_barn_id', 'barn_id'),
         Index('ix_iot_devices_device_type', 'device_type'),
-        Index('ix_iot_devices_status', 'status'),
-        CheckConstraint(
-            "device_type IN ('scale', 'rfid_reader', 'temperature_sensor', 'humidity_sensor', "
-            "'camera', 'water_meter', 'feed_dispenser', 'activity_monitor', 'gps_tracker')",
-            name='ck_device_type'
-        ),
+        # 按羊场的设备状态统计/列表 (未删除设备)
+        Index('ix_iot_devices_farm_status_live', 'farm_id', 'status',
+              postgresql_where=text('is_deleted = false')),
+        # status 取值少、选择性差: 按在线/非在线分别建心跳部分索引，掉线巡检只扫在线子集
+        Index('ix_iot_devices_online_heartbeat', 'last_heartbeat',
+              postgresql_where=text("status = 'online'")),
+        Index('ix_iot_devices_offline_heartbeat', 'last_heartbeat',
+              postgresql_where=text("status != 'online'")),
+        Index('ix_iot_devices_config_gin', 'config', postgresql_using='gin',
+              postgresql_ops={'config': 'jsonb_path_ops'}),
         {'comment': 'IoT设备表'}
     )
     
     # 设备标识
     device_id = Column(String(100), unique=True, nullable=False, comment='设备ID')
     name = Column(String(200), nullable=False, comment='设备名称')
-    device_type = Column(String(50), nullable=False, comment='设备类型')
+    device_type = Column(value_enum(DeviceType, 'device_type_enum'), nullable=False, comment='设备类型')
     
     # 位置
     farm_id = Column(Integer, ForeignKey('farms.id'), nullable=False, comment='羊场ID')
@@ -56,7 +80,7 @@ class IoTDevice(BaseModel):
     protocol = Column(String(50), comment='通信协议: mqtt/http/modbus')
     
     # 状态
-    status = Column(String(20), default='online', nullable=False, 
+    status = Column(value_enum(DeviceStatus, 'device_status_enum'), default=DeviceStatus.ONLINE, nullable=False,
                    comment='状态: online/offline/error/maintenance')
     last_heartbeat = Column(DateTime(timezone=True), comment='最后心跳时间')
     last_data_time = Column(DateTime(timezone=True), comment='最后数据时间')
@@ -81,23 +105,41 @@ class IoTDevice(BaseModel):
         return self.status == 'online'
 
 
+attach_lz4_compression(IoTDevice.__table__, 'config')
+
+
 class IoTData(BaseModel):
-    """IoT数据模型"""
+    """
+    IoT数据模型
+    
+    PostgreSQL上按 timestamp 月度范围分区 (iot_data_YYYY_MM + 默认分区)，
+    按时间窗口的查询只扫描命中的分区，过期数据整月 DETACH/DROP PARTITION。
+    """
     
     __tablename__ = 'iot_data'
     __table_args__ = (
-        Index('ix_iot_data_device_id', 'device_id'),
-        Index('ix_iot_data_timestamp', 'timestamp'),
+        # 分区表上的索引在各分区建本地索引; 分区内时间范围走 BRIN (按写入顺序追加，体积远小于btree)
+        Index('ix_iot_data_timestamp_brin', 'timestamp', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
+        Index('ix_iot_data_received_at_brin', 'received_at', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
         Index('ix_iot_data_data_type', 'data_type'),
-        Index('ix_iot_data_device_timestamp', 'device_id', 'timestamp'),
-        {'comment': 'IoT数据表'}
+        # 外键列普通索引: 下方键集索引为部分索引，不覆盖已删除行
+        Index('ix_iot_data_device_id', 'device_id'),
+        # 设备数据按 (timestamp, id) 键集分页; 部分索引只含未删除行
+        Index('ix_iot_data_device_timestamp', 'device_id', 'timestamp', 'id',
+              postgresql_where=text('is_deleted = false')),
+        # 负载包含查询 (如 RFID 标签): data_payload @> '{"rfid_tag": "..."}'
+        Index('ix_iot_data_payload_gin', 'data_payload', postgresql_using='gin',
+              postgresql_ops={'data_payload': 'jsonb_path_ops'}),
+        {'comment': 'IoT数据表', 'postgresql_partition_by': 'RANGE (timestamp)'}
     )
     
     # 关联
     device_id = Column(Integer, ForeignKey('iot_devices.id'), nullable=False, comment='设备ID')
     
-    # 时间戳
-    timestamp = Column(DateTime(timezone=True), nullable=False, comment='数据时间戳')
+    # 时间戳 (分区表的主键须包含分区键: (id, timestamp))
+    timestamp = Column(DateTime(timezone=True), primary_key=True, nullable=False, comment='数据时间戳')
     received_at = Column(DateTime(timezone=True), nullable=False, comment='接收时间')
     
     # 数据类型
@@ -105,7 +147,7 @@ class IoTData(BaseModel):
                       comment='类型: weight/temperature/humidity/rfid/activity')
     
     # 数据值
-    value = Column(Numeric(12, 4), comment='数值(用于单值数据)')
+    value = Column(Float, comment='数值(用于单值数据)')
     unit = Column(String(20), comment='单位')
     
     # 复杂数据
@@ -130,6 +172,17 @@ class IoTData(BaseModel):
     
     def __repr__(self):
         return f"<IoTData(device={self.device_id}, type='{self.data_type}', time={self.timestamp})>"
+    
+    @staticmethod
+    def ensure_partitions(session: Session, months_ahead: int = 2) -> None:
+        """预建当月及之后若干月的分区 (须早于数据落入默认分区)"""
+        ensure_monthly_partitions(session, IoTData.__tablename__, months_ahead)
+
+
+# 先设压缩再建分区，分区沿用父表的列压缩方式
+attach_lz4_compression(IoTData.__table__, 'data_payload')
+# 月度分区: 默认分区兜底越界时间戳，后续月份由定时任务 tasks.ensure_partitions 预建
+attach_monthly_partitions(IoTData.__table__)
 
 
 class AutoWeighingRecord(BaseModel):
@@ -137,7 +190,9 @@ class AutoWeighingRecord(BaseModel):
     
     __tablename__ = 'auto_weighing_records'
     __table_args__ = (
-        Index('ix_auto_weighing_animal_id', 'animal_id'),
+        # 同一动物同一时刻只保留一条 (秤台重复触发)；按动物查询也走此索引
+        Index('uq_auto_weighing_animal_time', 'animal_id', 'weighing_time', unique=True,
+              postgresql_where=text('animal_id IS NOT NULL')),
         Index('ix_auto_weighing_weighing_time', 'weighing_time'),
         Index('ix_auto_weighing_device_id', 'device_id'),
         {'comment': '自动称重记录表'}
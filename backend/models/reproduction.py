@@ -8,12 +8,24 @@
 
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime, Date, 
-    Numeric, Text, ForeignKey, Index, CheckConstraint
+    Numeric, Text, ForeignKey, Index, CheckConstraint, text
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
+import enum
 
-from .base import BaseModel
+from .base import BaseModel, attach_lz4_compression, value_enum
+
+
+class BreedingStatus(str, enum.Enum):
+    PENDING = "pending"
+    CONFIRMED = "confirmed"
+    FAILED = "failed"
+
+class PregnancyResult(str, enum.Enum):
+    POSITIVE = "positive"
+    NEGATIVE = "negative"
+    UNCERTAIN = "uncertain"
 
 
 class EstrusRecord(BaseModel):
@@ -23,6 +35,8 @@ class EstrusRecord(BaseModel):
     __table_args__ = (
         Index('ix_estrus_records_animal_id', 'animal_id'),
         Index('ix_estrus_records_observation_date', 'observation_date'),
+        Index('ix_estrus_records_estrus_signs_gin', 'estrus_signs', postgresql_using='gin',
+              postgresql_ops={'estrus_signs': 'jsonb_path_ops'}),
         {'comment': '发情记录表'}
     )
     
@@ -47,9 +61,10 @@ class BreedingRecord(BaseModel):
     
     __tablename__ = 'breeding_records'
     __table_args__ = (
-        Index('ix_breeding_records_dam_id', 'dam_id'),
+        # 母羊配种史按时间倒序: 复合索引免排序，INCLUDE 列使列表查询可仅扫索引
+        Index('ix_breeding_records_dam_date', 'dam_id', text('breeding_date DESC'),
+              postgresql_include=['status', 'expected_lambing_date']),
         Index('ix_breeding_records_sire_id', 'sire_id'),
-        Index('ix_breeding_records_breeding_date', 'breeding_date'),
         Index('ix_breeding_records_status', 'status'),
         {'comment': '配种记录表'}
     )
@@ -72,7 +87,7 @@ class BreedingRecord(BaseModel):
     gestation_days = Column(Integer, default=150, comment='妊娠天数')
     
     # 结果
-    status = Column(String(20), default='pending', nullable=False, 
+    status = Column(value_enum(BreedingStatus, 'breeding_status_enum'), default=BreedingStatus.PENDING, nullable=False,
                    comment='状态: pending/confirmed/failed')
     
     # 关系
@@ -98,7 +113,8 @@ class PregnancyRecord(BaseModel):
     check_method = Column(String(50), nullable=False, comment='方法: ultrasound/palpation/blood')
     days_post_breeding = Column(Integer, comment='配种后天数')
     
-    result = Column(String(20), nullable=False, comment='结果: positive/negative/uncertain')
+    result = Column(value_enum(PregnancyResult, 'pregnancy_result_enum'), nullable=False,
+                    comment='结果: positive/negative/uncertain')
     fetus_count = Column(Integer, comment='胎儿数')
     fetus_viability = Column(String(50), comment='胎儿活力评估')
     
@@ -107,14 +123,20 @@ class PregnancyRecord(BaseModel):
     ultrasound_images = Column(JSONB, comment='超声图像')
 
 
+attach_lz4_compression(PregnancyRecord.__table__, 'ultrasound_images')
+
+
 class LambingRecord(BaseModel):
     """产羔记录模型"""
     
     __tablename__ = 'lambing_records'
     __table_args__ = (
-        Index('ix_lambing_records_dam_id', 'dam_id'),
+        Index('ix_lambing_records_dam_date', 'dam_id', text('lambing_date DESC'),
+              postgresql_include=['litter_size', 'born_alive']),
         Index('ix_lambing_records_breeding_id', 'breeding_id'),
         Index('ix_lambing_records_lambing_date', 'lambing_date'),
+        Index('ix_lambing_records_lamb_details_gin', 'lamb_details', postgresql_using='gin',
+              postgresql_ops={'lamb_details': 'jsonb_path_ops'}),
         {'comment': '产羔记录表'}
     )
     
@@ -159,6 +181,9 @@ class LambingRecord(BaseModel):
     """
 
 
+attach_lz4_compression(LambingRecord.__table__, 'lamb_details')
+
+
 class WeaningRecord(BaseModel):
     """断奶记录模型"""
     
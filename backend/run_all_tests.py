@@ -19,9 +19,10 @@
     python run_all_tests.py          # 运行所有测试
     python run_all_tests.py --cov    # 运行并生成覆盖率报告
     python run_all_tests.py --quick  # 快速测试模式
+    python run_all_tests.py --parallel  # 多进程并行 (pytest-xdist)
 """
 
-import subprocess
+import pytest
 import sys
 import os
 from datetime import datetime
@@ -34,13 +35,14 @@ def print_header(message: str):
     print("=" * 70)
 
 
-def run_tests(with_coverage: bool = False, quick_mode: bool = False):
+def run_tests(with_coverage: bool = False, quick_mode: bool = False, parallel: bool = False):
     """
-    运行测试套件
+    运行测试套件 (在当前解释器内调用 pytest.main，复用已导入的依赖)
     
     参数:
         with_coverage: 是否生成覆盖率报告
         quick_mode: 是否使用快速模式(跳过慢测试)
+        parallel: 是否按CPU核数并行运行
     
     返回:
         int: 测试退出码 (0=成功)
@@ -50,11 +52,11 @@ def run_tests(with_coverage: bool = False, quick_mode: bool = False):
     
     print_header(f"开始测试 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    # 构建pytest命令
-    cmd = [sys.executable, "-m", "pytest", "tests/", "-v"]
+    # 构建pytest参数
+    args = ["tests/", "-v"]
     
     if with_coverage:
-        cmd.extend([
+        args.extend([
             "--cov=.",
             "--cov-report=term-missing",
             "--cov-report=html:htmlcov"
@@ -62,10 +64,14 @@ def run_tests(with_coverage: bool = False, quick_mode: bool = False):
         print("📊 启用覆盖率报告")
     
     if quick_mode:
-        cmd.extend(["-x", "--tb=line"])  # 遇到第一个失败就停止
+        args.extend(["-x", "--tb=line"])  # 遇到第一个失败就停止
         print("⚡ 快速模式已启用")
     else:
-        cmd.extend(["--tb=short"])
+        args.extend(["--tb=short"])
+    
+    if parallel:
+        args.extend(["-n", "auto"])
+        print("🚀 并行模式已启用")
     
     # 测试分类
     test_categories = [
@@ -81,11 +87,11 @@ def run_tests(with_coverage: bool = False, quick_mode: bool = False):
     print("\n" + "-" * 70)
     
     # 运行测试
-    result = subprocess.run(cmd, cwd=os.path.dirname(__file__))
+    returncode = int(pytest.main(args))
     
     # 打印结果摘要
     print("\n" + "-" * 70)
-    if result.returncode == 0:
+    if returncode == 0:
         print("✅ 所有测试通过!")
     else:
         print("❌ 部分测试失败，请检查上面的输出")
@@ -93,19 +99,20 @@ def run_tests(with_coverage: bool = False, quick_mode: bool = False):
     if with_coverage:
         print("\n📊 覆盖率报告已生成: htmlcov/index.html")
     
-    return result.returncode
+    return returncode
 
 
 def main():
     """主函数"""
     with_cov = "--cov" in sys.argv or "-c" in sys.argv
     quick = "--quick" in sys.argv or "-q" in sys.argv
+    parallel = "--parallel" in sys.argv or "-n" in sys.argv
     
     if "--help" in sys.argv or "-h" in sys.argv:
         print(__doc__)
         return 0
     
-    return run_tests(with_coverage=with_cov, quick_mode=quick)
+    return run_tests(with_coverage=with_cov, quick_mode=quick, parallel=parallel)
 
 
 if __name__ == "__main__":
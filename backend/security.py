@@ -6,21 +6,26 @@
 # 功能: 安全相关中间件和工具函数
 # ============================================================================
 
+import asyncio
 import hashlib
 import hmac
 import secrets
 import re
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Tuple, Union
 from functools import wraps
 import logging
 
 from fastapi import Request, HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
+from jose import JWTError, jws, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel, validator, field_validator
 import bleach
+import bleach.sanitizer
+import orjson
 
 from config import settings
 
@@ -31,13 +36,22 @@ logger = logging.getLogger(__name__)
 # Password Handling
 # ============================================================================
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 新哈希使用 argon2id (OWASP推荐参数: 19 MiB内存, 2次迭代, 单线程)；
+# 旧 bcrypt 哈希仍可验证，验证成功后由 verify_and_update_password 升级
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__memory_cost=19456,
+    argon2__time_cost=2,
+    argon2__parallelism=1,
+)
 
 def hash_password(password: str) -> str:
     """
     安全地哈希密码
     
-    使用 bcrypt 算法，自动加盐
+    使用 argon2id 算法，自动加盐
     """
     return pwd_context.hash(password)
 
@@ -45,6 +59,30 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    验证密码并按需升级哈希
+    
+    返回: (是否通过, 新哈希)；旧算法或旧参数的哈希验证通过时返回新哈希，
+    调用方应将其写回用户记录，否则为 None
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    异步验证密码 (登录等请求处理中使用)
+    
+    哈希计算是CPU密集操作，放到线程池执行，避免阻塞事件循环
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, verify_and_update_password, plain_password, hashed_password)
+
+# 密码强度检查的字符类 (模块加载时预编译)
+_RE_UPPER = re.compile(r'[A-Z]')
+_RE_LOWER = re.compile(r'[a-z]')
+_RE_DIGIT = re.compile(r'\d')
+_RE_SPECIAL = re.compile(r'[!@#$%^&*(),.?":{}|<>]')
+
 def validate_password_strength(password: str) -> tuple[bool, str]:
     """
     验证密码强度
@@ -54,16 +92,16 @@ def validate_password_strength(password: str) -> tuple[bool, str]:
     if len(password) < settings.PASSWORD_MIN_LENGTH:
         return False, f"密码长度至少 {settings.PASSWORD_MIN_LENGTH} 位"
     
-    if settings.PASSWORD_REQUIRE_UPPERCASE and not re.search(r'[A-Z]', password):
+    if settings.PASSWORD_REQUIRE_UPPERCASE and not _RE_UPPER.search(password):
         return False, "密码必须包含大写字母"
     
-    if settings.PASSWORD_REQUIRE_LOWERCASE and not re.search(r'[a-z]', password):
+    if settings.PASSWORD_REQUIRE_LOWERCASE and not _RE_LOWER.search(password):
         return False, "密码必须包含小写字母"
     
-    if settings.PASSWORD_REQUIRE_DIGIT and not re.search(r'\d', password):
+    if settings.PASSWORD_REQUIRE_DIGIT and not _RE_DIGIT.search(password):
         return False, "密码必须包含数字"
     
-    if settings.PASSWORD_REQUIRE_SPECIAL and not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
+    if settings.PASSWORD_REQUIRE_SPECIAL and not _RE_SPECIAL.search(password):
         return False, "密码必须包含特殊字符"
     
     return True, ""
@@ -75,35 +113,29 @@ def validate_password_strength(password: str) -> tuple[bool, str]:
 
 security = HTTPBearer(auto_error=False)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """创建访问令牌"""
-    to_encode = data.copy()
-    
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    to_encode.update({
-        "exp": expire,
-        "iat": datetime.utcnow(),
-        "type": "access"
-    })
+# 令牌有效期(秒)，模块加载时换算一次
+_ACCESS_TOKEN_TTL = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+_REFRESH_TOKEN_TTL = settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+
+def _encode_token(payload: dict) -> str:
+    """
+    签名令牌
     
-    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    载荷由 orjson 序列化后直接交给 jws.sign；时间声明已是整数秒，
+    无需 jwt.encode 的 datetime 转换
+    """
+    return jws.sign(orjson.dumps(payload), settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    """创建访问令牌 (exp/iat 直接写入 POSIX 整数秒)"""
+    now = int(time.time())
+    ttl = int(expires_delta.total_seconds()) if expires_delta else _ACCESS_TOKEN_TTL
+    return _encode_token({**data, "exp": now + ttl, "iat": now, "type": "access"})
 
 def create_refresh_token(data: dict) -> str:
     """创建刷新令牌"""
-    to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    
-    to_encode.update({
-        "exp": expire,
-        "iat": datetime.utcnow(),
-        "type": "refresh"
-    })
-    
-    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    now = int(time.time())
+    return _encode_token({**data, "exp": now + _REFRESH_TOKEN_TTL, "iat": now, "type": "refresh"})
 
 def decode_token(token: str) -> Optional[dict]:
     """解码并验证令牌"""
@@ -138,12 +170,14 @@ async def get_current_user(
     return payload
 
 async def require_auth(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user: Optional[dict] = Depends(get_current_user)
 ) -> dict:
     """
     强制要求认证
     
-    如果未认证则抛出 401 错误
+    如果未认证则抛出 401 错误。令牌由 get_current_user 依赖解码，
+    FastAPI 在同一请求内缓存依赖结果，端点同时依赖两者时也只解码一次
     """
     if not credentials:
         raise HTTPException(
@@ -152,7 +186,6 @@ async def require_auth(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = await get_current_user(credentials)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -167,25 +200,38 @@ async def require_auth(
 # Input Validation and Sanitization
 # ============================================================================
 
+# 仅允许安全的标签，不允许任何属性 (Cleaner 模块加载时构建一次，复用解析器配置)
+_HTML_CLEANER = bleach.sanitizer.Cleaner(
+    tags=frozenset(['b', 'i', 'u', 'em', 'strong', 'p', 'br']),
+    attributes={},
+    strip=True
+)
+
 def sanitize_html(text: str) -> str:
     """
     清理 HTML 内容，防止 XSS 攻击
     
     仅允许安全的标签和属性
     """
-    allowed_tags = ['b', 'i', 'u', 'em', 'strong', 'p', 'br']
-    allowed_attrs = {}
-    
-    return bleach.clean(text, tags=allowed_tags, attributes=allowed_attrs, strip=True)
+    return _HTML_CLEANER.clean(text)
+
+_RE_FILENAME_UNSAFE = re.compile(r'[^\w\s\-\.]')
+# Latin-1 范围内按同一规则预先算出待删字符 (含 / 与 \)，单次 translate 完成清理
+_FILENAME_TABLE = str.maketrans('', '', ''.join(
+    chr(c) for c in range(256) if _RE_FILENAME_UNSAFE.match(chr(c))
+))
+_is_sql_identifier = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$').match
+_RE_INJECT = re.compile(r'<script|javascript:|on\w+=', re.IGNORECASE)
 
 def sanitize_filename(filename: str) -> str:
     """
     清理文件名，防止路径遍历攻击
     """
-    # 移除路径分隔符
-    filename = filename.replace('/', '').replace('\\', '')
-    # 移除特殊字符
-    filename = re.sub(r'[^\w\s\-\.]', '', filename)
+    # 移除路径分隔符及特殊字符
+    filename = filename.translate(_FILENAME_TABLE)
+    # 非ASCII文件名(如中文)可能含 Latin-1 以外的标点符号，仍需按正则清理
+    if not filename.isascii():
+        filename = _RE_FILENAME_UNSAFE.sub('', filename)
     # 限制长度
     return filename[:255]
 
@@ -195,7 +241,7 @@ def validate_sql_identifier(identifier: str) -> bool:
     
     防止 SQL 注入
     """
-    return bool(re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', identifier))
+    return _is_sql_identifier(identifier) is not None
 
 class SecureInput(BaseModel):
     """安全输入基类，自动清理 HTML"""
@@ -206,8 +252,8 @@ class SecureInput(BaseModel):
         if isinstance(v, str):
             # 移除潜在的危险字符
             v = v.strip()
-            # 检测潜在的脚本注入
-            if re.search(r'<script|javascript:|on\w+=', v, re.IGNORECASE):
+            # 检测潜在的脚本注入 (三种模式分别必含 < : =，不含时免去正则扫描)
+            if ('<' in v or ':' in v or '=' in v) and _RE_INJECT.search(v):
                 raise ValueError("检测到潜在的脚本注入")
         return v
 
@@ -220,11 +266,20 @@ class RateLimiter:
     """
     简单的内存速率限制器
     
-    生产环境建议使用 Redis 实现
+    每个键保存窗口内请求时刻的队列 (单调时钟)，过期记录从队头弹出，
+    单次检查均摊 O(1)。生产环境建议使用 Redis 实现
     """
     
     def __init__(self):
-        self._requests: Dict[str, List[datetime]] = {}
+        self._requests: Dict[str, deque] = {}
+    
+    def _prune(self, key: str, window_seconds: int) -> deque:
+        """弹出窗口外的请求记录"""
+        dq = self._requests.setdefault(key, deque())
+        cutoff = time.monotonic() - window_seconds
+        while dq and dq[0] <= cutoff:
+            dq.popleft()
+        return dq
     
     def is_allowed(
         self, 
@@ -243,21 +298,12 @@ class RateLimiter:
         Returns:
             是否允许请求
         """
-        now = datetime.now()
-        window_start = now - timedelta(seconds=window_seconds)
+        dq = self._prune(key, window_seconds)
         
-        if key not in self._requests:
-            self._requests[key] = []
-        
-        # 清理过期的请求记录
-        self._requests[key] = [
-            t for t in self._requests[key] if t > window_start
-        ]
-        
-        if len(self._requests[key]) >= max_requests:
+        if len(dq) >= max_requests:
             return False
         
-        self._requests[key].append(now)
+        dq.append(time.monotonic())
         return True
     
     def get_remaining(
@@ -267,20 +313,68 @@ class RateLimiter:
         window_seconds: int = 60
     ) -> int:
         """获取剩余请求次数"""
-        now = datetime.now()
-        window_start = now - timedelta(seconds=window_seconds)
-        
         if key not in self._requests:
             return max_requests
         
-        current_count = len([
-            t for t in self._requests[key] if t > window_start
-        ])
-        
-        return max(0, max_requests - current_count)
+        return max(0, max_requests - len(self._prune(key, window_seconds)))
+
+class RedisRateLimiter:
+    """
+    基于Redis的固定窗口速率限制器
+    
+    计数键为 ratelimit:<键>:<窗口序号>，每次检查执行一次Lua脚本
+    (INCR + 首次EXPIRE，原子且只需一次往返)，多worker/多实例共享配额。
+    Redis不可用时回退到进程内 RateLimiter，并暂停一段时间再重试Redis。
+    """
+    
+    _SCRIPT = """
+    local c = redis.call('INCR', KEYS[1])
+    if c == 1 then redis.call('EXPIRE', KEYS[1], ARGV[1]) end
+    return c
+    """
+    
+    def __init__(self, client: Any = None, fallback: Optional[RateLimiter] = None):
+        self._client = client
+        self._script = None
+        self._retry_at = 0.0
+        self.fallback = fallback or RateLimiter()
+    
+    @property
+    def client(self):
+        if self._client is None and settings.RATE_LIMIT_REDIS_ENABLED:
+            import redis.asyncio
+            self._client = redis.asyncio.Redis.from_url(
+                settings.REDIS_URL,
+                socket_timeout=settings.RATE_LIMIT_SOCKET_TIMEOUT,
+                socket_connect_timeout=settings.RATE_LIMIT_SOCKET_TIMEOUT,
+            )
+        return self._client
+    
+    async def is_allowed(
+        self, 
+        key: str, 
+        max_requests: int = 100, 
+        window_seconds: int = 60
+    ) -> bool:
+        """检查是否允许请求 (参数同 RateLimiter.is_allowed)"""
+        client = self.client
+        if client is not None and time.monotonic() >= self._retry_at:
+            try:
+                if self._script is None:
+                    # register_script 走 EVALSHA，脚本未缓存时自动改用 EVAL
+                    self._script = client.register_script(self._SCRIPT)
+                bucket = int(time.time() // window_seconds)
+                count = await self._script(
+                    keys=[f"ratelimit:{key}:{bucket}"], args=[window_seconds]
+                )
+                return int(count) <= max_requests
+            except Exception as e:
+                logger.warning(f"Redis速率限制不可用，回退进程内计数: {e}")
+                self._retry_at = time.monotonic() + settings.RATE_LIMIT_REDIS_RETRY_SECONDS
+        return self.fallback.is_allowed(key, max_requests=max_requests, window_seconds=window_seconds)
 
 # 全局速率限制器实例
-rate_limiter = RateLimiter()
+rate_limiter = RedisRateLimiter()
 
 async def check_rate_limit(request: Request, max_requests: int = 100):
     """
@@ -290,7 +384,7 @@ async def check_rate_limit(request: Request, max_requests: int = 100):
     """
     client_ip = request.client.host if request.client else "unknown"
     
-    if not rate_limiter.is_allowed(client_ip, max_requests=max_requests):
+    if not await rate_limiter.is_allowed(client_ip, max_requests=max_requests):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="请求过于频繁，请稍后重试",
@@ -309,8 +403,17 @@ def generate_csrf_token() -> str:
     """生成 CSRF 令牌"""
     return secrets.token_urlsafe(32)
 
-def verify_csrf_token(token: str, stored_token: str) -> bool:
-    """验证 CSRF 令牌"""
+def verify_csrf_token(token: Union[str, bytes], stored_token: Union[str, bytes]) -> bool:
+    """
+    验证 CSRF 令牌
+    
+    按 bytes 比较: 会话中可直接保存编码后的令牌；请求头传入的 str 统一按
+    UTF-8 编码，非ASCII输入只会比较失败，不会像 str 比较那样抛出 TypeError
+    """
+    if isinstance(token, str):
+        token = token.encode()
+    if isinstance(stored_token, str):
+        stored_token = stored_token.encode()
     return hmac.compare_digest(token, stored_token)
 
 # ============================================================================
@@ -322,9 +425,19 @@ def generate_api_key() -> str:
     """生成 API 密钥"""
     return f"nova_{secrets.token_urlsafe(32)}"
 
-def hash_api_key(api_key: str) -> str:
-    """哈希 API 密钥用于存储"""
-    return hashlib.sha256(api_key.encode()).hexdigest()
+def hash_api_key(api_key: Union[str, bytes]) -> str:
+    """
+    哈希 API 密钥用于存储
+    
+    已是 bytes 的密钥(如直接取自请求头原始值)不再重复编码
+    """
+    if isinstance(api_key, str):
+        api_key = api_key.encode()
+    return hashlib.sha256(api_key).hexdigest()
+
+def verify_api_key(api_key: Union[str, bytes], stored_hash: str) -> bool:
+    """验证 API 密钥 (常量时间比较，防止时序攻击)"""
+    return hmac.compare_digest(hash_api_key(api_key), stored_hash)
 
 # ============================================================================
 # 安全日志
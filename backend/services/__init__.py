@@ -14,6 +14,7 @@ from .reproduction_service import (
     LambingRecordService, WeaningRecordService
 )
 from .growth_service import GrowthRecordService
+from .breeding_value_service import BreedingValueResultService
 from .iot_service import IoTDeviceService, IoTDataService, AutoWeighingService
 from .feed_service import (
     FeedTypeService, FeedFormulaService, FeedingPlanService,
@@ -32,6 +33,8 @@ __all__ = [
     'LambingRecordService', 'WeaningRecordService',
     # Growth (1)
     'GrowthRecordService',
+    # Breeding value (1)
+    'BreedingValueResultService',
     # IoT (3)
     'IoTDeviceService', 'IoTDataService', 'AutoWeighingService',
     # Feed (5)
@@ -6,13 +6,16 @@
 # 功能: 提供通用CRUD操作的基类
 # ============================================================================
 
-from typing import TypeVar, Generic, Type, Optional, List, Any, Dict
+from typing import TypeVar, Generic, Type, Optional, List, Any, Dict, Iterable, Tuple, Callable
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, asc
+from sqlalchemy.orm.interfaces import LoaderOption
+from sqlalchemy.engine import RowMapping
+from sqlalchemy import and_, or_, desc, asc, func, select, insert, update, exists, event, inspect
 from pydantic import BaseModel
+import functools
 import logging
 
-from database import Base
+from database import Base, no_lazy
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +24,71 @@ CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
+# ============================================================================
+# 会话级查询缓存
+# Per-Session Lookup Cache
+# ============================================================================
+
+_REQUEST_CACHE_KEY = 'request_cache'
+
+
+def _request_cache_key(model: Type[Base], name: str, args: tuple, kwargs: Dict[str, Any]) -> tuple:
+    return (model.__name__, name, args, tuple(sorted(kwargs.items())))
+
+
+def request_cached(method: Callable) -> Callable:
+    """
+    在当前会话(一次请求)内缓存按字段查询的结果
+    
+    键为 (模型名, 方法名, 参数)；会话新增对象、刷新、提交或回滚后整体失效，
+    因此同一请求内写入后再查询仍能读到最新数据
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = self.db.info.setdefault(_REQUEST_CACHE_KEY, {})
+        key = _request_cache_key(self.model, method.__name__, args, kwargs)
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        except TypeError:  # 参数不可哈希
+            return method(self, *args, **kwargs)
+        result = method(self, *args, **kwargs)
+        # 查询前的自动刷新可能已清空缓存，重新取缓存字典再写入
+        self.db.info.setdefault(_REQUEST_CACHE_KEY, {})[key] = result
+        return result
+    return wrapper
+
+
+@event.listens_for(Session, 'after_attach')
+@event.listens_for(Session, 'after_flush')
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _clear_request_cache(session: Session, *args) -> None:
+    session.info.pop(_REQUEST_CACHE_KEY, None)
+
+
+# ============================================================================
+# 模型列映射
+# Model Column Map
+# ============================================================================
+
+@functools.lru_cache(maxsize=None)
+def _column_map(model: Type[Base]) -> Dict[str, Any]:
+    """模型映射列 {属性名: 列属性}，每个模型类只解析一次"""
+    return {prop.key: getattr(model, prop.key) for prop in inspect(model).column_attrs}
+
+
+@functools.lru_cache(maxsize=None)
+def _not_deleted(model: Type[Base]) -> Any:
+    """
+    未软删除条件 (按模型缓存，避免每次查询重建表达式)
+    
+    ORM查询已由会话事件统一过滤 (models.base)，此条件仅用于 UPDATE 与 exists()
+    """
+    return model.is_deleted == False
+
+
 class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     """
     通用CRUD服务基类
@@ -33,8 +101,15 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         def __init__(self, db: Session):
             super().__init__(Farm, db)
     ```
+    
+    子类可通过 eager_loads 声明读取时预加载的关系，例如
+    eager_loads = (selectinload(Farm.barns),)；
+    未声明的关系在 ORM_RAISE_ON_LAZY_LOAD 开启时禁止延迟加载。
     """
     
+    # 读取时预加载的关系 (get / get_multi / search)
+    eager_loads: Tuple[LoaderOption, ...] = ()
+    
     def __init__(self, model: Type[ModelType], db: Session):
         """
         初始化服务
@@ -45,6 +120,8 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         self.model = model
         self.db = db
+        self._columns = _column_map(model)
+        self._not_deleted = _not_deleted(model)
     
     # ========================================================================
     # 创建操作
@@ -69,12 +146,15 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         self.db.commit()
         self.db.refresh(db_obj)
         
-        logger.info(f"创建 {self.model.__name__}: id={db_obj.id}")
+        logger.info("创建 %s: id=%s", self.model.__name__, db_obj.id)
         return db_obj
     
     def create_batch(self, objects_in: List[CreateSchemaType], **kwargs) -> List[ModelType]:
         """
-        批量创建记录
+        批量创建记录 (不提交，由调用方统一提交)
+        
+        一条 INSERT ... RETURNING (insertmanyvalues) 写入并取回主键与服务端默认值，
+        不再逐条 refresh
         
         Args:
             objects_in: Pydantic创建模型列表
@@ -83,39 +163,37 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         Returns:
             创建的模型实例列表
         """
-        db_objects = []
+        if not objects_in:
+            return []
+        
+        rows = []
         for obj_in in objects_in:
             obj_data = obj_in.model_dump() if hasattr(obj_in, 'model_dump') else obj_in.dict()
             obj_data.update(kwargs)
-            db_obj = self.model(**obj_data)
-            db_objects.append(db_obj)
-        
-        self.db.add_all(db_objects)
-        self.db.commit()
+            rows.append(obj_data)
         
-        for obj in db_objects:
-            self.db.refresh(obj)
+        db_objects = self.db.scalars(insert(self.model).returning(self.model), rows).all()
         
-        logger.info(f"批量创建 {self.model.__name__}: count={len(db_objects)}")
+        logger.info("批量创建 %s: count=%d", self.model.__name__, len(db_objects))
         return db_objects
     
     # ========================================================================
     # 读取操作
     # ========================================================================
     
-    def get(self, id: int) -> Optional[ModelType]:
+    def get(self, id: int, with_options: Iterable[LoaderOption] = ()) -> Optional[ModelType]:
         """
         根据ID获取单条记录
         
         Args:
             id: 记录ID
+            with_options: 附加的加载选项
         
         Returns:
             模型实例或None
         """
-        return self.db.query(self.model).filter(
-            self.model.id == id,
-            self.model.is_deleted == False
+        return self.db.query(self.model).options(*self.eager_loads, *with_options).filter(
+            self.model.id == id
         ).first()
     
     def get_or_404(self, id: int) -> ModelType:
@@ -136,9 +214,10 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             raise ValueError(f"{self.model.__name__} not found with id={id}")
         return obj
     
+    @request_cached
     def get_by_field(self, field: str, value: Any) -> Optional[ModelType]:
         """
-        根据字段值获取单条记录
+        根据字段值获取单条记录 (同一会话内重复查询走缓存)
         
         Args:
             field: 字段名
@@ -147,10 +226,34 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         Returns:
             模型实例或None
         """
-        return self.db.query(self.model).filter(
-            getattr(self.model, field) == value,
-            self.model.is_deleted == False
-        ).first()
+        return self.db.query(self.model).filter(self._columns[field] == value).first()
+    
+    def get_by_field_in(self, field: str, values: Iterable[Any]) -> Dict[Any, ModelType]:
+        """
+        按字段值批量获取 (一次 IN 查询)
+        
+        同时预填 get_by_field(field, value) 的会话缓存 (含未命中的值)，
+        批量处理循环中逐条调用 get_by_field 不再查库
+        
+        Args:
+            field: 字段名 (通常为唯一代码列)
+            values: 字段值
+        
+        Returns:
+            {字段值: 模型实例}，不存在的值不出现在结果中
+        """
+        values = set(values)
+        if not values:
+            return {}
+        
+        found = {
+            getattr(obj, field): obj
+            for obj in self.db.query(self.model).filter(self._columns[field].in_(values))
+        }
+        cache = self.db.info.setdefault(_REQUEST_CACHE_KEY, {})
+        for value in values:
+            cache[_request_cache_key(self.model, 'get_by_field', (field, value), {})] = found.get(value)
+        return found
     
     def get_multi(
         self,
@@ -158,7 +261,8 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         limit: int = 20,
         order_by: str = "id",
         order_desc: bool = True,
-        filters: Dict[str, Any] = None
+        filters: Dict[str, Any] = None,
+        with_options: Iterable[LoaderOption] = ()
     ) -> List[ModelType]:
         """
         获取多条记录
@@ -169,25 +273,86 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             order_by: 排序字段
             order_desc: 是否降序
             filters: 过滤条件字典
+            with_options: 附加的预加载选项 (与 eager_loads 合并)
         
         Returns:
             模型实例列表
         """
-        query = self.db.query(self.model).filter(self.model.is_deleted == False)
-        
-        # 应用过滤条件
-        if filters:
-            for field, value in filters.items():
-                if value is not None and hasattr(self.model, field):
-                    query = query.filter(getattr(self.model, field) == value)
+        query = self.db.query(self.model).options(
+            *no_lazy(*self.eager_loads, *with_options)
+        ).filter(*self._filter_clauses(filters))
         
         # 排序
-        if hasattr(self.model, order_by):
-            order_column = getattr(self.model, order_by)
+        order_column = self._columns.get(order_by)
+        if order_column is not None:
             query = query.order_by(desc(order_column) if order_desc else asc(order_column))
         
         return query.offset(skip).limit(limit).all()
     
+    def get_multi_mappings(
+        self,
+        fields: Iterable[str],
+        skip: int = 0,
+        limit: Optional[int] = 20,
+        order_by: str = "id",
+        order_desc: bool = True,
+        filters: Dict[str, Any] = None
+    ) -> List[RowMapping]:
+        """
+        获取多条记录的指定列 (只读列表接口用)
+        
+        直接 SELECT 所需列并返回字典行，不构造ORM实例、不进入identity map。
+        
+        Args:
+            fields: 列属性名 (通常取响应模型的字段)
+            skip: 跳过条数
+            limit: 返回条数 (None 不限)
+            order_by: 排序字段
+            order_desc: 是否降序
+            filters: 过滤条件字典
+        
+        Returns:
+            字典行列表
+        """
+        stmt = select(*self._projection(fields)).where(*self._filter_clauses(filters))
+        
+        order_column = self._columns.get(order_by)
+        if order_column is not None:
+            stmt = stmt.order_by(desc(order_column) if order_desc else asc(order_column))
+        
+        return self.db.execute(stmt.offset(skip).limit(limit)).mappings().all()
+    
+    def search(
+        self,
+        keyword: str,
+        field: str = "name",
+        skip: int = 0,
+        limit: int = 20,
+        filters: Dict[str, Any] = None
+    ) -> List[ModelType]:
+        """
+        按字段模糊搜索 (不区分大小写的子串匹配)
+        
+        PostgreSQL上由该字段的 gin_trgm_ops 索引支撑 ILIKE '%关键字%'。
+        
+        Args:
+            keyword: 搜索关键字 (%、_ 按字面匹配)
+            field: 搜索字段名
+            skip: 跳过条数
+            limit: 返回条数
+            filters: 附加的等值过滤条件
+        
+        Returns:
+            模型实例列表
+        """
+        escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = self.db.query(self.model).options(*no_lazy(*self.eager_loads)).filter(
+            self._columns[field].ilike(f"%{escaped}%", escape="\\"),
+            *self._filter_clauses(filters)
+        )
+        
+        return query.order_by(desc(self.model.id)).offset(skip).limit(limit).all()
+    
     def count(self, filters: Dict[str, Any] = None) -> int:
         """
         统计记录数
@@ -198,14 +363,25 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         Returns:
             记录数量
         """
-        query = self.db.query(self.model).filter(self.model.is_deleted == False)
-        
-        if filters:
-            for field, value in filters.items():
-                if value is not None and hasattr(self.model, field):
-                    query = query.filter(getattr(self.model, field) == value)
-        
-        return query.count()
+        # 直接 SELECT count(*) FROM 表 WHERE ...，不经 Query.count() 的子查询包装
+        return self.db.scalar(
+            select(func.count()).select_from(self.model).where(*self._filter_clauses(filters))
+        )
+    
+    def _projection(self, fields: Iterable[str]) -> List[Any]:
+        """按属性名取列并以属性名为标签 (列投影查询用)"""
+        return [getattr(self.model, field).label(field) for field in fields]
+    
+    def _filter_clauses(self, filters: Optional[Dict[str, Any]]) -> List[Any]:
+        """等值过滤条件 (忽略值为None或非映射列的键)"""
+        if not filters:
+            return []
+        columns = self._columns
+        return [
+            columns[field] == value
+            for field, value in filters.items()
+            if value is not None and field in columns
+        ]
     
     def exists(self, id: int) -> bool:
         """
@@ -217,10 +393,25 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         Returns:
             是否存在
         """
-        return self.db.query(self.model).filter(
-            self.model.id == id,
-            self.model.is_deleted == False
-        ).count() > 0
+        return self._exists(self.model.id == id)
+    
+    def exists_by_field(self, field: str, value: Any) -> bool:
+        """
+        检查字段值是否已存在 (唯一性校验用，不加载整行)
+        
+        Args:
+            field: 字段名
+            value: 字段值
+        
+        Returns:
+            是否存在
+        """
+        return self._exists(self._columns[field] == value)
+    
+    def _exists(self, *clauses: Any) -> bool:
+        # EXISTS 命中首行即返回，不必 COUNT 全部匹配行；
+        # exists() 子查询不经软删除过滤，需显式条件
+        return self.db.scalar(select(exists().where(*clauses, self._not_deleted)))
     
     # ========================================================================
     # 更新操作
@@ -250,29 +441,34 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         self.db.commit()
         self.db.refresh(db_obj)
         
-        logger.info(f"更新 {self.model.__name__}: id={id}")
+        logger.info("更新 %s: id=%s", self.model.__name__, id)
         return db_obj
     
     def update_field(self, id: int, field: str, value: Any) -> Optional[ModelType]:
         """
         更新单个字段
         
+        一条 UPDATE ... RETURNING 完成更新并取回整行，不先查询再回写
+        
         Args:
             id: 记录ID
-            field: 字段名
-            value: 新值
+            field: 字段名 (非映射列时不更新)
+            value: 新值 (普通Python值，不支持SQL表达式/子查询)
         
         Returns:
             更新后的模型实例
         """
-        db_obj = self.get(id)
-        if not db_obj:
-            return None
-        
-        if hasattr(db_obj, field):
-            setattr(db_obj, field, value)
-            self.db.commit()
-            self.db.refresh(db_obj)
+        column = self._columns.get(field)
+        if column is None:
+            return self.get(id)
+        
+        db_obj = self.db.scalars(
+            update(self.model)
+            .where(self.model.id == id, self._not_deleted)
+            .values({column: value})
+            .returning(self.model)
+        ).one_or_none()
+        self.db.commit()
         
         return db_obj
     
@@ -303,7 +499,7 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         
         self.db.commit()
         
-        logger.info(f"删除 {self.model.__name__}: id={id}, soft={soft}")
+        logger.info("删除 %s: id=%s, soft=%s", self.model.__name__, id, soft)
         return True
     
     def restore(self, id: int) -> Optional[ModelType]:
@@ -316,7 +512,7 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         Returns:
             恢复后的模型实例
         """
-        db_obj = self.db.query(self.model).filter(
+        db_obj = self.db.query(self.model).execution_options(include_deleted=True).filter(
             self.model.id == id,
             self.model.is_deleted == True
         ).first()
@@ -325,6 +521,6 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             db_obj.restore()
             self.db.commit()
             self.db.refresh(db_obj)
-            logger.info(f"恢复 {self.model.__name__}: id={id}")
+            logger.info("恢复 %s: id=%s", self.model.__name__, id)
         
         return db_obj
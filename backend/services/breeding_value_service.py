@@ -0,0 +1,59 @@
+# ============================================================================
+# 新星肉羊育种系统 - 育种值服务层
+# NovaBreed Sheep System - Breeding Value Service
+#
+# 文件: breeding_value_service.py
+# 功能: 育种值评估结果业务逻辑
+# ============================================================================
+
+from typing import List, Any
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+import logging
+
+from .base import BaseService
+from models.breeding_value import BreedingValueResult
+
+logger = logging.getLogger(__name__)
+
+
+class BreedingValueResultService(BaseService[BreedingValueResult, Any, Any]):
+    """育种值结果服务"""
+    
+    # 单次窗口扫描计算百分位 (0-100, EBV越高排名越高)，替代Python排序+逐行UPDATE
+    _RECOMPUTE_PERCENTILES_SQL = text("""
+        UPDATE breeding_value_results
+        SET percentile_rank = sub.p
+        FROM (
+            SELECT id, 100.0 * percent_rank() OVER (PARTITION BY run_id ORDER BY ebv) AS p
+            FROM breeding_value_results
+            WHERE run_id = :rid
+        ) AS sub
+        WHERE breeding_value_results.id = sub.id
+    """)
+    
+    def __init__(self, db: Session):
+        super().__init__(BreedingValueResult, db)
+    
+    def get_by_run(self, run_id: int) -> List[BreedingValueResult]:
+        """获取某次评估的全部结果 (按EBV降序)"""
+        return self.db.query(BreedingValueResult).filter(
+            BreedingValueResult.run_id == run_id
+        ).order_by(BreedingValueResult.ebv.desc()).all()
+    
+    def recompute_percentiles(self, run_id: int) -> int:
+        """
+        重算某次评估的百分位排名
+        
+        Args:
+            run_id: 评估运行ID
+        
+        Returns:
+            更新的记录数
+        """
+        self.db.flush()
+        result = self.db.execute(self._RECOMPUTE_PERCENTILES_SQL, {"rid": run_id})
+        self.db.commit()
+        
+        logger.info(f"重算百分位排名: run_id={run_id}, rows={result.rowcount}")
+        return result.rowcount
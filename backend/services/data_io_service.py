@@ -6,39 +6,155 @@
 import io
 import csv
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+from itertools import islice
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
 from datetime import datetime
+from decimal import Decimal
 from fastapi import UploadFile, HTTPException
 
+import numpy as np
+import orjson
 import pandas as pd
-from openpyxl import Workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from sqlalchemy import inspect
+from sqlalchemy.exc import SQLAlchemyError
 
 logger = logging.getLogger(__name__)
 
+# 流式导出每批从服务端游标读取的行数
+EXPORT_BATCH_SIZE = 5000
+
+# 流式导入每批插入的行数，单批估算大小超过 IMPORT_MAX_BATCH_BYTES 时提前截断 (宽行)
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_BATCH_BYTES = 10 * 1024 * 1024
+
+# 流式导出格式及对应的媒体类型
+STREAM_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# 模板/导出表头样式 (不可变，模块级共享，避免每次请求重建)
+_HEADER_FILL = PatternFill(start_color='1890FF', end_color='1890FF', fill_type='solid')
+_HEADER_FONT = Font(color='FFFFFF', bold=True)
+_CENTER = Alignment(horizontal='center')
+_REQ_FILL = PatternFill(start_color='FFCCC7', end_color='FFCCC7', fill_type='solid')
+
+# 导入模板的示例数据行 (按必填列顺序)
+_TEMPLATE_SAMPLES = {
+    'farms': [1, 'FARM001', '示范羊场', 'breeding', 1000],
+}
+
+
+def _json_default(value: Any) -> Any:
+    """orjson 不支持的类型转换"""
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _is_positive_int(s: pd.Series) -> pd.Series:
+    """正整数 (非数值、小数均不合规，不抛异常)"""
+    n = pd.to_numeric(s, errors='coerce')
+    return (n > 0) & (n % 1 == 0)
+
+
+def _is_number(s: pd.Series) -> pd.Series:
+    """数值 (空值、非数值不合规，不抛异常)"""
+    return pd.to_numeric(s, errors='coerce').notna()
+
+
+@lru_cache(maxsize=None)
+def _build_template(entity_type: str, required_columns: Tuple[str, ...],
+                    optional_columns: Tuple[str, ...]) -> bytes:
+    """
+    生成导入模板文件内容
+
+    模板只取决于实体的列配置，按配置缓存生成的字节，重复下载不再重建工作簿
+    """
+    columns = required_columns + optional_columns
+    
+    wb = Workbook()
+    ws = wb.active
+    ws.title = '数据模板'
+    
+    # 添加表头、必填标识行、示例数据 (整行追加)，再统一设置样式
+    ws.append(columns)
+    ws.append(['必填' if col in required_columns else '选填' for col in columns])
+    sample = _TEMPLATE_SAMPLES.get(entity_type)
+    if sample:
+        ws.append(sample)
+    
+    for cell in ws[1]:
+        cell.fill = _HEADER_FILL
+        cell.font = _HEADER_FONT
+        cell.alignment = _CENTER
+        ws.column_dimensions[cell.column_letter].width = 15
+    
+    for cell in ws[2]:
+        if cell.value == '必填':
+            cell.fill = _REQ_FILL
+        cell.alignment = _CENTER
+    
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
 
 class DataImportExportService:
     """数据导入导出服务"""
     
     # 实体配置
+    # column_map: 模板列名 -> 模型列名 (同名列不必列出)
+    # value_maps: 按模板列替换取值 (如 M/F -> male/female)
+    # validators: 按整列向量化执行，输入Series，返回布尔Series (True为合规)，不得抛异常
+    # messages: 对应列不合规时的提示
     ENTITY_CONFIGS = {
         'farms': {
             'model': 'Farm',
-            'required_columns': ['code', 'name', 'farm_type', 'capacity'],
+            'required_columns': ['organization_id', 'code', 'name', 'farm_type', 'capacity'],
             'optional_columns': ['address', 'contact_person', 'contact_phone'],
+            'column_map': {
+                'contact_person': 'manager_name',
+                'contact_phone': 'manager_phone',
+            },
             'validators': {
-                'code': lambda x: len(str(x)) <= 50,
-                'name': lambda x: len(str(x)) <= 100,
-                'farm_type': lambda x: x in ['breeding', 'commercial', 'research'],
-                'capacity': lambda x: int(x) > 0,
+                'organization_id': _is_positive_int,
+                'code': lambda s: s.astype(str).str.len() <= 50,
+                'name': lambda s: s.astype(str).str.len() <= 100,
+                'farm_type': lambda s: s.isin(['breeding', 'commercial', 'research']),
+                'capacity': _is_positive_int,
+            },
+            'messages': {
+                'organization_id': '不是正整数',
+                'code': '超过50个字符',
+                'name': '超过100个字符',
+                'farm_type': '不是 breeding/commercial/research 之一',
+                'capacity': '不是正整数',
             }
         },
         'animals': {
             'model': 'Animal',
-            'required_columns': ['animal_id', 'farm_id', 'birth_date', 'gender'],
-            'optional_columns': ['sire_id', 'dam_id', 'breed', 'status'],
+            'required_columns': ['animal_id', 'organization_id', 'farm_id', 'breed', 'birth_date', 'gender'],
+            'optional_columns': ['sire_id', 'dam_id', 'status'],
+            'column_map': {
+                'animal_id': 'animal_code',
+                'farm_id': 'current_farm_id',
+                'gender': 'sex',
+            },
+            'value_maps': {
+                'gender': {'M': 'male', 'F': 'female'},
+            },
             'validators': {
-                'gender': lambda x: x in ['male', 'female', 'M', 'F'],
+                'organization_id': _is_positive_int,
+                'gender': lambda s: s.isin(['male', 'female', 'M', 'F']),
+            },
+            'messages': {
+                'organization_id': '不是正整数',
+                'gender': '不是 male/female/M/F 之一',
             }
         },
         'phenotypes': {
@@ -46,7 +162,10 @@ class DataImportExportService:
             'required_columns': ['animal_id', 'trait_code', 'value', 'measure_date'],
             'optional_columns': ['age_days', 'notes'],
             'validators': {
-                'value': lambda x: isinstance(float(x), float),
+                'value': _is_number,
+            },
+            'messages': {
+                'value': '不是数值',
             }
         },
         'genotypes': {
@@ -54,7 +173,10 @@ class DataImportExportService:
             'required_columns': ['animal_id', 'snp_id', 'genotype'],
             'optional_columns': [],
             'validators': {
-                'genotype': lambda x: x in ['AA', 'AB', 'BA', 'BB', '0', '1', '2'],
+                'genotype': lambda s: s.astype(str).isin(['AA', 'AB', 'BA', 'BB', '0', '1', '2']),
+            },
+            'messages': {
+                'genotype': '不是有效基因型',
             }
         },
     }
@@ -86,40 +208,23 @@ class DataImportExportService:
         await file.seek(0)
         
         try:
-            if file.filename.endswith('.xlsx'):
-                df = pd.read_excel(io.BytesIO(content), nrows=max_rows)
-            elif file.filename.endswith('.csv'):
-                df = pd.read_csv(io.BytesIO(content), nrows=max_rows)
-            else:
-                raise HTTPException(status_code=400, detail="不支持的文件格式")
+            records = list(islice(self._iter_records(content, file.filename), max_rows))
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"文件解析失败: {str(e)}")
         
+        df = pd.DataFrame.from_records(records)
+        
         # 检查必填列
         missing_columns = [col for col in config['required_columns'] if col not in df.columns]
         
         # 验证数据
-        errors = []
-        for idx, row in df.iterrows():
-            for col, validator in config.get('validators', {}).items():
-                if col in df.columns:
-                    try:
-                        if not validator(row[col]):
-                            errors.append({
-                                'row': idx + 2,  # Excel行号从1开始，加表头
-                                'column': col,
-                                'error': f'值 "{row[col]}" 不符合验证规则'
-                            })
-                    except Exception as e:
-                        errors.append({
-                            'row': idx + 2,
-                            'column': col,
-                            'error': str(e)
-                        })
+        errors, _ = self._validate_frame(config, df, 2)  # Excel行号从1开始，加表头
         
         return {
-            'data': df.to_dict('records'),
-            'total_rows': len(df),
+            'data': records,
+            'total_rows': len(records),
             'columns': list(df.columns),
             'missing_columns': missing_columns,
             'errors': errors[:50],  # 最多返回50个错误
@@ -130,43 +235,87 @@ class DataImportExportService:
         self, 
         file: UploadFile, 
         entity_type: str,
-        db_session: Any
+        db_session: Any,
+        batch_size: int = IMPORT_BATCH_SIZE
     ) -> Dict[str, Any]:
         """
         导入数据到数据库
         
+        逐行流式读取并校验，校验通过的行每 batch_size 条经 BaseModel.bulk_insert
+        合并为一次多行INSERT；内存占用与文件行数无关。
+        不合规的行跳过并记入错误；整个文件在同一事务中写入，
+        任一批入库失败则全部回滚。
+        
         Args:
             file: 上传的文件
             entity_type: 实体类型
             db_session: 数据库会话
+            batch_size: 每批插入行数
             
         Returns:
             导入结果统计
         """
-        preview = await self.preview_file(file, entity_type, max_rows=None)
+        if entity_type not in self.ENTITY_CONFIGS:
+            raise HTTPException(status_code=400, detail=f"不支持的实体类型: {entity_type}")
         
-        if not preview['is_valid']:
-            return {
-                'success': 0,
-                'failed': len(preview['data']),
-                'errors': preview['errors']
-            }
+        config = self.ENTITY_CONFIGS[entity_type]
+        model = self._resolve_model(config)
+        mapping = self._column_mapping(config, model)
+        value_maps = config.get('value_maps', {})
+        
+        content = await file.read()
+        await file.seek(0)
         
         success_count = 0
         failed_count = 0
         errors = []
+        row_number = 1
+        first_row = 2
+        valid_rows = []
         
-        for idx, record in enumerate(preview['data']):
-            try:
-                # 这里实际应该插入数据库
-                # await self._insert_record(entity_type, record, db_session)
-                success_count += 1
-            except Exception as e:
-                failed_count += 1
-                errors.append({
-                    'row': idx + 2,
-                    'error': str(e)
-                })
+        try:
+            for batch in self._iter_batches(self._iter_records(content, file.filename), batch_size):
+                if row_number == 1:
+                    missing_columns = [col for col in config['required_columns'] if col not in batch[0]]
+                    if missing_columns:
+                        return {
+                            'success': 0,
+                            'failed': 0,
+                            'errors': [{'row': 1, 'error': f'缺少必填列: {", ".join(missing_columns)}'}]
+                        }
+                
+                first_row = row_number + 1
+                row_number += len(batch)
+                batch_errors, invalid = self._validate_frame(config, pd.DataFrame.from_records(batch), first_row)
+                failed_count += int(invalid.sum())
+                errors.extend(batch_errors)
+                valid_rows = [
+                    {
+                        mapping[k]: value_maps[k].get(v, v) if k in value_maps else v
+                        for k, v in row.items() if k in mapping
+                    }
+                    for row, bad in zip(batch, invalid) if not bad
+                ]
+                
+                model.bulk_insert(db_session, valid_rows)
+                success_count += len(valid_rows)
+                valid_rows = []
+            
+            db_session.commit()
+        except HTTPException:
+            db_session.rollback()
+            raise
+        except SQLAlchemyError as e:
+            db_session.rollback()
+            logger.error(f"导入失败已回滚: {entity_type}, 第{first_row}-{row_number}行: {e}")
+            return {
+                'success': 0,
+                'failed': failed_count + success_count + len(valid_rows),
+                'errors': [{'row': f'{first_row}-{row_number}', 'error': str(e)}] + errors[:49]
+            }
+        except Exception as e:
+            db_session.rollback()
+            raise HTTPException(status_code=400, detail=f"文件解析失败: {str(e)}")
         
         logger.info(f"导入完成: {entity_type}, 成功: {success_count}, 失败: {failed_count}")
         
@@ -176,6 +325,152 @@ class DataImportExportService:
             'errors': errors[:50]
         }
     
+    @staticmethod
+    def _resolve_model(config: Dict[str, Any]) -> Any:
+        """按实体配置的模型名取ORM模型"""
+        import models
+        
+        model = getattr(models, config['model'], None)
+        if model is None:
+            raise HTTPException(status_code=400, detail=f"暂不支持导入: {config['model']}")
+        return model
+    
+    @staticmethod
+    def _column_mapping(config: Dict[str, Any], model: Any) -> Dict[str, str]:
+        """
+        模板列 -> 模型属性名
+        
+        模板列映射不到模型列、或模型必填列(非空且无默认值)未被模板覆盖时
+        返回400，而不是静默丢弃后在入库时违反非空约束。
+        文件中模板以外的列不导入。
+        """
+        mapper = inspect(model)
+        attributes = {
+            column.name: mapper.get_property_by_column(column).key
+            for column in model.__table__.columns
+        }
+        column_map = config.get('column_map', {})
+        template = config['required_columns'] + config.get('optional_columns', [])
+        targets = {header: column_map.get(header, header) for header in template}
+        
+        unmapped = [header for header, column in targets.items() if column not in attributes]
+        uncovered = [
+            column.name for column in model.__table__.columns
+            if not column.nullable and not column.primary_key
+            and column.default is None and column.server_default is None
+            and column.name not in targets.values()
+        ]
+        if unmapped or uncovered:
+            problems = []
+            if unmapped:
+                problems.append(f"模板列无对应字段: {', '.join(unmapped)}")
+            if uncovered:
+                problems.append(f"必填字段无对应模板列: {', '.join(uncovered)}")
+            raise HTTPException(status_code=400, detail=f"导入配置错误 ({config['model']}): {'; '.join(problems)}")
+        
+        return {header: attributes[column] for header, column in targets.items()}
+    
+    @staticmethod
+    def _validate_frame(
+        config: Dict[str, Any],
+        df: pd.DataFrame,
+        first_row: int
+    ) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """
+        按列向量化执行验证器
+        
+        Args:
+            config: 实体配置
+            df: 待验证数据
+            first_row: df 首行对应的文件行号
+            
+        Returns:
+            (错误列表, 每行是否不合规的布尔数组)
+        """
+        errors = []
+        invalid = np.zeros(len(df), dtype=bool)
+        messages = config.get('messages', {})
+        for col, validator in config.get('validators', {}).items():
+            if col not in df.columns:
+                continue
+            series = df[col]
+            mask = ~validator(series).fillna(False).to_numpy(dtype=bool)
+            
+            positions = np.flatnonzero(mask)
+            if not len(positions):
+                continue
+            invalid |= mask
+            values = series.iloc[positions].tolist()
+            message = messages.get(col, '不符合验证规则')
+            errors.extend(
+                {
+                    'row': first_row + int(pos),
+                    'column': col,
+                    'error': f'值 "{value}" {message}'
+                }
+                for pos, value in zip(positions, values)
+            )
+        errors.sort(key=lambda error: error['row'])
+        return errors, invalid
+    
+    @staticmethod
+    def _iter_records(content: bytes, filename: str) -> Iterator[Dict[str, Any]]:
+        """
+        逐行读取文件为字典 (键为表头)
+        
+        CSV按 IMPORT_BATCH_SIZE 分块解析，XLSX以只读模式逐行读取，
+        均不会把整个文件展开为DataFrame
+        """
+        if filename.endswith('.csv'):
+            for chunk in pd.read_csv(io.BytesIO(content), chunksize=IMPORT_BATCH_SIZE):
+                # 空单元格 NaN -> None，便于直接入库
+                chunk = chunk.astype(object).where(chunk.notna(), None)
+                yield from chunk.to_dict('records')
+        elif filename.endswith('.xlsx'):
+            yield from DataImportExportService._iter_xlsx(content)
+        else:
+            raise HTTPException(status_code=400, detail="不支持的文件格式")
+    
+    @staticmethod
+    def _iter_xlsx(content: bytes) -> Iterator[Dict[str, Any]]:
+        """
+        只读模式逐行读取工作簿首个工作表
+        
+        首行为表头；空表头的列丢弃，整行为空的行跳过
+        """
+        wb = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            # 按列位置取值，空表头列在中间时不致错位
+            positions = [idx for idx, col in enumerate(header) if col is not None]
+            names = [str(header[idx]) for idx in positions]
+            width = len(header)
+            for values in rows:
+                if len(values) < width:
+                    values = values + (None,) * (width - len(values))
+                if any(value is not None for value in values):
+                    yield {name: values[idx] for name, idx in zip(names, positions)}
+        finally:
+            wb.close()
+    
+    @staticmethod
+    def _iter_batches(records: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """按行数分批；宽行按估算字节数提前截断，单批不超过 IMPORT_MAX_BATCH_BYTES"""
+        batch = []
+        batch_bytes = 0
+        for record in records:
+            batch.append(record)
+            batch_bytes += sum(len(str(value)) for value in record.values())
+            if len(batch) >= batch_size or batch_bytes >= IMPORT_MAX_BATCH_BYTES:
+                yield batch
+                batch = []
+                batch_bytes = 0
+        if batch:
+            yield batch
+    
     async def export_data(
         self, 
         entity_type: str, 
@@ -201,36 +496,90 @@ class DataImportExportService:
             {'id': 2, 'code': 'FARM002', 'name': '示范羊场2', 'farm_type': 'commercial', 'capacity': 2000},
         ]
         
-        df = pd.DataFrame(sample_data)
+        columns = list(sample_data[0]) if sample_data else []
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         if format == 'xlsx':
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='数据')
-                
-                # 美化Excel
-                ws = writer.sheets['数据']
-                header_fill = PatternFill(start_color='1890FF', end_color='1890FF', fill_type='solid')
-                header_font = Font(color='FFFFFF', bold=True)
-                
-                for cell in ws[1]:
-                    cell.fill = header_fill
-                    cell.font = header_font
-                    cell.alignment = Alignment(horizontal='center')
+            # 只写模式逐行追加，不在内存中保留完整单元格对象
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet('数据')
+            
+            # 美化Excel
+            header_cells = []
+            for col_name in columns:
+                cell = WriteOnlyCell(ws, value=col_name)
+                cell.fill = _HEADER_FILL
+                cell.font = _HEADER_FONT
+                cell.alignment = _CENTER
+                header_cells.append(cell)
+            ws.append(header_cells)
             
-            output.seek(0)
+            for row in sample_data:
+                ws.append(list(row.values()))
+            
+            output = io.BytesIO()
+            wb.save(output)
             return output.getvalue(), f'{entity_type}_export_{timestamp}.xlsx'
         
         elif format == 'csv':
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            return output.getvalue().encode('utf-8-sig'), f'{entity_type}_export_{timestamp}.csv'
+            # 直接写入字节缓冲 (带BOM，兼容Excel打开中文)
+            output = io.BytesIO()
+            text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='', write_through=True)
+            writer = csv.writer(text)
+            writer.writerow(columns)
+            writer.writerows(row.values() for row in sample_data)
+            text.detach()
+            return output.getvalue(), f'{entity_type}_export_{timestamp}.csv'
         
         else:
             raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
     
+    def stream_export(
+        self,
+        stmt: Any,
+        format: str,
+        db_session: Any
+    ) -> Iterator[bytes]:
+        """
+        流式导出查询结果
+        
+        通过服务端游标分批读取 (yield_per)，逐批编码输出，
+        内存占用与总行数无关
+        
+        Args:
+            stmt: SQLAlchemy Core select 语句
+            format: 导出格式 (ndjson, csv)
+            db_session: 数据库会话
+            
+        Returns:
+            字节块迭代器，可直接交给 StreamingResponse
+        """
+        if format not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
+        
+        result = db_session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columns = [str(key) for key in result.keys()]  # quoted_name -> str, orjson只接受纯str键
+        
+        if format == 'ndjson':
+            for rows in result.partitions():
+                yield b''.join(
+                    orjson.dumps(dict(zip(columns, row)), default=_json_default) + b'\n'
+                    for row in rows
+                )
+        else:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            buffer.write('\ufeff')  # BOM, 兼容Excel打开中文
+            writer.writerow(columns)
+            for rows in result.partitions():
+                writer.writerows(rows)
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode('utf-8')
+    
     def generate_template(self, entity_type: str) -> Tuple[bytes, str]:
         """
         生成导入模板
@@ -245,49 +594,12 @@ class DataImportExportService:
             raise HTTPException(status_code=400, detail=f"不支持的实体类型: {entity_type}")
         
         config = self.ENTITY_CONFIGS[entity_type]
-        columns = config['required_columns'] + config.get('optional_columns', [])
-        
-        wb = Workbook()
-        ws = wb.active
-        ws.title = '数据模板'
-        
-        # 添加表头
-        header_fill = PatternFill(start_color='1890FF', end_color='1890FF', fill_type='solid')
-        header_font = Font(color='FFFFFF', bold=True)
-        
-        for col_idx, col_name in enumerate(columns, 1):
-            cell = ws.cell(row=1, column=col_idx, value=col_name)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-            ws.column_dimensions[cell.column_letter].width = 15
-        
-        # 添加必填标识行
-        required_row = []
-        for col in columns:
-            if col in config['required_columns']:
-                required_row.append('必填')
-            else:
-                required_row.append('选填')
-        
-        for col_idx, value in enumerate(required_row, 1):
-            cell = ws.cell(row=2, column=col_idx, value=value)
-            if value == '必填':
-                cell.fill = PatternFill(start_color='FFCCC7', end_color='FFCCC7', fill_type='solid')
-            cell.alignment = Alignment(horizontal='center')
-        
-        # 添加示例数据
-        if entity_type == 'farms':
-            ws.cell(row=3, column=1, value='FARM001')
-            ws.cell(row=3, column=2, value='示范羊场')
-            ws.cell(row=3, column=3, value='breeding')
-            ws.cell(row=3, column=4, value=1000)
-        
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        return output.getvalue(), f'{entity_type}_template.xlsx'
+        content = _build_template(
+            entity_type,
+            tuple(config['required_columns']),
+            tuple(config.get('optional_columns', []))
+        )
+        return content, f'{entity_type}_template.xlsx'
 
 
 # 创建服务实例
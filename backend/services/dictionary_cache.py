@@ -0,0 +1,186 @@
+# ============================================================================
+# 新星肉羊育种系统 - 字典表缓存
+# NovaBreed Sheep System - Dictionary Cache
+#
+# 文件: dictionary_cache.py
+# 功能: 饲料类型/疾病/疫苗类型等小字典表的Redis读缓存
+# ============================================================================
+
+from typing import Any, Dict, List, Optional, Set, Type
+from sqlalchemy import event
+from sqlalchemy.orm import Session, ORMExecuteState, object_session
+import logging
+import orjson
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_redis_client = None
+
+
+def get_redis_client():
+    """获取共享Redis客户端 (首次使用时连接)"""
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.DICTIONARY_CACHE_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.DICTIONARY_CACHE_SOCKET_TIMEOUT,
+        )
+    return _redis_client
+
+
+class DictionaryCache:
+    """
+    字典表读缓存
+
+    每张表按 id 与代码各存一个Redis哈希 (dict:<表名>:id / dict:<表名>:<代码列>)，
+    值为行字典(JSON)；lists 声明的具名列表(如"需报告疾病")整体存于 dict:<表名>:list。
+    多进程共享同一份缓存，整表失效只需删除三个key。
+    ORM提交后自动失效 (watch)，含 update(模型)/delete(模型) 的ORM批量语句；
+    直接对 Table 执行的Core语句需自行调用 invalidate。
+    Redis不可用时直接查库。
+    """
+
+    def __init__(self, model: Type, code_field: str, client: Any = None, lists: Optional[Dict[str, Any]] = None):
+        self.model = model
+        self.code_field = code_field
+        self._client = client
+        self._lists = dict(lists or {})
+        table = model.__tablename__
+        self._id_key = f"dict:{table}:id"
+        self._code_key = f"dict:{table}:{code_field}"
+        self._list_key = f"dict:{table}:list"
+
+    @property
+    def client(self):
+        if self._client is None and settings.DICTIONARY_CACHE_ENABLED:
+            self._client = get_redis_client()
+        return self._client
+
+    def get(self, db: Session, id: int) -> Optional[Dict[str, Any]]:
+        """按ID获取行字典"""
+        return self._get(db, self._id_key, self.model.id, id)
+
+    def get_by_code(self, db: Session, code: str) -> Optional[Dict[str, Any]]:
+        """按代码获取行字典"""
+        return self._get(db, self._code_key, getattr(self.model, self.code_field), code)
+
+    def get_list(self, db: Session, name: str) -> List[Dict[str, Any]]:
+        """获取具名列表 (行字典列表，每次调用返回新对象)"""
+        client = self.client
+        if client is not None:
+            try:
+                cached = client.hget(self._list_key, name)
+                if cached is not None:
+                    return orjson.loads(cached)
+            except Exception as e:
+                logger.warning(f"字典缓存读取失败 {self._list_key}: {e}")
+                client = None
+
+        objs = db.query(self.model).filter(
+            self._lists[name],
+            self.model.is_deleted == False
+        ).all()
+        payload = orjson.dumps([obj.to_dict() for obj in objs], default=str)
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                pipe.hset(self._list_key, name, payload)
+                pipe.expire(self._list_key, settings.DICTIONARY_CACHE_TTL)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"字典缓存写入失败 {self._list_key}: {e}")
+        return orjson.loads(payload)
+
+    def invalidate(self) -> None:
+        """清空整表缓存"""
+        if self.client is None:
+            return
+        try:
+            self.client.delete(self._id_key, self._code_key, self._list_key)
+        except Exception as e:
+            logger.warning(f"字典缓存失效失败 {self.model.__tablename__}: {e}")
+
+    def watch(self) -> "DictionaryCache":
+        """登记ORM写入后自动失效: 刷新时标记表，事务提交后再删缓存，避免提交前被旧值回填"""
+        _WATCHED[self.model.__tablename__] = self
+        for event_name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(self.model, event_name, _mark_dirty)
+        return self
+
+    def _get(self, db: Session, key: str, column, value) -> Optional[Dict[str, Any]]:
+        client = self.client
+        field = str(value)
+        if client is not None:
+            try:
+                cached = client.hget(key, field)
+                if cached is not None:
+                    return orjson.loads(cached)
+            except Exception as e:
+                logger.warning(f"字典缓存读取失败 {key}: {e}")
+                client = None
+
+        obj = db.query(self.model).filter(
+            column == value,
+            self.model.is_deleted == False
+        ).first()
+        if obj is None:
+            return None
+
+        row = orjson.loads(orjson.dumps(obj.to_dict(), default=str))
+        if client is not None:
+            try:
+                payload = orjson.dumps(row)
+                pipe = client.pipeline()
+                pipe.hset(self._id_key, str(row['id']), payload)
+                pipe.hset(self._code_key, str(row[self.code_field]), payload)
+                pipe.expire(self._id_key, settings.DICTIONARY_CACHE_TTL)
+                pipe.expire(self._code_key, settings.DICTIONARY_CACHE_TTL)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"字典缓存写入失败 {key}: {e}")
+        return row
+
+
+# ============================================================================
+# 提交后失效
+# Invalidation On Commit
+# ============================================================================
+
+_WATCHED: Dict[str, DictionaryCache] = {}
+
+
+def _mark_table_dirty(session: Session, table: str) -> None:
+    dirty: Set[str] = session.info.setdefault('dictionary_cache_dirty', set())
+    dirty.add(table)
+
+
+def _mark_dirty(mapper, connection, target) -> None:
+    session = object_session(target)
+    if session is not None:
+        _mark_table_dirty(session, target.__tablename__)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_dirty_on_bulk_write(orm_execute_state: ORMExecuteState) -> None:
+    """ORM批量 UPDATE/DELETE (如 update_field 的 UPDATE ... RETURNING) 不触发映射器事件，按语句标记"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and getattr(mapper.class_, '__tablename__', None) in _WATCHED:
+        _mark_table_dirty(orm_execute_state.session, mapper.class_.__tablename__)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session: Session) -> None:
+    dirty = session.info.pop('dictionary_cache_dirty', None)
+    for table in dirty or ():
+        _WATCHED[table].invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop('dictionary_cache_dirty', None)
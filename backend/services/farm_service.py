@@ -6,17 +6,21 @@
 # 功能: 羊场、羊舍业务逻辑
 # ============================================================================
 
-from typing import Optional, List, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+from itertools import groupby
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, select, update
 from datetime import datetime, date
 import logging
 
-from .base import BaseService
+from .base import BaseService, request_cached
 from models.farm import Farm, Barn, AnimalLocation
 
 logger = logging.getLogger(__name__)
 
+# 流式读取在舍记录时每批从服务端游标取回的行数
+STREAM_BATCH_SIZE = 500
+
 
 class FarmService(BaseService[Farm, Any, Any]):
     """
@@ -25,6 +29,9 @@ class FarmService(BaseService[Farm, Any, Any]):
     处理羊场相关的业务逻辑
     """
     
+    # 显式预加载羊舍: raiseload('*') 会覆盖模型上的 lazy='selectin'
+    eager_loads = (selectinload(Farm.barns),)
+    
     def __init__(self, db: Session):
         super().__init__(Farm, db)
     
@@ -45,6 +52,23 @@ class FarmService(BaseService[Farm, Any, Any]):
             filters={"organization_id": organization_id}
         )
     
+    def get_by_metadata(
+        self,
+        criteria: Dict[str, Any],
+        skip: int = 0,
+        limit: int = 20
+    ) -> List[Farm]:
+        """
+        按扩展元数据筛选羊场
+        
+        使用 @> 包含查询以命中 ix_farms_metadata_gin，
+        勿改写为 metadata_['key'].astext == v (-> 运算符不走GIN索引)
+        """
+        return self.db.query(Farm).filter(
+            Farm.metadata_.contains(criteria),
+            Farm.is_deleted == False
+        ).offset(skip).limit(limit).all()
+    
     def get_dashboard(self, farm_id: int) -> Dict[str, Any]:
         """
         获取羊场仪表板数据
@@ -52,32 +76,42 @@ class FarmService(BaseService[Farm, Any, Any]):
         Returns:
             包含各项统计指标的字典
         """
-        farm = self.get_or_404(farm_id)
-        
-        # 统计羊舍数量
-        barn_count = self.db.query(Barn).filter(
-            Barn.farm_id == farm_id,
+        # 羊场字段与羊舍数、当前在舍动物数一次查询取回 (计数用关联子查询，避免两次JOIN行数相乘)
+        barns = select(func.count(Barn.id)).where(
+            Barn.farm_id == Farm.id,
             Barn.is_deleted == False
-        ).count()
+        ).scalar_subquery()
         
-        # 统计当前在舍动物
-        current_locations = self.db.query(AnimalLocation).filter(
-            AnimalLocation.farm_id == farm_id,
+        animals = select(func.count(AnimalLocation.id)).where(
+            AnimalLocation.farm_id == Farm.id,
             AnimalLocation.exit_date == None
-        )
+        ).scalar_subquery()
         
-        total_animals = current_locations.count()
+        farm = self.db.execute(
+            select(
+                Farm.name,
+                Farm.capacity,
+                Farm.status,
+                barns.label("barns_count"),
+                animals.label("total_animals")
+            ).where(
+                Farm.id == farm_id,
+                Farm.is_deleted == False
+            )
+        ).first()
+        if farm is None:
+            raise ValueError(f"Farm not found with id={farm_id}")
         
         # 计算存栏率
         capacity_usage = 0.0
         if farm.capacity and farm.capacity > 0:
-            capacity_usage = (total_animals / farm.capacity) * 100
+            capacity_usage = (farm.total_animals / farm.capacity) * 100
         
         return {
             "farm_id": farm_id,
             "farm_name": farm.name,
-            "total_animals": total_animals,
-            "barns_count": barn_count,
+            "total_animals": farm.total_animals,
+            "barns_count": farm.barns_count,
             "capacity": farm.capacity or 0,
             "capacity_usage": round(capacity_usage, 2),
             "status": farm.status
@@ -87,19 +121,46 @@ class FarmService(BaseService[Farm, Any, Any]):
         """
         更新羊场存栏量
         
-        基于当前在舍动物重新计算
+        基于当前在舍动物重新计算 (一条 UPDATE ... RETURNING，不加载羊场整行)
         """
-        count = self.db.query(AnimalLocation).filter(
+        count = select(func.count(AnimalLocation.id)).where(
             AnimalLocation.farm_id == farm_id,
             AnimalLocation.exit_date == None
-        ).count()
+        ).scalar_subquery()
+        
+        stock = self.db.execute(
+            update(Farm)
+            .where(Farm.id == farm_id, Farm.is_deleted == False)
+            .values(current_stock=count)
+            .returning(Farm.current_stock)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        self.db.commit()
+        
+        return stock or 0
+    
+    def reconcile_stock_counts(self) -> int:
+        """
+        按当前在舍记录全量校正羊场存栏量 (一条 UPDATE，相关子查询按羊场计数)
+        
+        Returns:
+            被修正的羊场数
+        """
+        actual = select(func.count(AnimalLocation.id)).where(
+            AnimalLocation.farm_id == Farm.id,
+            AnimalLocation.exit_date == None
+        ).scalar_subquery()
         
-        farm = self.get(farm_id)
-        if farm:
-            farm.current_stock = count
-            self.db.commit()
+        result = self.db.execute(
+            update(Farm)
+            .where(Farm.is_deleted == False, Farm.current_stock != actual)
+            .values(current_stock=actual)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
         
-        return count
+        logger.info("羊场存栏校正: %d 个", result.rowcount)
+        return result.rowcount
 
 
 class BarnService(BaseService[Barn, Any, Any]):
@@ -114,8 +175,9 @@ class BarnService(BaseService[Barn, Any, Any]):
         """获取羊场下的所有羊舍"""
         return self.get_multi(filters={"farm_id": farm_id}, limit=100)
     
+    @request_cached
     def get_by_code(self, farm_id: int, code: str) -> Optional[Barn]:
-        """根据代码获取羊舍"""
+        """根据代码获取羊舍 (同一会话内重复查询走缓存)"""
         return self.db.query(Barn).filter(
             Barn.farm_id == farm_id,
             Barn.code == code,
@@ -123,25 +185,57 @@ class BarnService(BaseService[Barn, Any, Any]):
         ).first()
     
     def update_count(self, barn_id: int) -> int:
-        """更新羊舍当前数量"""
-        count = self.db.query(AnimalLocation).filter(
+        """更新羊舍当前数量 (一条 UPDATE ... RETURNING，不加载羊舍整行)"""
+        count = select(func.count(AnimalLocation.id)).where(
             AnimalLocation.barn_id == barn_id,
             AnimalLocation.exit_date == None
-        ).count()
+        ).scalar_subquery()
         
-        barn = self.get(barn_id)
-        if barn:
-            barn.current_count = count
-            self.db.commit()
+        current = self.db.execute(
+            update(Barn)
+            .where(Barn.id == barn_id, Barn.is_deleted == False)
+            .values(current_count=count)
+            .returning(Barn.current_count)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        self.db.commit()
         
-        return count
+        return current or 0
+    
+    def reconcile_counts(self) -> int:
+        """
+        按当前在舍记录全量校正羊舍数量
+        
+        assign_to_barn 只做增量计数，此方法用于定时纠正偏差
+        
+        Returns:
+            被修正的羊舍数
+        """
+        actual = select(func.count(AnimalLocation.id)).where(
+            AnimalLocation.barn_id == Barn.id,
+            AnimalLocation.exit_date == None
+        ).scalar_subquery()
+        
+        result = self.db.execute(
+            update(Barn)
+            .where(Barn.is_deleted == False, Barn.current_count != actual)
+            .values(current_count=actual)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        
+        logger.info("羊舍数量校正: %d 个", result.rowcount)
+        return result.rowcount
     
     def is_full(self, barn_id: int) -> bool:
-        """检查羊舍是否已满"""
-        barn = self.get(barn_id)
-        if barn:
-            return barn.current_count >= barn.capacity
-        return True
+        """检查羊舍是否已满 (羊舍不存在视为已满)"""
+        full = self.db.scalar(
+            select(Barn.current_count >= Barn.capacity).where(
+                Barn.id == barn_id,
+                Barn.is_deleted == False
+            )
+        )
+        return full is None or bool(full)
     
     def get_available_barns(self, farm_id: int, barn_type: str = None) -> List[Barn]:
         """获取有空位的羊舍"""
@@ -154,9 +248,42 @@ class BarnService(BaseService[Barn, Any, Any]):
         if barn_type:
             query = query.filter(Barn.barn_type == barn_type)
         
-        # 过滤有空位的
-        barns = query.all()
-        return [b for b in barns if b.current_count < b.capacity]
+        # 有空位的 (在SQL中比较，满舍不回传)
+        return query.filter(Barn.current_count < Barn.capacity).all()
+    
+    def get_available_capacity_by_farm(
+        self,
+        farm_ids: List[int],
+        barn_type: str = None
+    ) -> Dict[int, List[Tuple[int, int]]]:
+        """
+        批量获取多个羊场的羊舍空位
+        
+        一次查询取回所有羊场有空位的羊舍，供批量分舍(如导入)在内存中分配，
+        避免逐只调用 get_available_barns
+        
+        Returns:
+            {羊场ID: [(羊舍ID, 空位数), ...]}，无空位的羊场为空列表
+        """
+        capacity: Dict[int, List[Tuple[int, int]]] = {farm_id: [] for farm_id in farm_ids}
+        if not capacity:
+            return capacity
+        
+        query = select(
+            Barn.farm_id, Barn.id, (Barn.capacity - Barn.current_count).label('free')
+        ).where(
+            Barn.farm_id.in_(capacity),
+            Barn.is_deleted == False,
+            Barn.status == 'active',
+            Barn.current_count < Barn.capacity
+        )
+        if barn_type:
+            query = query.where(Barn.barn_type == barn_type)
+        
+        rows = self.db.execute(query.order_by(Barn.farm_id, Barn.id))
+        for farm_id, barns in groupby(rows, key=lambda row: row[0]):
+            capacity[farm_id] = [(barn_id, free) for _, barn_id, free in barns]
+        return capacity
 
 
 class AnimalLocationService(BaseService[AnimalLocation, Any, Any]):
@@ -203,15 +330,19 @@ class AnimalLocationService(BaseService[AnimalLocation, Any, Any]):
         )
         
         self.db.add(location)
-        self.db.commit()
-        self.db.refresh(location)
         
-        # 更新羊舍计数
-        barn_service = BarnService(self.db)
-        barn_service.update_count(barn_id)
+        # 原子增减羊舍计数 (与位置记录同一事务提交；偏差由 reconcile_counts 定时校正)
+        if not current or current.barn_id != barn_id:
+            self.db.execute(
+                update(Barn).where(Barn.id == barn_id).values(current_count=Barn.current_count + 1)
+            )
+            if current:
+                self.db.execute(
+                    update(Barn).where(Barn.id == current.barn_id).values(current_count=Barn.current_count - 1)
+                )
         
-        if current and current.barn_id != barn_id:
-            barn_service.update_count(current.barn_id)
+        self.db.commit()
+        self.db.refresh(location)
         
         return location
     
@@ -239,9 +370,34 @@ class AnimalLocationService(BaseService[AnimalLocation, Any, Any]):
             entry_reason=transfer_reason or "转舍"
         )
     
+    def get_by_farm(
+        self,
+        farm_id: int,
+        skip: int = 0,
+        limit: int = 50
+    ) -> List[AnimalLocation]:
+        """分页获取羊场的位置记录 (按入场时间倒序)"""
+        return self.db.query(AnimalLocation).filter(
+            AnimalLocation.farm_id == farm_id,
+            AnimalLocation.is_deleted == False
+        ).order_by(AnimalLocation.entry_date.desc()).offset(skip).limit(limit).all()
+    
     def get_barn_animals(self, barn_id: int) -> List[AnimalLocation]:
         """获取羊舍中的所有动物"""
         return self.db.query(AnimalLocation).filter(
             AnimalLocation.barn_id == barn_id,
             AnimalLocation.exit_date == None
         ).all()
+    
+    def stream_barn_animals(self, barn_id: int) -> Iterator[AnimalLocation]:
+        """
+        流式获取羊舍中的所有动物
+        
+        通过服务端游标每批取回 STREAM_BATCH_SIZE 行，供只需遍历一次的
+        导出/同步使用，内存占用不随羊舍规模增长；须在会话关闭前遍历完
+        """
+        stmt = select(AnimalLocation).where(
+            AnimalLocation.barn_id == barn_id,
+            AnimalLocation.exit_date == None
+        ).execution_options(yield_per=STREAM_BATCH_SIZE)
+        return self.db.scalars(stmt)
@@ -8,16 +8,22 @@
 
 from typing import Optional, List, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from datetime import datetime, date, timedelta
+from sqlalchemy import func, and_, update, select
+from datetime import date
 from decimal import Decimal
 import logging
 
 from .base import BaseService
-from models.feed import FeedType, FeedFormula, FeedingPlan, FeedingRecord, FeedInventory
+from .dictionary_cache import DictionaryCache
+from models.base import view_refreshed_at
+from models.feed import (
+    FeedType, FeedFormula, FeedFormulaIngredient, FeedingPlan, FeedingRecord, FeedInventory, feeding_stats_daily
+)
 
 logger = logging.getLogger(__name__)
 
+FEED_TYPE_CACHE = DictionaryCache(FeedType, "feed_code", lists={"active": FeedType.is_active == True}).watch()
+
 
 class FeedTypeService(BaseService[FeedType, Any, Any]):
     """饲料类型服务"""
@@ -29,6 +35,14 @@ class FeedTypeService(BaseService[FeedType, Any, Any]):
         """根据代码获取饲料类型"""
         return self.get_by_field("feed_code", code)
     
+    def get_cached(self, id: int) -> Optional[Dict[str, Any]]:
+        """按ID获取饲料类型 (字典缓存，返回行字典)"""
+        return FEED_TYPE_CACHE.get(self.db, id)
+    
+    def get_cached_by_code(self, code: str) -> Optional[Dict[str, Any]]:
+        """按代码获取饲料类型 (字典缓存，返回行字典)"""
+        return FEED_TYPE_CACHE.get_by_code(self.db, code)
+    
     def get_by_category(self, category: str) -> List[FeedType]:
         """根据类别获取饲料列表"""
         return self.get_multi(filters={"category": category}, limit=50)
@@ -39,6 +53,10 @@ class FeedTypeService(BaseService[FeedType, Any, Any]):
             FeedType.is_active == True,
             FeedType.is_deleted == False
         ).all()
+    
+    def get_active_cached(self) -> List[Dict[str, Any]]:
+        """获取在用饲料 (字典缓存，返回行字典列表)"""
+        return FEED_TYPE_CACHE.get_list(self.db, "active")
 
 
 class FeedFormulaService(BaseService[FeedFormula, Any, Any]):
@@ -61,6 +79,16 @@ class FeedFormulaService(BaseService[FeedFormula, Any, Any]):
             FeedFormula.is_active == True,
             FeedFormula.is_deleted == False
         ).all()
+    
+    def get_by_ingredient(self, feed_type_id: int) -> List[FeedFormula]:
+        """获取含指定饲料的配方 (经配方成分表按 feed_type_id 索引关联)"""
+        return self.db.query(FeedFormula).join(
+            FeedFormulaIngredient, FeedFormulaIngredient.formula_id == FeedFormula.id
+        ).filter(
+            FeedFormulaIngredient.feed_type_id == feed_type_id,
+            FeedFormulaIngredient.is_deleted == False,
+            FeedFormula.is_deleted == False
+        ).all()
 
 
 class FeedingPlanService(BaseService[FeedingPlan, Any, Any]):
@@ -97,41 +125,50 @@ class FeedingRecordService(BaseService[FeedingRecord, Any, Any]):
         return self.db.query(FeedingRecord).filter(
             FeedingRecord.barn_id == barn_id,
             FeedingRecord.is_deleted == False
-        ).order_by(FeedingRecord.feeding_datetime.desc()).limit(limit).all()
+        ).order_by(FeedingRecord.feeding_date.desc(), FeedingRecord.feeding_time.desc()).limit(limit).all()
     
     def get_today(self, barn_id: int = None) -> List[FeedingRecord]:
-        """获取今日饲喂记录"""
-        today_start = datetime.combine(date.today(), datetime.min.time())
+        """获取今日饲喂记录 (按分区键 feeding_date 过滤，只扫描当月分区)"""
         query = self.db.query(FeedingRecord).filter(
-            FeedingRecord.feeding_datetime >= today_start,
+            FeedingRecord.feeding_date == date.today(),
             FeedingRecord.is_deleted == False
         )
         if barn_id:
             query = query.filter(FeedingRecord.barn_id == barn_id)
-        return query.order_by(FeedingRecord.feeding_datetime.desc()).all()
+        return query.order_by(FeedingRecord.feeding_time.desc()).all()
     
     def get_statistics(self, farm_id: int = None) -> Dict[str, Any]:
-        """获取饲喂统计"""
-        today = date.today()
-        today_start = datetime.combine(today, datetime.min.time())
-        
-        query = self.db.query(FeedingRecord).filter(FeedingRecord.is_deleted == False)
+        """
+        获取饲喂统计
         
-        total = query.count()
-        today_count = query.filter(FeedingRecord.feeding_datetime >= today_start).count()
+        物化视图 feeding_stats_daily 最近一次刷新日期之前的日期读视图日汇总行，
+        该日期及之后的记录实时聚合 (只扫描对应分区)；视图从未刷新过时全部实时聚合。
+        刷新后补录到更早日期的记录要到下次刷新才计入
+        """
+        today = date.today()
+        is_today = FeedingRecord.feeding_date == today
+        refreshed_at = view_refreshed_at(self.db, 'feeding_stats_daily')
         
-        # 今日饲料消耗
-        today_consumption = self.db.query(
-            func.sum(FeedingRecord.actual_amount)
-        ).filter(
-            FeedingRecord.feeding_datetime >= today_start,
-            FeedingRecord.is_deleted == False
-        ).scalar()
+        query = self.db.query(
+            func.count(FeedingRecord.id).label('recent'),
+            func.count(FeedingRecord.id).filter(is_today).label('today_count'),
+            func.sum(FeedingRecord.actual_amount).filter(is_today).label('today_consumption')
+        ).filter(FeedingRecord.is_deleted == False)
+        if refreshed_at is None:
+            history = 0
+        else:
+            cutoff = refreshed_at.date()
+            history = self.db.scalar(
+                select(func.coalesce(func.sum(feeding_stats_daily.c.record_count), 0))
+                .where(feeding_stats_daily.c.feeding_date < cutoff)
+            )
+            query = query.filter(FeedingRecord.feeding_date >= cutoff)
+        stats = query.one()
         
         return {
-            "total_records": total,
-            "today_feedings": today_count,
-            "today_consumption_kg": round(float(today_consumption or 0), 2)
+            "total_records": int(history) + stats.recent,
+            "today_feedings": stats.today_count,
+            "today_consumption_kg": round(float(stats.today_consumption or 0), 2)
         }
 
 
@@ -145,43 +182,60 @@ class FeedInventoryService(BaseService[FeedInventory, Any, Any]):
         """获取饲料类型的库存"""
         return self.get_by_field("feed_type_id", feed_type_id)
     
+    @staticmethod
+    def _low_stock(threshold: Decimal = None):
+        """低库存条件: 低于给定阈值，未给定时低于最低库存预警 (列表查询与统计共用)"""
+        if threshold:
+            return FeedInventory.current_quantity <= threshold
+        return FeedInventory.current_quantity <= FeedInventory.min_quantity
+    
     def get_low_stock(self, threshold: Decimal = None) -> List[FeedInventory]:
         """获取低库存饲料"""
-        query = self.db.query(FeedInventory).filter(
+        return self.db.query(FeedInventory).filter(
+            self._low_stock(threshold),
             FeedInventory.is_deleted == False
-        )
-        if threshold:
-            query = query.filter(FeedInventory.current_quantity <= threshold)
-        else:
-            # 库存低于安全库存
-            query = query.filter(
-                FeedInventory.current_quantity <= FeedInventory.safety_stock
-            )
-        return query.all()
+        ).all()
     
-    def update_quantity(self, feed_type_id: int, delta: Decimal) -> bool:
-        """更新库存数量"""
-        inventory = self.get_by_feed_type(feed_type_id)
-        if inventory:
-            inventory.current_quantity += delta
-            inventory.last_updated = datetime.now()
-            self.db.commit()
-            return True
-        return False
+    def update_quantity(self, feed_type_id: int, delta: Decimal, farm_id: int) -> bool:
+        """
+        增减库存数量
+        
+        一条 UPDATE current_quantity = current_quantity + :delta 原子完成，
+        并发出入库不会丢失更新；updated_at 由列的 onupdate 刷新
+        
+        Args:
+            feed_type_id: 饲料类型ID
+            delta: 变化量 (入库为正，出库为负)
+            farm_id: 羊场ID (同一饲料在各羊场各有库存，必须指定，否则会改动所有羊场)
+        
+        Returns:
+            是否存在对应库存
+        """
+        stmt = update(FeedInventory).where(
+            FeedInventory.feed_type_id == feed_type_id,
+            FeedInventory.farm_id == farm_id,
+            FeedInventory.is_deleted == False
+        )
+        
+        updated = self.db.execute(
+            stmt.values(current_quantity=FeedInventory.current_quantity + delta)
+            .returning(FeedInventory.id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        self.db.commit()
+        
+        return updated is not None
     
     def get_statistics(self) -> Dict[str, Any]:
         """获取库存统计"""
-        query = self.db.query(FeedInventory).filter(FeedInventory.is_deleted == False)
-        
-        total_types = query.count()
-        low_stock = len(self.get_low_stock())
-        
-        total_value = self.db.query(
-            func.sum(FeedInventory.current_quantity * FeedInventory.unit_price)
-        ).filter(FeedInventory.is_deleted == False).scalar()
+        stats = self.db.query(
+            func.count(FeedInventory.id).label('total_types'),
+            func.count(FeedInventory.id).filter(self._low_stock()).label('low_stock'),
+            func.sum(FeedInventory.current_quantity * FeedType.unit_price).label('total_value')
+        ).join(FeedInventory.feed_type).filter(FeedInventory.is_deleted == False).one()
         
         return {
-            "total_feed_types": total_types,
-            "low_stock_count": low_stock,
-            "total_inventory_value": round(float(total_value or 0), 2)
+            "total_feed_types": stats.total_types,
+            "low_stock_count": stats.low_stock,
+            "total_inventory_value": round(float(stats.total_value or 0), 2)
         }
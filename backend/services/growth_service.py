@@ -6,18 +6,40 @@
 # 功能: 生长测定业务逻辑
 # ============================================================================
 
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Iterable
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, text, bindparam, insert, tuple_, select
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import logging
 
+import numpy as np
+
 from .base import BaseService
-from models.growth import GrowthRecord
+from models.base import view_refreshed_at
+from models.growth import GrowthRecord, growth_stats_monthly
 
 logger = logging.getLogger(__name__)
 
+# 日增重窗口计算: 每条记录与同一动物上一条记录比较，整列一次UPDATE
+_RECOMPUTE_ADG_SQL = """
+    UPDATE growth_records
+    SET average_daily_gain = sub.adg,
+        days_since_last_measurement = sub.days
+    FROM (
+        SELECT id,
+               ROUND(((body_weight - LAG(body_weight) OVER w)
+                      / NULLIF(measurement_date - LAG(measurement_date) OVER w, 0))::NUMERIC, 3)::FLOAT8 AS adg,
+               measurement_date - LAG(measurement_date) OVER w AS days
+        FROM growth_records
+        WHERE is_deleted = false {animal_filter}
+        WINDOW w AS (PARTITION BY animal_id ORDER BY measurement_date, id)
+    ) AS sub
+    WHERE growth_records.id = sub.id
+      AND (growth_records.average_daily_gain IS DISTINCT FROM sub.adg
+           OR growth_records.days_since_last_measurement IS DISTINCT FROM sub.days)
+"""
+
 
 class GrowthRecordService(BaseService[GrowthRecord, Any, Any]):
     """生长记录服务"""
@@ -25,12 +47,38 @@ class GrowthRecordService(BaseService[GrowthRecord, Any, Any]):
     def __init__(self, db: Session):
         super().__init__(GrowthRecord, db)
     
-    def get_by_animal(self, animal_id: int, limit: int = 50) -> List[GrowthRecord]:
-        """获取动物的生长记录"""
-        return self.db.query(GrowthRecord).filter(
+    def get_by_animal(
+        self,
+        animal_id: int,
+        limit: int = 50,
+        before: Optional[Tuple[date, int]] = None,
+        fields: Optional[Iterable[str]] = None
+    ) -> List[Any]:
+        """
+        获取动物的生长记录 (按测量日期倒序，键集分页)
+        
+        索引 ix_growth_records_animal_date (animal_id, measurement_date DESC, id DESC)
+        上做范围扫描，翻页不需要 OFFSET
+        
+        Args:
+            animal_id: 动物ID
+            limit: 每页条数
+            before: 上一页最后一条的 (measurement_date, id)，首页为None
+            fields: 只读调用方所需的列属性名；给定时返回字典行，
+                不构造ORM实例、不进入会话 identity map
+        """
+        stmt = select(*self._projection(fields)) if fields else select(GrowthRecord)
+        stmt = stmt.where(
             GrowthRecord.animal_id == animal_id,
             GrowthRecord.is_deleted == False
-        ).order_by(GrowthRecord.measurement_date.desc()).limit(limit).all()
+        )
+        if before:
+            stmt = stmt.where(tuple_(GrowthRecord.measurement_date, GrowthRecord.id) < tuple(before))
+        stmt = stmt.order_by(GrowthRecord.measurement_date.desc(), GrowthRecord.id.desc()).limit(limit)
+        
+        if fields:
+            return self.db.execute(stmt).mappings().all()
+        return self.db.scalars(stmt).all()
     
     def get_latest(self, animal_id: int) -> Optional[GrowthRecord]:
         """获取动物最新的生长记录"""
@@ -56,81 +104,214 @@ class GrowthRecordService(BaseService[GrowthRecord, Any, Any]):
         return query.order_by(GrowthRecord.measurement_date).all()
     
     def calculate_adg(self, animal_id: int) -> Optional[float]:
-        """计算动物的日增重"""
-        records = self.get_by_animal(animal_id, limit=2)
+        """计算动物的日增重 (最近两次测定)"""
+        return self.calculate_adg_bulk([animal_id]).get(animal_id)
+    
+    def calculate_adg_bulk(self, animal_ids: List[int]) -> Dict[int, Optional[float]]:
+        """
+        批量计算动物的日增重 (各自最近两次测定)
+        
+        一次窗口查询取回每只动物最新一条及其上一条 (LAG)，
+        在NumPy中整列计算；记录不足两条、缺体重或间隔非正时为None
+        
+        Returns:
+            {动物ID: 日增重(kg/天)}
+        """
+        if not animal_ids:
+            return {}
+        
+        order = (GrowthRecord.measurement_date, GrowthRecord.id)
+        window = dict(partition_by=GrowthRecord.animal_id, order_by=order)
+        ranked = select(
+            GrowthRecord.animal_id,
+            GrowthRecord.body_weight.label('weight'),
+            GrowthRecord.measurement_date.label('day'),
+            func.lag(GrowthRecord.body_weight).over(**window).label('prev_weight'),
+            func.lag(GrowthRecord.measurement_date).over(**window).label('prev_day'),
+            func.row_number().over(
+                partition_by=GrowthRecord.animal_id,
+                order_by=[column.desc() for column in order]
+            ).label('rn')
+        ).where(
+            GrowthRecord.animal_id.in_(set(animal_ids)),
+            GrowthRecord.is_deleted == False
+        ).subquery()
+        
+        rows = self.db.execute(
+            select(ranked.c.animal_id, ranked.c.weight, ranked.c.prev_weight, ranked.c.day, ranked.c.prev_day)
+            .where(ranked.c.rn == 1)
+        ).all()
+        if not rows:
+            return {}
+        
+        ids, weight, prev_weight, day, prev_day = zip(*rows)
+        weight = np.array(weight, dtype=float)
+        prev_weight = np.array(prev_weight, dtype=float)
+        # 除以单位天数得到浮点天数 (NaT 变为 NaN，astype(float) 会得到极小整数)
+        days = (np.array(day, dtype='datetime64[D]') - np.array(prev_day, dtype='datetime64[D]')) / np.timedelta64(1, 'D')
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            adg = np.round((weight - prev_weight) / days, 3)
+        valid = np.isfinite(adg) & (days > 0)
+        
+        return {
+            animal_id: float(value) if ok else None
+            for animal_id, value, ok in zip(ids, adg.tolist(), valid.tolist())
+        }
+    
+    def recompute_adg(self, animal_ids: Optional[List[int]] = None) -> int:
+        """
+        在数据库内重算日增重和测量间隔
         
-        if len(records) < 2:
-            return None
+        Args:
+            animal_ids: 仅重算这些动物 (新录入数据时传入)；None 表示全量重算
         
-        latest = records[0]
-        previous = records[1]
+        Returns:
+            更新的记录数
+        """
+        if animal_ids is None:
+            stmt = text(_RECOMPUTE_ADG_SQL.format(animal_filter=""))
+            params = {}
+        elif not animal_ids:
+            return 0
+        else:
+            stmt = text(_RECOMPUTE_ADG_SQL.format(animal_filter="AND animal_id IN :animal_ids"))
+            stmt = stmt.bindparams(bindparam("animal_ids", expanding=True))
+            params = {"animal_ids": list(animal_ids)}
         
-        if latest.body_weight and previous.body_weight:
-            days_diff = (latest.measurement_date - previous.measurement_date).days
-            if days_diff > 0:
-                weight_diff = float(latest.body_weight - previous.body_weight)
-                return round(weight_diff / days_diff, 3)
+        result = self.db.execute(stmt, params)
+        self.db.commit()
         
-        return None
+        logger.info(f"重算日增重: animals={'all' if animal_ids is None else len(animal_ids)}, rows={result.rowcount}")
+        return result.rowcount
     
     def get_growth_curve(self, animal_id: int) -> List[Dict[str, Any]]:
-        """获取动物生长曲线数据"""
-        records = self.db.query(GrowthRecord).filter(
-            GrowthRecord.animal_id == animal_id,
-            GrowthRecord.is_deleted == False
-        ).order_by(GrowthRecord.measurement_date).all()
+        """获取动物生长曲线数据 (只查询曲线所需列，不构造ORM实例)"""
+        rows = self.db.execute(
+            select(
+                GrowthRecord.measurement_date,
+                GrowthRecord.age_days,
+                GrowthRecord.body_weight,
+                GrowthRecord.body_length,
+                GrowthRecord.chest_girth
+            ).where(
+                GrowthRecord.animal_id == animal_id,
+                GrowthRecord.is_deleted == False
+            ).order_by(GrowthRecord.measurement_date, GrowthRecord.id)
+        ).all()
         
         return [
             {
-                "date": r.measurement_date.isoformat(),
-                "age_days": r.age_days,
-                "weight": float(r.body_weight) if r.body_weight else None,
-                "body_length": float(r.body_length) if r.body_length else None,
-                "chest_girth": float(r.chest_girth) if r.chest_girth else None
+                "date": measured.isoformat(),
+                "age_days": age_days,
+                "weight": float(weight) if weight else None,
+                "body_length": float(length) if length else None,
+                "chest_girth": float(girth) if girth else None
             }
-            for r in records
+            for measured, age_days, weight, length, girth in rows
         ]
     
     def get_statistics(self, measurement_type: str = None) -> Dict[str, Any]:
-        """获取生长统计"""
-        query = self.db.query(GrowthRecord).filter(GrowthRecord.is_deleted == False)
+        """
+        获取生长统计
+        
+        物化视图 growth_stats_monthly 最近一次刷新所在月份之前的月份读视图的和与计数，
+        该月起的记录按 measurement_date 范围实时聚合，两部分合并后求均值；
+        视图从未刷新过时全部实时聚合。刷新后补录到更早月份的记录要到下次刷新才计入
+        """
+        month_start = date.today().replace(day=1)
+        view = growth_stats_monthly
+        refreshed_at = view_refreshed_at(self.db, 'growth_stats_monthly')
         
+        recent_query = select(
+            func.count(GrowthRecord.id),
+            func.sum(GrowthRecord.body_weight), func.count(GrowthRecord.body_weight),
+            func.sum(GrowthRecord.average_daily_gain), func.count(GrowthRecord.average_daily_gain),
+            func.sum(GrowthRecord.body_condition_score), func.count(GrowthRecord.body_condition_score),
+            func.count(GrowthRecord.id).filter(GrowthRecord.measurement_date >= month_start),
+        ).where(GrowthRecord.is_deleted == False)
         if measurement_type:
-            query = query.filter(GrowthRecord.measurement_type == measurement_type)
-        
-        stats = query.with_entities(
-            func.count(GrowthRecord.id).label('total'),
-            func.avg(GrowthRecord.body_weight).label('avg_weight'),
-            func.avg(GrowthRecord.average_daily_gain).label('avg_adg'),
-            func.avg(GrowthRecord.body_condition_score).label('avg_bcs')
-        ).first()
-        
-        # 本月记录数
-        this_month = self.db.query(GrowthRecord).filter(
-            GrowthRecord.measurement_date >= date.today().replace(day=1),
-            GrowthRecord.is_deleted == False
-        ).count()
+            recent_query = recent_query.where(GrowthRecord.measurement_type == measurement_type)
+        
+        history = (0,) * 7
+        if refreshed_at is not None:
+            cutoff = refreshed_at.date().replace(day=1)
+            history_query = select(
+                func.sum(view.c.record_count),
+                func.sum(view.c.weight_sum), func.sum(view.c.weight_count),
+                func.sum(view.c.adg_sum), func.sum(view.c.adg_count),
+                func.sum(view.c.bcs_sum), func.sum(view.c.bcs_count),
+            ).where(view.c.month < cutoff)
+            if measurement_type:
+                history_query = history_query.where(view.c.measurement_type == measurement_type)
+            history = self.db.execute(history_query).one()
+            recent_query = recent_query.where(GrowthRecord.measurement_date >= cutoff)
+        
+        *recent, this_month = self.db.execute(recent_query).one()
+        total, weight_sum, weight_n, adg_sum, adg_n, bcs_sum, bcs_n = (
+            float(h or 0) + float(r or 0) for h, r in zip(history, recent)
+        )
+        
+        def _mean(value_sum, count):
+            return value_sum / count if count else 0.0
+        
+        return {
+            "total_records": int(total),
+            "this_month_records": this_month or 0,
+            "average_weight": round(_mean(weight_sum, weight_n), 2),
+            "average_adg": round(_mean(adg_sum, adg_n), 3),
+            "average_body_condition": round(_mean(bcs_sum, bcs_n), 1)
+        }
+    
+    def get_population_summary(self) -> Dict[str, Any]:
+        """
+        全群体生长汇总 (一条聚合查询)
+        
+        按日龄窗口的平均体重用 FILTER 子句，日增重/体况评分分位数用
+        percentile_cont 在库内计算，不把全群体测定记录拉到应用层
+        """
+        adg = GrowthRecord.average_daily_gain
+        bcs = GrowthRecord.body_condition_score
+        stats = self.db.execute(
+            select(
+                func.count(GrowthRecord.id).label('total'),
+                func.avg(GrowthRecord.body_weight).filter(GrowthRecord.age_days <= 1).label('birth'),
+                func.avg(GrowthRecord.body_weight).filter(GrowthRecord.age_days.between(60, 90)).label('weaning'),
+                func.avg(GrowthRecord.body_weight).filter(GrowthRecord.age_days.between(115, 125)).label('day120'),
+                func.avg(adg).label('avg_adg'),
+                func.percentile_cont(0.25).within_group(adg).label('adg_p25'),
+                func.percentile_cont(0.5).within_group(adg).label('adg_p50'),
+                func.percentile_cont(0.75).within_group(adg).label('adg_p75'),
+                func.avg(bcs).label('avg_bcs'),
+                func.percentile_cont(0.5).within_group(bcs).label('bcs_p50'),
+            )
+        ).one()
+        
+        def _round(value, digits):
+            return round(float(value), digits) if value is not None else None
         
         return {
             "total_records": stats.total or 0,
-            "this_month_records": this_month,
-            "average_weight": round(float(stats.avg_weight or 0), 2),
-            "average_adg": round(float(stats.avg_adg or 0), 3),
-            "average_body_condition": round(float(stats.avg_bcs or 0), 1)
+            "avg_birth_weight": _round(stats.birth, 1),
+            "avg_weaning_weight": _round(stats.weaning, 1),
+            "avg_120day_weight": _round(stats.day120, 1),
+            "avg_daily_gain": _round(stats.avg_adg, 3),
+            "adg_quartiles": [_round(stats.adg_p25, 3), _round(stats.adg_p50, 3), _round(stats.adg_p75, 3)],
+            "avg_body_condition": _round(stats.avg_bcs, 1),
+            "median_body_condition": _round(stats.bcs_p50, 1),
         }
     
     def batch_create(self, records_data: List[Dict[str, Any]]) -> List[GrowthRecord]:
-        """批量创建生长记录"""
-        records = []
-        for data in records_data:
-            record = GrowthRecord(**data)
-            records.append(record)
+        """
+        批量创建生长记录
         
-        self.db.add_all(records)
-        self.db.commit()
+        一条多行 INSERT ... RETURNING (insertmanyvalues) 写入并取回整行，不再逐条 refresh
+        """
+        if not records_data:
+            return []
         
-        for r in records:
-            self.db.refresh(r)
+        records = self.db.scalars(insert(GrowthRecord).returning(GrowthRecord), records_data).all()
+        self.db.commit()
         
-        logger.info(f"批量创建生长记录: count={len(records)}")
+        logger.info("批量创建生长记录: count=%d", len(records))
         return records
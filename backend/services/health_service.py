@@ -6,17 +6,26 @@
 # 功能: 健康记录、疫苗、驱虫业务逻辑
 # ============================================================================
 
-from typing import Optional, List, Dict, Any
-from sqlalchemy.orm import Session
+from typing import Optional, List, Dict, Any, Iterable
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.interfaces import LoaderOption
 from sqlalchemy import func, and_
 from datetime import datetime, date, timedelta
 import logging
 
 from .base import BaseService
+from .dictionary_cache import DictionaryCache
 from models.health import Disease, HealthRecord, VaccineType, VaccinationRecord, DewormingRecord
 
 logger = logging.getLogger(__name__)
 
+DISEASE_CACHE = DictionaryCache(
+    Disease, "disease_code", lists={"reportable": Disease.is_reportable == True}
+).watch()
+VACCINE_TYPE_CACHE = DictionaryCache(
+    VaccineType, "vaccine_code", lists={"mandatory": VaccineType.is_mandatory == True}
+).watch()
+
 
 class DiseaseService(BaseService[Disease, Any, Any]):
     """疾病字典服务"""
@@ -28,6 +37,14 @@ class DiseaseService(BaseService[Disease, Any, Any]):
         """根据代码获取疾病"""
         return self.get_by_field("disease_code", code)
     
+    def get_cached(self, id: int) -> Optional[Dict[str, Any]]:
+        """按ID获取疾病 (字典缓存，返回行字典)"""
+        return DISEASE_CACHE.get(self.db, id)
+    
+    def get_cached_by_code(self, code: str) -> Optional[Dict[str, Any]]:
+        """按代码获取疾病 (字典缓存，返回行字典)"""
+        return DISEASE_CACHE.get_by_code(self.db, code)
+    
     def get_by_category(self, category: str) -> List[Disease]:
         """根据类别获取疾病列表"""
         return self.get_multi(filters={"category": category}, limit=100)
@@ -38,39 +55,66 @@ class DiseaseService(BaseService[Disease, Any, Any]):
             Disease.is_reportable == True,
             Disease.is_deleted == False
         ).all()
+    
+    def get_reportable_cached(self) -> List[Dict[str, Any]]:
+        """获取需报告疾病 (字典缓存，返回行字典列表)"""
+        return DISEASE_CACHE.get_list(self.db, "reportable")
 
 
 class HealthRecordService(BaseService[HealthRecord, Any, Any]):
     """健康记录服务"""
     
+    # 列表展示疾病名称；显式声明以免 raiseload('*') 覆盖模型上的 lazy='joined'
+    eager_loads = (joinedload(HealthRecord.disease),)
+    
     def __init__(self, db: Session):
         super().__init__(HealthRecord, db)
     
-    def get_by_animal(self, animal_id: int, limit: int = 20) -> List[HealthRecord]:
-        """获取动物的健康记录"""
-        return self.get_multi(filters={"animal_id": animal_id}, limit=limit)
+    def get_by_animal(
+        self,
+        animal_id: int,
+        limit: int = 20,
+        with_options: Iterable[LoaderOption] = ()
+    ) -> List[HealthRecord]:
+        """获取动物的健康记录 (with_options 附加预加载)"""
+        return self.get_multi(filters={"animal_id": animal_id}, limit=limit, with_options=with_options)
+    
+    def get_by_medication(self, drug_name: str, limit: int = 100) -> List[HealthRecord]:
+        """获取使用过指定药物的健康记录 (medications -> 'drugs' 表达式索引)"""
+        return self.db.query(HealthRecord).filter(
+            HealthRecord.medications['drugs'].contains([{"name": drug_name}]),
+            HealthRecord.is_deleted == False
+        ).order_by(HealthRecord.check_date.desc()).limit(limit).all()
+    
+    @staticmethod
+    def _pending_followup():
+        """待复查条件 (列表查询与统计共用)"""
+        return and_(
+            HealthRecord.follow_up_required == True,
+            HealthRecord.follow_up_date <= date.today()
+        )
     
     def get_pending_followups(self) -> List[HealthRecord]:
         """获取待复查记录"""
         return self.db.query(HealthRecord).filter(
-            HealthRecord.follow_up_required == True,
-            HealthRecord.follow_up_date <= date.today(),
+            self._pending_followup(),
             HealthRecord.is_deleted == False
         ).all()
     
     def get_statistics(self, farm_id: int = None) -> Dict[str, Any]:
         """获取健康统计"""
-        query = self.db.query(HealthRecord).filter(HealthRecord.is_deleted == False)
-        
-        total = query.count()
-        this_month = query.filter(
-            HealthRecord.check_date >= date.today().replace(day=1)
-        ).count()
+        stats = self.db.query(
+            func.count(HealthRecord.id).label('total'),
+            func.count(HealthRecord.id).filter(
+                HealthRecord.check_date >= date.today().replace(day=1)
+            ).label('this_month'),
+            func.count(HealthRecord.id).filter(self._pending_followup()).label('pending_followups')
+        ).filter(HealthRecord.is_deleted == False).one()
         
         return {
-            "total_records": total,
-            "this_month": this_month,
-            "pending_followups": len(self.get_pending_followups())
+            "total_records": stats.total,
+            "this_month": stats.this_month,
+            "pending_followups": stats.pending_followups
         }
 
 
@@ -84,43 +128,75 @@ class VaccineTypeService(BaseService[VaccineType, Any, Any]):
         """根据代码获取疫苗"""
         return self.get_by_field("vaccine_code", code)
     
+    def get_cached(self, id: int) -> Optional[Dict[str, Any]]:
+        """按ID获取疫苗类型 (字典缓存，返回行字典)"""
+        return VACCINE_TYPE_CACHE.get(self.db, id)
+    
+    def get_cached_by_code(self, code: str) -> Optional[Dict[str, Any]]:
+        """按代码获取疫苗类型 (字典缓存，返回行字典)"""
+        return VACCINE_TYPE_CACHE.get_by_code(self.db, code)
+    
+    def get_by_target_disease(self, disease: str) -> List[VaccineType]:
+        """获取针对指定疾病的疫苗 (@> 包含查询走数组GIN索引，= ANY 无法使用)"""
+        return self.db.query(VaccineType).filter(
+            VaccineType.target_diseases.contains([disease]),
+            VaccineType.is_deleted == False
+        ).all()
+    
     def get_mandatory(self) -> List[VaccineType]:
         """获取强制疫苗"""
         return self.db.query(VaccineType).filter(
             VaccineType.is_mandatory == True,
             VaccineType.is_deleted == False
         ).all()
+    
+    def get_mandatory_cached(self) -> List[Dict[str, Any]]:
+        """获取强制疫苗 (字典缓存，返回行字典列表)"""
+        return VACCINE_TYPE_CACHE.get_list(self.db, "mandatory")
 
 
 class VaccinationRecordService(BaseService[VaccinationRecord, Any, Any]):
     """疫苗接种记录服务"""
     
+    # 列表展示疫苗名称；显式声明以免 raiseload('*') 覆盖模型上的 lazy='joined'
+    eager_loads = (joinedload(VaccinationRecord.vaccine_type, innerjoin=True),)
+    
     def __init__(self, db: Session):
         super().__init__(VaccinationRecord, db)
     
-    def get_by_animal(self, animal_id: int) -> List[VaccinationRecord]:
-        """获取动物的接种记录"""
-        return self.get_multi(filters={"animal_id": animal_id}, limit=50)
+    def get_by_animal(
+        self,
+        animal_id: int,
+        with_options: Iterable[LoaderOption] = ()
+    ) -> List[VaccinationRecord]:
+        """获取动物的接种记录 (with_options 附加预加载)"""
+        return self.get_multi(filters={"animal_id": animal_id}, limit=50, with_options=with_options)
+    
+    @staticmethod
+    def _upcoming(days: int):
+        """未来 days 天内需接种条件 (列表查询与统计共用)"""
+        today = date.today()
+        return VaccinationRecord.next_vaccination_date.between(today, today + timedelta(days=days))
     
     def get_upcoming(self, days: int = 7) -> List[VaccinationRecord]:
         """获取即将需要接种的记录"""
-        cutoff = date.today() + timedelta(days=days)
         return self.db.query(VaccinationRecord).filter(
-            VaccinationRecord.next_vaccination_date <= cutoff,
-            VaccinationRecord.next_vaccination_date >= date.today(),
+            self._upcoming(days),
             VaccinationRecord.is_deleted == False
         ).all()
     
     def get_statistics(self) -> Dict[str, Any]:
-        """获取疫苗统计"""
-        this_month = self.db.query(VaccinationRecord).filter(
-            VaccinationRecord.vaccination_date >= date.today().replace(day=1),
-            VaccinationRecord.is_deleted == False
-        ).count()
+        """获取疫苗统计 (一次聚合查询)"""
+        stats = self.db.query(
+            func.count(VaccinationRecord.id).filter(
+                VaccinationRecord.vaccination_date >= date.today().replace(day=1)
+            ).label('this_month'),
+            func.count(VaccinationRecord.id).filter(self._upcoming(7)).label('upcoming')
+        ).filter(VaccinationRecord.is_deleted == False).one()
         
         return {
-            "this_month_vaccinations": this_month,
-            "upcoming_count": len(self.get_upcoming(7))
+            "this_month_vaccinations": stats.this_month,
+            "upcoming_count": stats.upcoming
         }
 
 
@@ -0,0 +1,233 @@
+# ============================================================================
+# 新星肉羊育种系统 - IoT数据写入缓冲
+# NovaBreed Sheep System - IoT Ingest Buffer
+#
+# 文件: iot_ingest.py
+# 功能: 合并设备上报的数据点与心跳，按批量/定时落库
+# ============================================================================
+
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Set, Type
+import asyncio
+import logging
+
+from config import settings
+from database import SessionLocal
+from models.iot import IoTData
+from services.iot_service import IoTDeviceService
+
+logger = logging.getLogger(__name__)
+
+
+class _FlushBuffer(ABC):
+    """
+    定时刷写缓冲基类
+
+    子类实现 pending / _drain / _write_batch：flush 取出缓冲拆成若干批，
+    各批在线程池中各用一个会话写入，失败的批交给 _on_error 处理
+    (默认记录日志并丢弃)；start/stop 管理定时刷写任务，stop 时写出剩余数据。
+    """
+
+    name = "缓冲"
+
+    def __init__(self, session_factory: Callable[[], Any], flush_interval: float):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    @abstractmethod
+    def pending(self) -> int:
+        """缓冲中待写入的条数"""
+
+    @abstractmethod
+    def _drain(self) -> List[Any]:
+        """取出并清空缓冲，返回待写入的各批"""
+
+    @abstractmethod
+    def _write_batch(self, session: Any, batch: Any) -> int:
+        """在给定会话中写入一批并提交，返回写入数"""
+
+    async def _on_error(self, batch: Any, error: Exception) -> int:
+        """整批写入失败时调用，返回补救写入数"""
+        logger.error(f"{self.name}写入失败，丢弃 {len(batch)} 条: {error}")
+        return 0
+
+    async def flush(self) -> int:
+        """刷写缓冲，返回写入数"""
+        batches = self._drain()
+        if not batches:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, self._write, batch) for batch in batches),
+            return_exceptions=True
+        )
+
+        written = 0
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                written += await self._on_error(batch, result)
+            else:
+                written += result
+        return written
+
+    def _write(self, batch: Any) -> int:
+        session = self.session_factory()
+        try:
+            return self._write_batch(session, batch)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def start(self) -> None:
+        """启动定时刷写 (须在事件循环中调用)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止定时刷写并写出剩余数据"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"{self.name}定时刷写失败: {e}")
+
+
+class IoTIngestBuffer(_FlushBuffer):
+    """
+    IoT数据写入缓冲
+
+    上报的数据点先进入进程内缓冲，累计满 IOT_INGEST_BATCH_SIZE 条或每隔
+    IOT_INGEST_FLUSH_INTERVAL 秒落库一次。落库时按 device_id 取模分片，
+    各分片在线程池中独立事务多行INSERT，避免每个请求一个事务。
+    分片整批失败时改为逐行(保存点)重试，只剔除写不进去的行，
+    被剔除的行按错误级别记录日志并计入 rejected。
+    进程异常退出时缓冲中未落库的数据会丢失，关闭时 stop() 会先刷写。
+    """
+
+    name = "IoT数据"
+
+    def __init__(
+        self,
+        model: Type = IoTData,
+        session_factory: Callable[[], Any] = SessionLocal,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        shards: Optional[int] = None
+    ):
+        super().__init__(session_factory, flush_interval or settings.IOT_INGEST_FLUSH_INTERVAL)
+        self.model = model
+        self.batch_size = batch_size or settings.IOT_INGEST_BATCH_SIZE
+        self.shards = shards or settings.IOT_INGEST_SHARDS
+        self.rejected = 0
+        self._rows: List[Dict[str, Any]] = []
+
+    @property
+    def pending(self) -> int:
+        """缓冲中待落库的行数"""
+        return len(self._rows)
+
+    async def add(self, rows: List[Dict[str, Any]]) -> None:
+        """加入数据行，满批量时立即刷写"""
+        self._rows.extend(rows)
+        if len(self._rows) >= self.batch_size:
+            await self.flush()
+
+    def _drain(self) -> List[List[Dict[str, Any]]]:
+        rows, self._rows = self._rows, []
+        shards: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            shards.setdefault(row['device_id'] % self.shards, []).append(row)
+        return list(shards.values())
+
+    def _write_batch(self, session: Any, rows: List[Dict[str, Any]]) -> int:
+        self.model.bulk_insert(session, rows)
+        session.commit()
+        return len(rows)
+
+    async def _on_error(self, rows: List[Dict[str, Any]], error: Exception) -> int:
+        logger.warning(f"IoT数据批量写入失败，逐行重试 {len(rows)} 条: {error}")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._write_each, rows)
+
+    def _write_each(self, rows: List[Dict[str, Any]]) -> int:
+        """逐行写入，每行一个保存点，返回写入的行数"""
+        session = self.session_factory()
+        dropped = 0
+        try:
+            for row in rows:
+                savepoint = session.begin_nested()
+                try:
+                    self.model.bulk_insert(session, [row])
+                    savepoint.commit()
+                except Exception as e:
+                    savepoint.rollback()
+                    dropped += 1
+                    logger.error(f"IoT数据写入失败，丢弃: {row} ({e})")
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"IoT数据逐行写入失败，丢弃 {len(rows) - dropped} 条: {e}")
+            dropped = len(rows)
+        finally:
+            session.close()
+        self.rejected += dropped
+        return len(rows) - dropped
+
+
+class HeartbeatBuffer(_FlushBuffer):
+    """
+    设备心跳缓冲
+
+    心跳只记录设备ID (集合去重)，每隔 IOT_HEARTBEAT_FLUSH_INTERVAL 秒
+    以一条 UPDATE ... WHERE id IN 批量更新在线状态，替代每次心跳一个事务。
+    心跳时间取落库时刻，误差不超过一个刷写间隔。
+    """
+
+    name = "设备心跳"
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any] = SessionLocal,
+        flush_interval: Optional[float] = None
+    ):
+        super().__init__(session_factory, flush_interval or settings.IOT_HEARTBEAT_FLUSH_INTERVAL)
+        self._device_ids: Set[int] = set()
+
+    @property
+    def pending(self) -> int:
+        """待更新的设备数"""
+        return len(self._device_ids)
+
+    def mark(self, device_id: int) -> None:
+        """记录一次心跳"""
+        self._device_ids.add(device_id)
+
+    def _drain(self) -> List[Set[int]]:
+        if not self._device_ids:
+            return []
+        device_ids, self._device_ids = self._device_ids, set()
+        return [device_ids]
+
+    def _write_batch(self, session: Any, device_ids: Set[int]) -> int:
+        return IoTDeviceService(session).update_heartbeats_bulk(device_ids)
+
+
+# 全局写入缓冲 (应用生命周期内启动/停止)
+iot_ingest_buffer = IoTIngestBuffer()
+heartbeat_buffer = HeartbeatBuffer()
@@ -6,17 +6,23 @@
 # 功能: IoT设备、数据、自动称重业务逻辑
 # ============================================================================
 
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Iterator
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, tuple_, update, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import datetime, date, timedelta
 import logging
 
+import numpy as np
+
 from .base import BaseService
 from models.iot import IoTDevice, IoTData, AutoWeighingRecord
 
 logger = logging.getLogger(__name__)
 
+# 时序数据流式分析每批行数 (服务端游标)
+IOT_STREAM_BATCH_SIZE = 10_000
+
 
 class IoTDeviceService(BaseService[IoTDevice, Any, Any]):
     """IoT设备服务"""
@@ -28,6 +34,10 @@ class IoTDeviceService(BaseService[IoTDevice, Any, Any]):
         """根据设备ID获取设备"""
         return self.get_by_field("device_id", device_id)
     
+    def get_by_device_ids(self, device_ids: List[str]) -> Dict[str, IoTDevice]:
+        """批量获取设备 (批量上报时一次查询解析全部设备，之后 get_by_device_id 走会话缓存)"""
+        return self.get_by_field_in("device_id", device_ids)
+    
     def get_by_farm(self, farm_id: int) -> List[IoTDevice]:
         """获取羊场的所有设备"""
         return self.get_multi(filters={"farm_id": farm_id}, limit=100)
@@ -63,39 +73,75 @@ class IoTDeviceService(BaseService[IoTDevice, Any, Any]):
             query = query.filter(IoTDevice.farm_id == farm_id)
         return query.all()
     
+    def get_stale(self, minutes: int = 5, farm_id: int = None) -> List[IoTDevice]:
+        """获取心跳超时的在线设备 (走 ix_iot_devices_online_heartbeat 部分索引)"""
+        query = self.db.query(IoTDevice).filter(
+            IoTDevice.status == 'online',
+            IoTDevice.last_heartbeat < datetime.now() - timedelta(minutes=minutes),
+            IoTDevice.is_deleted == False
+        )
+        if farm_id:
+            query = query.filter(IoTDevice.farm_id == farm_id)
+        return query.order_by(IoTDevice.last_heartbeat).all()
+    
     def update_heartbeat(self, device_id: int) -> bool:
-        """更新设备心跳"""
-        device = self.get(device_id)
-        if device:
-            device.last_heartbeat = datetime.now()
-            device.status = 'online'
-            self.db.commit()
-            return True
-        return False
+        """更新设备心跳 (一条 UPDATE ... RETURNING，不先加载设备)"""
+        updated = self.db.execute(
+            update(IoTDevice)
+            .where(IoTDevice.id == device_id, IoTDevice.is_deleted == False)
+            .values(last_heartbeat=datetime.now(), status='online')
+            .returning(IoTDevice.id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        self.db.commit()
+        
+        return updated is not None
+    
+    def update_heartbeats_bulk(self, device_ids: Iterable[int]) -> int:
+        """
+        批量更新设备心跳 (一条 UPDATE ... WHERE id IN，一个事务)
+        
+        心跳缓冲 heartbeat_buffer 按时间窗口去重后调用；心跳时间与
+        update_heartbeat / get_stale 同取应用时钟 datetime.now()
+        
+        Returns:
+            更新的设备数
+        """
+        ids = list(device_ids)
+        if not ids:
+            return 0
+        result = self.db.execute(
+            update(IoTDevice)
+            .where(IoTDevice.id.in_(ids), IoTDevice.is_deleted == False)
+            .values(last_heartbeat=datetime.now(), status='online')
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount
     
     def get_statistics(self, farm_id: int = None) -> Dict[str, Any]:
         """获取设备统计"""
-        query = self.db.query(IoTDevice).filter(IoTDevice.is_deleted == False)
+        # 一次分组查询 (类型, 状态) 计数，在内存中汇总
+        query = self.db.query(
+            IoTDevice.device_type,
+            IoTDevice.status,
+            func.count(IoTDevice.id)
+        ).filter(IoTDevice.is_deleted == False)
         if farm_id:
             query = query.filter(IoTDevice.farm_id == farm_id)
         
-        total = query.count()
-        online = query.filter(IoTDevice.status == 'online').count()
-        offline = query.filter(IoTDevice.status == 'offline').count()
-        error = query.filter(IoTDevice.status == 'error').count()
-        
-        # 按类型统计
-        type_stats = self.db.query(
-            IoTDevice.device_type,
-            func.count(IoTDevice.id)
-        ).filter(IoTDevice.is_deleted == False).group_by(IoTDevice.device_type).all()
+        by_type: Dict[str, int] = {}
+        by_status: Dict[str, int] = {}
+        for device_type, status, count in query.group_by(IoTDevice.device_type, IoTDevice.status):
+            by_type[device_type] = by_type.get(device_type, 0) + count
+            by_status[status] = by_status.get(status, 0) + count
         
         return {
-            "total_devices": total,
-            "online_count": online,
-            "offline_count": offline,
-            "error_count": error,
-            "by_type": {t: c for t, c in type_stats}
+            "total_devices": sum(by_type.values()),
+            "online_count": by_status.get('online', 0),
+            "offline_count": by_status.get('offline', 0),
+            "error_count": by_status.get('error', 0),
+            "by_type": by_type
         }
 
 
@@ -105,12 +151,53 @@ class IoTDataService(BaseService[IoTData, Any, Any]):
     def __init__(self, db: Session):
         super().__init__(IoTData, db)
     
-    def get_by_device(self, device_id: int, limit: int = 100) -> List[IoTData]:
-        """获取设备的数据"""
-        return self.db.query(IoTData).filter(
+    def get_by_device(
+        self,
+        device_id: int,
+        limit: int = 100,
+        before: Optional[Tuple[datetime, int]] = None,
+        fields: Optional[Iterable[str]] = None
+    ) -> List[Any]:
+        """
+        获取设备的数据 (按时间倒序，键集分页)
+        
+        索引 ix_iot_data_device_timestamp (device_id, timestamp, id) 反向范围扫描
+        
+        Args:
+            device_id: 设备主键
+            limit: 每页条数
+            before: 上一页最后一条的 (timestamp, id)，首页为None
+            fields: 只读调用方所需的列属性名；给定时返回字典行，
+                不构造ORM实例、不进入会话 identity map
+        """
+        stmt = select(*self._projection(fields)) if fields else select(IoTData)
+        stmt = stmt.where(
             IoTData.device_id == device_id,
             IoTData.is_deleted == False
-        ).order_by(IoTData.timestamp.desc()).limit(limit).all()
+        )
+        if before:
+            stmt = stmt.where(tuple_(IoTData.timestamp, IoTData.id) < tuple(before))
+        stmt = stmt.order_by(IoTData.timestamp.desc(), IoTData.id.desc()).limit(limit)
+        
+        if fields:
+            return self.db.execute(stmt).mappings().all()
+        return self.db.scalars(stmt).all()
+    
+    def bulk_ingest(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        批量写入数据点 (同步导入/回灌用，一个事务)
+        
+        不经ORM工作单元，走 IoTData.bulk_insert 的多行INSERT
+        (引擎按 insertmanyvalues_page_size 分页)；HTTP上报走 iot_ingest_buffer 缓冲合并
+        
+        Returns:
+            写入行数
+        """
+        IoTData.bulk_insert(self.db, rows)
+        self.db.commit()
+        
+        logger.info("IoT数据批量写入: count=%d", len(rows))
+        return len(rows)
     
     def get_latest(self, device_id: int) -> Optional[IoTData]:
         """获取设备最新数据"""
@@ -119,6 +206,13 @@ class IoTDataService(BaseService[IoTData, Any, Any]):
             IoTData.is_deleted == False
         ).order_by(IoTData.timestamp.desc()).first()
     
+    def get_by_payload(self, criteria: Dict[str, Any], limit: int = 100) -> List[IoTData]:
+        """按负载内容查询数据 (@> 包含查询，走 jsonb_path_ops GIN索引)"""
+        return self.db.query(IoTData).filter(
+            IoTData.data_payload.contains(criteria),
+            IoTData.is_deleted == False
+        ).order_by(IoTData.timestamp.desc()).limit(limit).all()
+    
     def get_by_time_range(
         self,
         device_id: int,
@@ -160,6 +254,70 @@ class IoTDataService(BaseService[IoTData, Any, Any]):
             "minimum": round(float(result.min or 0), 2),
             "maximum": round(float(result.max or 0), 2)
         }
+    
+    def stream_values(
+        self,
+        device_id: int,
+        data_type: str,
+        start_time: datetime,
+        end_time: datetime
+    ) -> Iterator[np.ndarray]:
+        """
+        按时间顺序分批读取数值 (float64 数组)
+        
+        Core select 只取 value 列，服务端游标每批 IOT_STREAM_BATCH_SIZE 行，
+        不构造ORM对象，内存占用与时间范围无关
+        """
+        stmt = select(IoTData.value).where(
+            IoTData.device_id == device_id,
+            IoTData.data_type == data_type,
+            IoTData.timestamp >= start_time,
+            IoTData.timestamp <= end_time,
+            IoTData.value.is_not(None),
+            IoTData.is_deleted == False
+        ).order_by(IoTData.timestamp).execution_options(yield_per=IOT_STREAM_BATCH_SIZE)
+        
+        for rows in self.db.execute(stmt).partitions():
+            yield np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows))
+    
+    def stream_reduce(
+        self,
+        device_id: int,
+        data_type: str,
+        start_time: datetime,
+        end_time: datetime
+    ) -> Dict[str, Any]:
+        """
+        流式统计 (计数/均值/标准差/最值)
+        
+        每批用NumPy向量化求批内矩，再按 Chan 并行公式合并到累计量，
+        数值稳定且只保留常数个累计值
+        """
+        count, mean, m2 = 0, 0.0, 0.0
+        minimum, maximum = np.inf, -np.inf
+        for chunk in self.stream_values(device_id, data_type, start_time, end_time):
+            n = chunk.size
+            if n == 0:
+                continue
+            chunk_mean = chunk.mean()
+            chunk_m2 = float(((chunk - chunk_mean) ** 2).sum())
+            total = count + n
+            delta = chunk_mean - mean
+            mean += delta * n / total
+            m2 += chunk_m2 + delta * delta * count * n / total
+            count = total
+            minimum = min(minimum, float(chunk.min()))
+            maximum = max(maximum, float(chunk.max()))
+        
+        if count == 0:
+            return {"count": 0, "average": None, "std": None, "minimum": None, "maximum": None}
+        return {
+            "count": count,
+            "average": round(float(mean), 2),
+            "std": round(float(np.sqrt(m2 / (count - 1))), 2) if count > 1 else 0.0,
+            "minimum": round(minimum, 2),
+            "maximum": round(maximum, 2)
+        }
 
 
 class AutoWeighingService(BaseService[AutoWeighingRecord, Any, Any]):
@@ -168,12 +326,47 @@ class AutoWeighingService(BaseService[AutoWeighingRecord, Any, Any]):
     def __init__(self, db: Session):
         super().__init__(AutoWeighingRecord, db)
     
-    def get_by_animal(self, animal_id: int, limit: int = 50) -> List[AutoWeighingRecord]:
-        """获取动物的称重记录"""
-        return self.db.query(AutoWeighingRecord).filter(
+    def ingest(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        批量写入称重记录，返回实际插入条数
+        
+        同一动物同一称重时间的重复上报由唯一索引在库内跳过
+        (ON CONFLICT DO NOTHING)，无需先查询去重
+        """
+        if not rows:
+            return 0
+        stmt = pg_insert(AutoWeighingRecord).values(rows).on_conflict_do_nothing(
+            index_elements=['animal_id', 'weighing_time'],
+            index_where=AutoWeighingRecord.animal_id.isnot(None)
+        )
+        inserted = self.db.execute(stmt).rowcount
+        self.db.commit()
+        return inserted
+    
+    def get_by_animal(
+        self,
+        animal_id: int,
+        limit: int = 50,
+        before: Optional[datetime] = None
+    ) -> List[AutoWeighingRecord]:
+        """
+        获取动物的称重记录 (按称重时间倒序，键集分页)
+        
+        同一动物的称重时间唯一 (uq_auto_weighing_animal_time)，以时间作游标即可
+        
+        Args:
+            animal_id: 动物ID
+            limit: 每页条数
+            before: 上一页最后一条的 weighing_time，首页为None
+        """
+        query = self.db.query(AutoWeighingRecord).filter(
             AutoWeighingRecord.animal_id == animal_id,
             AutoWeighingRecord.is_deleted == False
-        ).order_by(AutoWeighingRecord.weighing_time.desc()).limit(limit).all()
+        )
+        if before:
+            query = query.filter(AutoWeighingRecord.weighing_time < before)
+        
+        return query.order_by(AutoWeighingRecord.weighing_time.desc()).limit(limit).all()
     
     def get_latest(self, animal_id: int) -> Optional[AutoWeighingRecord]:
         """获取动物最新称重"""
@@ -198,22 +391,22 @@ class AutoWeighingService(BaseService[AutoWeighingRecord, Any, Any]):
     
     def get_statistics(self, farm_id: int = None) -> Dict[str, Any]:
         """获取称重统计"""
-        today = date.today()
-        today_start = datetime.combine(today, datetime.min.time())
-        
-        query = self.db.query(AutoWeighingRecord).filter(AutoWeighingRecord.is_deleted == False)
-        
-        total = query.count()
-        today_count = query.filter(AutoWeighingRecord.weighing_time >= today_start).count()
-        unsynced = query.filter(AutoWeighingRecord.synced_to_growth_record == False).count()
+        today_start = datetime.combine(date.today(), datetime.min.time())
         
-        avg_weight = self.db.query(
-            func.avg(AutoWeighingRecord.corrected_weight)
-        ).filter(AutoWeighingRecord.is_deleted == False).scalar()
+        stats = self.db.query(
+            func.count(AutoWeighingRecord.id).label('total'),
+            func.count(AutoWeighingRecord.id).filter(
+                AutoWeighingRecord.weighing_time >= today_start
+            ).label('today_count'),
+            func.count(AutoWeighingRecord.id).filter(
+                AutoWeighingRecord.synced_to_growth_record == False
+            ).label('unsynced'),
+            func.avg(AutoWeighingRecord.corrected_weight).label('avg_weight')
+        ).filter(AutoWeighingRecord.is_deleted == False).one()
         
         return {
-            "total_records": total,
-            "today_weighings": today_count,
-            "unsynced_count": unsynced,
-            "average_weight": round(float(avg_weight or 0), 2)
+            "total_records": stats.total,
+            "today_weighings": stats.today_count,
+            "unsynced_count": stats.unsynced,
+            "average_weight": round(float(stats.avg_weight or 0), 2)
         }
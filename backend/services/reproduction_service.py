@@ -48,7 +48,7 @@ class BreedingRecordService(BaseService[BreedingRecord, Any, Any]):
     
     def get_by_dam(self, dam_id: int) -> List[BreedingRecord]:
         """获取母羊的配种记录"""
-        return self.get_multi(filters={"dam_id": dam_id}, limit=50)
+        return self.get_multi(filters={"dam_id": dam_id}, limit=50, order_by="breeding_date")
     
     def get_by_sire(self, sire_id: int) -> List[BreedingRecord]:
         """获取公羊的配种记录"""
@@ -95,7 +95,14 @@ class LambingRecordService(BaseService[LambingRecord, Any, Any]):
     
     def get_by_dam(self, dam_id: int) -> List[LambingRecord]:
         """获取母羊的产羔记录"""
-        return self.get_multi(filters={"dam_id": dam_id}, limit=20)
+        return self.get_multi(filters={"dam_id": dam_id}, limit=20, order_by="lambing_date")
+    
+    def get_by_lamb_details(self, criteria: List[Dict[str, Any]], limit: int = 100) -> List[LambingRecord]:
+        """按羔羊详情查询产羔记录 (如 [{"sex": "female"}] 即含母羔，@> 走GIN索引)"""
+        return self.db.query(LambingRecord).filter(
+            LambingRecord.lamb_details.contains(criteria),
+            LambingRecord.is_deleted == False
+        ).order_by(LambingRecord.lambing_date.desc()).limit(limit).all()
     
     def get_recent(self, days: int = 30) -> List[LambingRecord]:
         """获取最近产羔记录"""
@@ -107,24 +114,23 @@ class LambingRecordService(BaseService[LambingRecord, Any, Any]):
     
     def get_statistics(self, year: int = None) -> Dict[str, Any]:
         """获取产羔统计"""
-        query = self.db.query(LambingRecord).filter(LambingRecord.is_deleted == False)
+        # 聚合统计 (计数与汇总同一查询，均按年份过滤)
+        query = self.db.query(
+            func.count(LambingRecord.id).label('total'),
+            func.sum(LambingRecord.litter_size).label('total_born'),
+            func.sum(LambingRecord.born_alive).label('total_alive'),
+            func.avg(LambingRecord.litter_size).label('avg_litter_size')
+        ).filter(LambingRecord.is_deleted == False)
         
         if year:
             query = query.filter(
                 func.extract('year', LambingRecord.lambing_date) == year
             )
         
-        total = query.count()
-        
-        # 聚合统计
-        stats = self.db.query(
-            func.sum(LambingRecord.litter_size).label('total_born'),
-            func.sum(LambingRecord.born_alive).label('total_alive'),
-            func.avg(LambingRecord.litter_size).label('avg_litter_size')
-        ).filter(LambingRecord.is_deleted == False).first()
+        stats = query.one()
         
         return {
-            "total_lambings": total,
+            "total_lambings": stats.total,
             "total_lambs_born": stats.total_born or 0,
             "total_lambs_alive": stats.total_alive or 0,
             "average_litter_size": round(float(stats.avg_litter_size or 0), 2)
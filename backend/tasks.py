@@ -0,0 +1,221 @@
+# ============================================================================
+# 新星肉羊育种系统 - 异步任务
+# NovaBreed Sheep System - Async Tasks
+#
+# 文件: tasks.py
+# 功能: Celery应用及后台/定时任务 (docker-compose: celery -A tasks.celery_app)
+# ============================================================================
+
+from celery import Celery
+from celery.schedules import crontab
+from kombu import Queue
+import asyncio
+import logging
+
+from config import settings
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Celery应用
+# Celery Application
+# ============================================================================
+
+celery_app = Celery(
+    "sheep_breeding",
+    broker=settings.CELERY_BROKER_URL,
+    backend=settings.CELERY_RESULT_BACKEND,
+)
+
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    timezone="Asia/Shanghai",
+    # 计算密集任务逐条领取，避免长任务压住预取队列
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+)
+
+# 育种值评估队列 (RabbitMQ优先级队列: 0-9, 数值越大越优先)
+BREEDING_VALUE_QUEUE = "breeding_values.run"
+BREEDING_VALUE_MAX_PRIORITY = 9
+
+celery_app.conf.task_queues = (
+    Queue("celery"),
+    Queue(BREEDING_VALUE_QUEUE, queue_arguments={"x-max-priority": BREEDING_VALUE_MAX_PRIORITY}),
+)
+celery_app.conf.task_routes = {
+    "tasks.run_breeding_value_analysis": {"queue": BREEDING_VALUE_QUEUE},
+}
+
+# 定时任务
+celery_app.conf.beat_schedule = {
+    "refresh-animal-pedigree-flat": {
+        "task": "tasks.refresh_pedigree_flat",
+        "schedule": crontab(hour=2, minute=0),  # 每天凌晨2点
+    },
+    "recompute-growth-adg": {
+        "task": "tasks.recompute_growth_adg",
+        "schedule": crontab(hour=2, minute=30),
+    },
+    "reconcile-barn-counts": {
+        "task": "tasks.reconcile_barn_counts",
+        "schedule": crontab(hour=1, minute=30),
+    },
+    "reconcile-farm-stock": {
+        "task": "tasks.reconcile_farm_stock",
+        "schedule": crontab(hour=1, minute=45),
+    },
+    "refresh-stats-views": {
+        "task": "tasks.refresh_stats_views",
+        "schedule": crontab(minute=f"*/{settings.STATS_VIEW_REFRESH_MINUTES}"),
+    },
+    "ensure-monthly-partitions": {
+        "task": "tasks.ensure_partitions",
+        "schedule": crontab(hour=3, minute=0, day_of_month=1),  # 每月1日预建后续月份分区
+    },
+}
+
+# ============================================================================
+# 系谱任务
+# Pedigree Tasks
+# ============================================================================
+
+@celery_app.task(name="tasks.refresh_pedigree_flat")
+def refresh_pedigree_flat() -> None:
+    """刷新展平系谱物化视图"""
+    from models.animal import Animal
+
+    db = SessionLocal()
+    try:
+        Animal.refresh_pedigree_flat(db)
+        logger.info("展平系谱物化视图刷新完成")
+    finally:
+        db.close()
+
+
+# ============================================================================
+# 存栏计数任务
+# Stock Count Tasks
+# ============================================================================
+
+@celery_app.task(name="tasks.reconcile_barn_counts")
+def reconcile_barn_counts() -> None:
+    """按在舍记录校正羊舍当前数量 (转舍时只做增量计数)"""
+    from services.farm_service import BarnService
+
+    db = SessionLocal()
+    try:
+        BarnService(db).reconcile_counts()
+    finally:
+        db.close()
+
+
+@celery_app.task(name="tasks.reconcile_farm_stock")
+def reconcile_farm_stock() -> None:
+    """按在舍记录校正羊场存栏量"""
+    from services.farm_service import FarmService
+
+    db = SessionLocal()
+    try:
+        FarmService(db).reconcile_stock_counts()
+    finally:
+        db.close()
+
+
+# ============================================================================
+# 生长测定任务
+# Growth Tasks
+# ============================================================================
+
+@celery_app.task(name="tasks.recompute_growth_adg")
+def recompute_growth_adg() -> None:
+    """全量重算日增重 (补正历史数据修改/删除的影响)"""
+    from services.growth_service import GrowthRecordService
+
+    db = SessionLocal()
+    try:
+        GrowthRecordService(db).recompute_adg()
+    finally:
+        db.close()
+
+
+# ============================================================================
+# 统计视图任务
+# Stats View Tasks
+# ============================================================================
+
+@celery_app.task(name="tasks.refresh_stats_views")
+def refresh_stats_views() -> None:
+    """刷新统计看板的汇总物化视图"""
+    from models.feed import FeedingRecord
+    from models.growth import GrowthRecord
+
+    db = SessionLocal()
+    try:
+        for model in (FeedingRecord, GrowthRecord):
+            model.refresh_stats_view(db)
+    finally:
+        db.close()
+
+
+# ============================================================================
+# 分区维护任务
+# Partition Tasks
+# ============================================================================
+
+@celery_app.task(name="tasks.ensure_partitions")
+def ensure_partitions() -> None:
+    """预建饲喂记录、IoT数据的月度分区"""
+    from models.feed import FeedingRecord
+    from models.iot import IoTData
+
+    db = SessionLocal()
+    try:
+        for model in (FeedingRecord, IoTData):
+            model.ensure_partitions(db)
+        logger.info("月度分区检查完成")
+    finally:
+        db.close()
+
+
+# ============================================================================
+# 育种值评估任务
+# Breeding Value Tasks
+# ============================================================================
+
+# 按方法区分优先级: 系谱BLUP小而快，基因组/贝叶斯方法面向全群体且耗时
+METHOD_PRIORITY = {
+    "BLUP": 9,
+    "GBLUP": 5,
+    "ssGBLUP": 3,
+}
+DEFAULT_METHOD_PRIORITY = 1
+
+
+@celery_app.task(name="tasks.run_breeding_value_analysis")
+def run_breeding_value_analysis(run_id: int, method: str, model_spec: dict, use_gpu: bool = False) -> None:
+    """在独立worker进程中执行育种值评估"""
+    from api.v1.breeding_values import execute_breeding_value_analysis
+
+    asyncio.run(execute_breeding_value_analysis(
+        run_id=run_id,
+        method=method,
+        model_spec=model_spec,
+        use_gpu=use_gpu,
+    ))
+
+
+def enqueue_breeding_value_run(run_id: int, method: str, model_spec: dict, use_gpu: bool = False) -> None:
+    """发布育种值评估任务到RabbitMQ"""
+    run_breeding_value_analysis.apply_async(
+        kwargs={
+            "run_id": run_id,
+            "method": method,
+            "model_spec": model_spec,
+            "use_gpu": use_gpu,
+        },
+        priority=METHOD_PRIORITY.get(method, DEFAULT_METHOD_PRIORITY),
+    )
@@ -11,6 +11,14 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from fastapi.testclient import TestClient
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+
+
+@compiles(JSONB, "sqlite")
+def _compile_jsonb_sqlite(type_, compiler, **kw):
+    """SQLite测试库中 JSONB 列按 JSON 建表"""
+    return "JSON"
 
 
 @pytest.fixture(scope="session")
@@ -31,6 +39,42 @@ def db_session():
         db.close()
 
 
+@pytest.fixture
+def sqlite_session(request):
+    """
+    SQLite内存数据库会话，只建参数给出的模型表
+    
+    用法: @pytest.mark.parametrize("sqlite_session", [[Model, ...]], indirect=True)
+    与 SessionLocal 一样挂软删除过滤；JSONB 按 JSON 建表，ARRAY 等其余
+    PostgreSQL专有类型的表仍无法在此创建。外键指向未建模的表 (如 organizations)
+    时，建表期间临时登记只含主键的占位表
+    """
+    from sqlalchemy import create_engine, Table, Column, Integer
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models.base import exclude_soft_deleted
+    
+    tables = [model.__table__ for model in request.param]
+    missing = {
+        fk.target_fullname.split('.')[0]
+        for table in tables for fk in table.foreign_keys
+    } - set(Base.metadata.tables)
+    placeholders = [Table(name, Base.metadata, Column('id', Integer, primary_key=True)) for name in missing]
+    
+    engine = create_engine("sqlite:///:memory:", echo=False)
+    try:
+        Base.metadata.create_all(bind=engine, tables=tables)
+    finally:
+        for table in placeholders:
+            Base.metadata.remove(table)
+    session = exclude_soft_deleted(sessionmaker(bind=engine))()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
 @pytest.fixture
 def sample_farm_data():
     """示例羊场数据"""
@@ -165,6 +165,19 @@ class TestIoTAPI:
         """测试获取环境数据"""
         response = client.get("/api/v1/iot/environment/current")
         assert response.status_code == 200
+    
+    def test_upload_data_rejects_skewed_device_time(self):
+        """测试设备时钟偏差过大的数据点被拒收"""
+        response = client.post("/api/v1/iot/data", json={
+            "data_points": [{
+                "device_id": 1,
+                "metric_type": "temperature",
+                "metric_value": 25.5,
+                "time": "2000-01-01T00:00:00"
+            }]
+        })
+        assert response.status_code == 202
+        assert response.json() == {"received": 1, "accepted": 0}
 
 
 # ============================================================================
@@ -191,6 +204,16 @@ class TestFeedingAPI:
         """测试获取饲养统计"""
         response = client.get("/api/v1/feeding/statistics")
         assert response.status_code == 200
+    
+    def test_create_feeding_record_rejects_future_date(self):
+        """测试饲喂日期晚于次日被拒绝"""
+        response = client.post("/api/v1/feeding/records", json={
+            "barn_id": 1,
+            "feed_date": "2999-01-01",
+            "formula_id": 1,
+            "amount_kg": 50
+        })
+        assert response.status_code == 422
 
 
 # ============================================================================
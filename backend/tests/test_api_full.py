@@ -85,8 +85,8 @@ def test_iot_lifecycle():
         ]
     }
     res = client.post("/api/v1/iot/data", json=data_points)
-    assert res.status_code == 201
-    assert res.json()["processed"] == 1
+    assert res.status_code == 202
+    assert res.json()["accepted"] == 1
 
 def test_health_lifecycle():
     # Create Vaccine Record
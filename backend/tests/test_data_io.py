@@ -12,9 +12,15 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from models.breeding_value import BreedingValueRun, BreedingValueResult
 from services.data_io_service import DataImportExportService, data_io_service
 
 
+def check(validator, *values):
+    """对若干值执行列验证器，返回逐值结果"""
+    return validator(pd.Series(values)).tolist()
+
+
 class TestDataImportExportService:
     """数据导入导出服务测试"""
     
@@ -52,6 +58,64 @@ class TestDataImportExportService:
         assert 'farm_id' in required
         assert 'birth_date' in required
         assert 'gender' in required
+    
+    @pytest.mark.parametrize("entity_type", ['farms', 'animals'])
+    def test_shipped_configs_cover_model_columns(self, service, entity_type):
+        """测试内置模板列均映射到模型字段，且覆盖全部必填字段"""
+        config = service.ENTITY_CONFIGS[entity_type]
+        model = service._resolve_model(config)
+        
+        mapping = service._column_mapping(config, model)
+        
+        assert set(mapping) == set(config['required_columns'] + config['optional_columns'])
+        for column in model.__table__.columns:
+            if not (column.nullable or column.primary_key or column.default or column.server_default):
+                assert column.name in mapping.values()
+    
+    def test_animal_columns_mapped(self, service):
+        """测试种羊模板列名映射到模型字段名"""
+        config = service.ENTITY_CONFIGS['animals']
+        mapping = service._column_mapping(config, service._resolve_model(config))
+        
+        assert mapping['animal_id'] == 'animal_code'
+        assert mapping['farm_id'] == 'current_farm_id'
+        assert mapping['gender'] == 'sex'
+    
+    def test_unmapped_required_column_rejected(self, service):
+        """测试必填字段无对应模板列时返回400并列出字段"""
+        from fastapi import HTTPException
+        
+        config = dict(service.ENTITY_CONFIGS['farms'])
+        config['required_columns'] = ['code', 'name', 'farm_type', 'nickname']
+        
+        with pytest.raises(HTTPException) as exc:
+            service._column_mapping(config, service._resolve_model(config))
+        
+        assert exc.value.status_code == 400
+        assert 'nickname' in exc.value.detail
+        assert 'organization_id' in exc.value.detail
+    
+    @pytest.mark.asyncio
+    async def test_import_animals_uses_model_columns(self, service):
+        """测试种羊按模型字段名入库，性别取值归一"""
+        content = (
+            "animal_id,organization_id,farm_id,breed,birth_date,gender,notes\n"
+            "A001,1,2,湖羊,2024-03-01,M,x\n"
+        ).encode()
+        mock_file = MagicMock()
+        mock_file.filename = 'animals.csv'
+        mock_file.read = AsyncMock(return_value=content)
+        mock_file.seek = AsyncMock()
+        db = MagicMock()
+        
+        result = await service.import_data(mock_file, 'animals', db)
+        
+        assert result['success'] == 1
+        _, rows = db.execute.call_args.args
+        assert rows == [{
+            'animal_code': 'A001', 'organization_id': 1, 'current_farm_id': 2,
+            'breed': '湖羊', 'birth_date': '2024-03-01', 'sex': 'male',
+        }]
 
 
 class TestValidators:
@@ -64,24 +128,25 @@ class TestValidators:
     def test_farm_code_validator(self, service):
         """测试羊场代码验证"""
         validator = service.ENTITY_CONFIGS['farms']['validators']['code']
-        assert validator('FARM001') == True
-        assert validator('A' * 100) == False  # 超长
+        assert check(validator, 'FARM001') == [True]
+        assert check(validator, 'A' * 100) == [False]  # 超长
     
     def test_farm_type_validator(self, service):
         """测试羊场类型验证"""
         validator = service.ENTITY_CONFIGS['farms']['validators']['farm_type']
-        assert validator('breeding') == True
-        assert validator('commercial') == True
-        assert validator('research') == True
-        assert validator('invalid') == False
+        assert check(validator, 'breeding') == [True]
+        assert check(validator, 'commercial') == [True]
+        assert check(validator, 'research') == [True]
+        assert check(validator, 'invalid') == [False]
     
     def test_capacity_validator(self, service):
         """测试容量验证"""
         validator = service.ENTITY_CONFIGS['farms']['validators']['capacity']
-        assert validator(1000) == True
-        assert validator(1) == True
-        assert validator(0) == False
-        assert validator(-1) == False
+        assert check(validator, 1000) == [True]
+        assert check(validator, 1) == [True]
+        assert check(validator, 0) == [False]
+        assert check(validator, -1) == [False]
+        assert check(validator, 1.5, 'abc', None) == [False, False, False]
 
 
 class TestTemplateGeneration:
@@ -105,7 +170,22 @@ class TestTemplateGeneration:
         
         assert filename == 'animals_template.xlsx'
         assert len(content) > 0
-    
+
+    def test_generate_template_cached(self, service):
+        """测试模板按列配置缓存，重复下载返回同一内容"""
+        from openpyxl import load_workbook
+
+        first, _ = service.generate_template('farms')
+        second, _ = DataImportExportService().generate_template('farms')
+
+        assert second is first
+        ws = load_workbook(io.BytesIO(first)).active
+        assert [c.value for c in ws[1]][:5] == ['organization_id', 'code', 'name', 'farm_type', 'capacity']
+        assert ws['A2'].value == '必填'
+        assert ws['A2'].fill.start_color.rgb.endswith('FFCCC7')
+        assert ws['F2'].value == '选填'
+        assert [c.value for c in ws[3]][:5] == [1, 'FARM001', '示范羊场', 'breeding', 1000]
+
     def test_generate_template_invalid_entity(self, service):
         """测试生成无效实体模板抛出异常"""
         with pytest.raises(Exception):
@@ -137,6 +217,28 @@ class TestExportFunctionality:
         assert 'farms_export_' in filename
         assert len(content) > 0
     
+    @pytest.mark.asyncio
+    async def test_export_csv_content(self, service):
+        """测试CSV带BOM、表头在首行"""
+        content, _ = await service.export_data('farms', 'csv')
+        
+        assert content.startswith(b'\xef\xbb\xbf')
+        lines = content.decode('utf-8-sig').splitlines()
+        assert lines[0] == 'id,code,name,farm_type,capacity'
+        assert lines[1].startswith('1,FARM001,')
+    
+    @pytest.mark.asyncio
+    async def test_export_xlsx_content(self, service):
+        """测试Excel表头样式与数据行"""
+        from openpyxl import load_workbook
+        
+        content, _ = await service.export_data('farms', 'xlsx')
+        ws = load_workbook(io.BytesIO(content)).active
+        
+        assert ws.title == '数据'
+        assert ws['A1'].value == 'id' and ws['A1'].font.b
+        assert ws['B2'].value == 'FARM001'
+    
     @pytest.mark.asyncio
     async def test_export_invalid_format(self, service):
         """测试导出无效格式抛出异常"""
@@ -182,6 +284,29 @@ class TestPreviewFunctionality:
         assert 'is_valid' in result
         assert result['total_rows'] == 2
     
+    @pytest.mark.asyncio
+    async def test_preview_reports_invalid_rows(self, service):
+        """测试按列向量化验证，错误按行号排列"""
+        content = (
+            "code,name,farm_type,capacity\n"
+            "F1,羊场1,breeding,100\n"
+            "F2,羊场2,unknown,abc\n"
+            "F3,羊场3,research,0\n"
+        ).encode()
+        mock_file = MagicMock()
+        mock_file.filename = 'farms.csv'
+        mock_file.read = AsyncMock(return_value=content)
+        mock_file.seek = AsyncMock()
+        
+        result = await service.preview_file(mock_file, 'farms')
+        
+        assert result['is_valid'] is False
+        assert [(e['row'], e['column']) for e in result['errors']] == [
+            (3, 'farm_type'), (3, 'capacity'), (4, 'capacity')
+        ]
+        assert result['errors'][0]['error'] == '值 "unknown" 不是 breeding/commercial/research 之一'
+        assert result['errors'][1]['error'] == '值 "abc" 不是正整数'
+    
     @pytest.mark.asyncio
     async def test_preview_invalid_entity(self, service, valid_xlsx_file):
         """测试预览无效实体类型"""
@@ -189,6 +314,192 @@ class TestPreviewFunctionality:
             await service.preview_file(valid_xlsx_file, 'invalid_entity')
 
 
+class TestStreamImport:
+    """流式分批导入测试"""
+    
+    @pytest.fixture
+    def service(self):
+        service = DataImportExportService()
+        service.ENTITY_CONFIGS = {
+            'results': {
+                'model': 'BreedingValueResult',
+                'required_columns': ['run_id', 'animal_id', 'ebv'],
+                'optional_columns': ['reliability', 'accuracy'],
+                'validators': {'ebv': lambda s: pd.to_numeric(s).abs() < 10},
+            }
+        }
+        return service
+    
+    @staticmethod
+    def _upload(filename, content):
+        mock_file = MagicMock()
+        mock_file.filename = filename
+        mock_file.read = AsyncMock(return_value=content)
+        mock_file.seek = AsyncMock()
+        return mock_file
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    async def test_import_csv_in_batches(self, service, sqlite_session):
+        """测试CSV分批插入，不合规行跳过"""
+        from sqlalchemy import event
+        
+        content = (
+            "run_id,animal_id,ebv,reliability,accuracy,notes\n"
+            "1,1,0.5,0.8,0.9,\n1,2,0.7,0.8,0.9,x\n1,3,99,0.8,0.9,\n1,4,-0.2,0.8,0.9,\n1,5,1.1,0.8,0.9,\n"
+        ).encode()
+        inserts = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute",
+                     lambda conn, cursor, stmt, *args: stmt.startswith("INSERT") and inserts.append(stmt))
+        
+        result = await service.import_data(self._upload('ebv.csv', content), 'results', sqlite_session, batch_size=2)
+        
+        assert result['success'] == 4
+        assert result['failed'] == 1
+        assert result['errors'][0]['row'] == 4
+        assert len(inserts) == 3
+        assert sqlite_session.query(BreedingValueResult).count() == 4
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    async def test_import_rolls_back_on_insert_failure(self, service, sqlite_session):
+        """测试任一批入库失败时整个文件回滚"""
+        
+        content = (
+            "run_id,animal_id,ebv,reliability,accuracy\n"
+            "1,1,0.5,0.8,0.9\n1,2,0.7,0.8,0.9\n1,3,0.1,,0.9\n"
+        ).encode()
+        
+        result = await service.import_data(self._upload('ebv.csv', content), 'results', sqlite_session, batch_size=2)
+        
+        assert result['success'] == 0
+        assert result['failed'] == 3
+        assert result['errors'][0]['row'] == '4-4'
+        assert sqlite_session.query(BreedingValueResult).count() == 0
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    async def test_import_xlsx_streaming(self, service, sqlite_session):
+        """测试XLSX只读逐行读取"""
+        
+        df = pd.DataFrame({
+            'run_id': [1] * 3, 'animal_id': [1, 2, 3], 'ebv': [0.1, 0.2, 0.3],
+            'reliability': [0.8] * 3, 'accuracy': [0.9] * 3
+        })
+        buffer = io.BytesIO()
+        df.to_excel(buffer, index=False)
+        
+        result = await service.import_data(self._upload('ebv.xlsx', buffer.getvalue()), 'results', sqlite_session)
+        
+        assert result == {'success': 3, 'failed': 0, 'errors': []}
+        assert sqlite_session.query(BreedingValueResult).count() == 3
+    
+    def test_iter_xlsx_skips_blank_header_columns(self, service):
+        """测试空表头列不致后续列错位，空行跳过"""
+        from openpyxl import Workbook
+        
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['run_id', None, 'animal_id'])
+        ws.append([1, '备注', 7])
+        ws.append([None, None, None])
+        ws.append([2])
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        
+        assert list(service._iter_xlsx(buffer.getvalue())) == [
+            {'run_id': 1, 'animal_id': 7},
+            {'run_id': 2, 'animal_id': None},
+        ]
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    async def test_import_missing_columns(self, service, sqlite_session):
+        """测试缺少必填列时不入库"""
+        result = await service.import_data(self._upload('ebv.csv', b"run_id,ebv\n1,0.5\n"), 'results', sqlite_session)
+        
+        assert result['success'] == 0
+        assert 'animal_id' in result['errors'][0]['error']
+
+
+class TestStreamExport:
+    """流式导出测试"""
+    
+    @pytest.fixture
+    def service(self):
+        return DataImportExportService()
+    
+    @pytest.fixture
+    def db_session(self):
+        """带样例数据的SQLite内存会话"""
+        from decimal import Decimal
+        from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Numeric
+        from sqlalchemy.orm import Session
+        
+        engine = create_engine("sqlite:///:memory:")
+        metadata = MetaData()
+        table = Table(
+            'stream_rows', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('code', String(20)),
+            Column('ebv', Numeric(8, 3)),
+        )
+        metadata.create_all(engine)
+        session = Session(engine)
+        session.execute(table.insert(), [
+            {'id': 1, 'code': 'SH001', 'ebv': Decimal('1.250')},
+            {'id': 2, 'code': '羊002', 'ebv': Decimal('-0.500')},
+        ])
+        session.commit()
+        yield session, table
+        session.close()
+    
+    def test_stream_ndjson(self, service, db_session):
+        """测试NDJSON逐行输出"""
+        import json
+        from sqlalchemy import select
+        
+        session, table = db_session
+        stmt = select(table).order_by(table.c.id)
+        body = b''.join(service.stream_export(stmt, 'ndjson', session))
+        lines = [json.loads(line) for line in body.splitlines()]
+        
+        assert lines == [
+            {'id': 1, 'code': 'SH001', 'ebv': 1.25},
+            {'id': 2, 'code': '羊002', 'ebv': -0.5},
+        ]
+    
+    def test_stream_csv(self, service, db_session):
+        """测试CSV输出带BOM和表头"""
+        from sqlalchemy import select
+        
+        session, table = db_session
+        stmt = select(table).order_by(table.c.id)
+        text = b''.join(service.stream_export(stmt, 'csv', session)).decode('utf-8')
+        
+        assert text.startswith('\ufeffid,code,ebv')
+        assert text.splitlines()[2] == '2,羊002,-0.500'
+    
+    def test_stream_csv_empty(self, service, db_session):
+        """测试空结果仍输出表头"""
+        from sqlalchemy import select
+        
+        session, table = db_session
+        stmt = select(table).where(table.c.id < 0)
+        text = b''.join(service.stream_export(stmt, 'csv', session)).decode('utf-8')
+        
+        assert text.strip() == '\ufeffid,code,ebv'
+    
+    def test_stream_invalid_format(self, service, db_session):
+        """测试不支持的格式"""
+        from fastapi import HTTPException
+        from sqlalchemy import select
+        
+        session, table = db_session
+        with pytest.raises(HTTPException):
+            list(service.stream_export(select(table), 'xml', session))
+
+
 class TestDataSecurity:
     """数据安全测试"""
     
@@ -202,18 +513,18 @@ class TestDataSecurity:
         validator = service.ENTITY_CONFIGS['farms']['validators']['farm_type']
         
         # SQL注入尝试
-        assert validator("'; DROP TABLE farms; --") == False
-        assert validator("breeding OR 1=1") == False
+        assert check(validator, "'; DROP TABLE farms; --") == [False]
+        assert check(validator, "breeding OR 1=1") == [False]
     
     def test_xss_prevention_in_names(self, service):
         """测试名称字段XSS防护"""
         validator = service.ENTITY_CONFIGS['farms']['validators']['name']
         
         # 正常名称应该通过
-        assert validator('正常羊场名称') == True
+        assert check(validator, '正常羊场名称') == [True]
         
         # 超长名称应该被拒绝
-        assert validator('x' * 200) == False
+        assert check(validator, 'x' * 200) == [False]
 
 
 if __name__ == '__main__':
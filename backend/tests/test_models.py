@@ -17,6 +17,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from database import Base
+from models.breeding_value import BreedingValueRun, BreedingValueResult
+from models.farm import AnimalLocation
 
 
 # ============================================================================
@@ -165,6 +167,31 @@ class TestAnimalLocationModel:
         
         location.close("转移")
         assert location.is_current == False
+        assert isinstance(location.exit_date, datetime)
+    
+    @pytest.mark.parametrize("sqlite_session", [[AnimalLocation]], indirect=True)
+    def test_location_close_persisted(self, sqlite_session):
+        """测试已持久化记录的关闭与批量关闭"""
+        
+        locations = [
+            AnimalLocation(animal_id=i, farm_id=1, barn_id=1, entry_date=datetime.now())
+            for i in range(1, 5)
+        ]
+        sqlite_session.add_all(locations)
+        sqlite_session.commit()
+        
+        locations[0].close("转移")
+        sqlite_session.commit()
+        assert locations[0].is_current == False
+        assert locations[0].exit_reason == "转移"
+        
+        ids = [loc.id for loc in locations]
+        assert AnimalLocation.bulk_close(sqlite_session, ids, "整栏转群") == 3
+        assert AnimalLocation.bulk_close(sqlite_session, [], "整栏转群") == 0
+        sqlite_session.commit()
+        
+        assert sqlite_session.query(AnimalLocation).filter(AnimalLocation.exit_date == None).count() == 0
+        assert sqlite_session.get(AnimalLocation, ids[0]).exit_reason == "转移"
 
 
 # ============================================================================
@@ -217,6 +244,23 @@ class TestAnimalModel:
         )
         assert adult_animal.is_adult == True
 
+    def test_animal_ancestors_transient(self):
+        """测试未持久化动物的祖先列表"""
+        from models.animal import Animal
+
+        animal = Animal(animal_code="SH2024003", breed="杜泊羊", sex="male")
+        assert animal.ancestors == []
+
+    def test_animal_ancestors_expression(self):
+        """测试祖先数组的SQL表达式"""
+        from sqlalchemy import select
+        from sqlalchemy.dialects import postgresql
+        from models.animal import Animal
+
+        stmt = select(Animal.id).where(Animal.ancestors.contains([1]))
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert "animal_pedigree_flat" in sql
+
 
 # ============================================================================
 # Health模型测试
@@ -392,6 +436,42 @@ class TestBaseMixins:
         
         assert farm.is_deleted == False
         assert farm.deleted_at is None
+    
+    def test_to_dict(self):
+        """测试字典序列化 (键为列名，metadata列取映射属性值)"""
+        from models.farm import Farm
+        
+        farm = Farm(
+            organization_id=1,
+            code="DICT001",
+            name="序列化羊场",
+            farm_type="breeding",
+            status="active",
+            metadata_={"source": "test"}
+        )
+        
+        data = farm.to_dict()
+        
+        assert set(data) == {c.name for c in Farm.__table__.columns}
+        assert data['code'] == "DICT001"
+        assert data['metadata'] == {"source": "test"}
+        assert Farm.__dict__['_to_dict_impl'] is not None
+        assert farm.to_dict() == data
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    def test_bulk_insert(self, sqlite_session):
+        """测试批量插入"""
+        
+        rows = [
+            {"run_id": 1, "animal_id": i, "ebv": 0.1 * i, "reliability": 0.8, "accuracy": 0.9}
+            for i in range(1, 4)
+        ]
+        BreedingValueResult.bulk_insert(sqlite_session, rows)
+        BreedingValueResult.bulk_insert(sqlite_session, [])
+        sqlite_session.commit()
+        
+        assert sqlite_session.query(BreedingValueResult).count() == 3
+        assert sqlite_session.query(BreedingValueResult).filter_by(is_deleted=False).count() == 3
 
 
 # ============================================================================
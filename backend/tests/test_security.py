@@ -29,8 +29,8 @@ class TestPasswordSecurity:
         hashed = hash_password(password)
         
         assert hashed != password
-        assert len(hashed) > 50  # bcrypt哈希较长
-        assert hashed.startswith('$2')  # bcrypt格式
+        assert len(hashed) > 50  # argon2哈希较长
+        assert hashed.startswith('$argon2id$')  # argon2id格式
     
     def test_verify_password_correct(self):
         """测试正确密码验证"""
@@ -46,6 +46,22 @@ class TestPasswordSecurity:
         
         assert verify_password("WrongPassword", hashed) == False
     
+    def test_legacy_bcrypt_hash_upgraded(self):
+        """测试旧bcrypt哈希验证通过后升级为argon2id"""
+        import asyncio
+        from security import pwd_context, verify_and_update_password, verify_password_async
+        
+        password = "TestPassword123!"
+        legacy = pwd_context.handler("bcrypt").hash(password)
+        
+        assert verify_password(password, legacy) == True
+        valid, new_hash = verify_and_update_password(password, legacy)
+        assert valid == True
+        assert new_hash.startswith('$argon2id$')
+        
+        assert verify_and_update_password("WrongPassword", legacy) == (False, None)
+        assert asyncio.run(verify_password_async(password, new_hash)) == (True, None)
+    
     def test_password_strength_valid(self):
         """测试有效密码强度"""
         valid, msg = validate_password_strength("StrongP@ss123")
@@ -98,6 +114,19 @@ class TestJWTSecurity:
         assert "exp" in decoded
         assert "iat" in decoded
     
+    def test_token_expiry(self):
+        """测试令牌有效期"""
+        from datetime import timedelta
+        from config import settings
+        
+        access = decode_token(create_access_token({"sub": "user"}))
+        custom = decode_token(create_access_token({"sub": "user"}, timedelta(minutes=5)))
+        refresh = decode_token(create_refresh_token({"sub": "user"}))
+        
+        assert access["exp"] - access["iat"] == settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        assert custom["exp"] - custom["iat"] == 300
+        assert refresh["exp"] - refresh["iat"] == settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+    
     def test_decode_invalid_token(self):
         """测试解码无效令牌"""
         result = decode_token("invalid.token.here")
@@ -113,6 +142,34 @@ class TestJWTSecurity:
         
         assert access_decoded["type"] == "access"
         assert refresh_decoded["type"] == "refresh"
+    
+    def test_require_auth_decodes_once(self, monkeypatch):
+        """测试同时依赖 get_current_user 与 require_auth 时令牌只解码一次"""
+        from fastapi import FastAPI, Depends
+        from fastapi.testclient import TestClient
+        import security
+        
+        calls = []
+        real_decode = security.decode_token
+        monkeypatch.setattr(security, "decode_token", lambda t: calls.append(t) or real_decode(t))
+        
+        app = FastAPI()
+        
+        @app.get("/me")
+        async def me(
+            user: dict = Depends(security.require_auth),
+            current: dict = Depends(security.get_current_user)
+        ):
+            return {"sub": user["sub"], "same": user is current}
+        
+        client = TestClient(app)
+        token = create_access_token({"sub": "user123"})
+        response = client.get("/me", headers={"Authorization": f"Bearer {token}"})
+        
+        assert response.json() == {"sub": "user123", "same": True}
+        assert len(calls) == 1
+        assert client.get("/me").status_code == 401
+        assert client.get("/me", headers={"Authorization": "Bearer bad"}).status_code == 401
 
 
 class TestInputSanitization:
@@ -151,6 +208,11 @@ class TestInputSanitization:
         assert '/' not in cleaned
         assert '\\' not in cleaned
     
+    def test_sanitize_filename_keeps_word_characters(self):
+        """测试文件名清理保留中文/字母数字，移除标点"""
+        assert sanitize_filename('羊场报告，2024/v1 (final).xlsx') == '羊场报告2024v1 final.xlsx'
+        assert sanitize_filename('a\\b<c>.csv') == 'abc.csv'
+    
     def test_sanitize_filename_limits_length(self):
         """测试文件名清理限制长度"""
         long_name = 'a' * 500 + '.txt'
@@ -170,6 +232,20 @@ class TestInputSanitization:
         assert validate_sql_identifier('has spaces') == False
         assert validate_sql_identifier('has-dashes') == False
         assert validate_sql_identifier("'; DROP TABLE --") == False
+    
+    def test_secure_input_rejects_injection(self):
+        """测试安全输入模型检测脚本注入"""
+        from pydantic import ValidationError
+        from security import SecureInput
+        
+        class Note(SecureInput):
+            text: str
+        
+        assert Note(text="  母羊产双羔 ").text == "母羊产双羔"
+        assert Note(text="ratio: 1:2 = 0.5").text == "ratio: 1:2 = 0.5"
+        for bad in ["<SCRIPT>alert(1)</script>", "javascript:alert(1)", "img onerror=x"]:
+            with pytest.raises(ValidationError):
+                Note(text=bad)
 
 
 class TestRateLimiting:
@@ -213,6 +289,53 @@ class TestRateLimiting:
         
         remaining = limiter.get_remaining("test_ip3", max_requests=10)
         assert remaining == 8
+    
+    def test_rate_limiter_window_expiry(self, monkeypatch):
+        """测试窗口过期后恢复配额"""
+        import security
+        
+        now = [1000.0]
+        monkeypatch.setattr(security.time, "monotonic", lambda: now[0])
+        limiter = RateLimiter()
+        
+        for _ in range(3):
+            assert limiter.is_allowed("test_ip4", max_requests=3, window_seconds=60) == True
+        assert limiter.is_allowed("test_ip4", max_requests=3, window_seconds=60) == False
+        
+        now[0] += 61
+        assert limiter.get_remaining("test_ip4", max_requests=3, window_seconds=60) == 3
+        assert limiter.is_allowed("test_ip4", max_requests=3, window_seconds=60) == True
+    
+    def test_redis_rate_limiter(self):
+        """测试Redis速率限制及故障回退"""
+        import asyncio
+        from security import RedisRateLimiter
+        
+        class FakeRedis:
+            def __init__(self):
+                self.counts = {}
+            
+            def register_script(self, script):
+                async def run(keys, args):
+                    self.counts[keys[0]] = self.counts.get(keys[0], 0) + 1
+                    return self.counts[keys[0]]
+                return run
+        
+        class BrokenRedis:
+            def register_script(self, script):
+                async def run(keys, args):
+                    raise ConnectionError("redis down")
+                return run
+        
+        async def check(limiter, times):
+            return [await limiter.is_allowed("ip5", max_requests=2) for _ in range(times)]
+        
+        fake = FakeRedis()
+        assert asyncio.run(check(RedisRateLimiter(client=fake), 3)) == [True, True, False]
+        assert len(fake.counts) == 1
+        assert next(iter(fake.counts)).startswith("ratelimit:ip5:")
+        
+        assert asyncio.run(check(RedisRateLimiter(client=BrokenRedis()), 3)) == [True, True, False]
 
 
 class TestCSRFProtection:
@@ -238,6 +361,15 @@ class TestCSRFProtection:
         
         assert verify_csrf_token(token1, token2) == False
     
+    def test_verify_csrf_token_bytes(self):
+        """测试会话中保存bytes令牌及非ASCII输入"""
+        token = generate_csrf_token()
+        stored = token.encode('ascii')
+        
+        assert verify_csrf_token(token, stored) == True
+        assert verify_csrf_token(stored, stored) == True
+        assert verify_csrf_token("令牌", stored) == False
+    
     def test_csrf_tokens_unique(self):
         """测试CSRF令牌唯一"""
         tokens = [generate_csrf_token() for _ in range(100)]
@@ -270,6 +402,18 @@ class TestAPIKeyManagement:
         
         assert hashed != key
         assert len(hashed) == 64  # SHA256输出长度
+        assert hash_api_key(key.encode()) == hashed
+    
+    def test_verify_api_key(self):
+        """测试API密钥验证"""
+        from security import verify_api_key
+        
+        key = generate_api_key()
+        hashed = hash_api_key(key)
+        
+        assert verify_api_key(key, hashed) == True
+        assert verify_api_key(key.encode(), hashed) == True
+        assert verify_api_key(generate_api_key(), hashed) == False
 
 
 class TestSecurityLogging:
@@ -17,6 +17,11 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from database import Base
+from models.breeding_value import BreedingValueRun, BreedingValueResult
+from models.farm import Farm, Barn, AnimalLocation
+from models.feed import FeedType, FeedInventory
+from models.growth import GrowthRecord
+from models.iot import AutoWeighingRecord
 
 
 # ============================================================================
@@ -195,6 +200,242 @@ class TestBaseService:
         count = service.count()
         
         assert count >= 3
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun]], indirect=True)
+    def test_search(self, sqlite_session):
+        """测试模糊搜索 (不区分大小写，通配符按字面匹配)"""
+        from services.base import BaseService
+        
+        for name in ("Spring BLUP", "spring_gblup", "Autumn 100%"):
+            sqlite_session.add(BreedingValueRun(run_name=name, trait_id=1, method="BLUP"))
+        sqlite_session.commit()
+        
+        service = BaseService(BreedingValueRun, sqlite_session)
+        
+        assert {r.run_name for r in service.search("SPRING", field="run_name")} == {"Spring BLUP", "spring_gblup"}
+        assert [r.run_name for r in service.search("g_g", field="run_name")] == ["spring_gblup"]
+        assert [r.run_name for r in service.search("0%", field="run_name")] == ["Autumn 100%"]
+        assert service.search("spring", field="run_name", filters={"method": "GBLUP"}) == []
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun]], indirect=True)
+    def test_get_multi_mappings(self, sqlite_session):
+        """测试按列返回字典行"""
+        from services.base import BaseService
+        
+        for i, method in enumerate(["BLUP", "GBLUP", "BLUP"], start=1):
+            sqlite_session.add(BreedingValueRun(run_name=f"run{i}", trait_id=1, method=method))
+        sqlite_session.commit()
+        sqlite_session.expunge_all()
+        
+        service = BaseService(BreedingValueRun, sqlite_session)
+        rows = service.get_multi_mappings(["id", "run_name"], filters={"method": "BLUP"})
+        
+        assert [dict(r) for r in rows] == [{"id": 3, "run_name": "run3"}, {"id": 1, "run_name": "run1"}]
+        assert len(sqlite_session.identity_map) == 0
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    def test_get_multi_raiseload(self, monkeypatch, sqlite_session):
+        """测试严格模式下列表查询禁止关系延迟加载"""
+        from sqlalchemy.exc import InvalidRequestError
+        from config import settings
+        from services.base import BaseService
+        
+        sqlite_session.add(BreedingValueRun(run_name="run1", trait_id=1, method="BLUP"))
+        sqlite_session.commit()
+        sqlite_session.expunge_all()
+        
+        service = BaseService(BreedingValueRun, sqlite_session)
+        
+        monkeypatch.setattr(settings, "ORM_RAISE_ON_LAZY_LOAD", True)
+        run = service.get_multi()[0]
+        with pytest.raises(InvalidRequestError):
+            run.results
+        sqlite_session.expunge_all()
+        
+        monkeypatch.setattr(settings, "ORM_RAISE_ON_LAZY_LOAD", False)
+        assert service.get_multi()[0].results == []
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    def test_get_by_field_cached_per_session(self, sqlite_session):
+        """测试按字段查询在会话内缓存，写入后失效"""
+        from sqlalchemy import event
+        from services.base import BaseService
+        
+        service = BaseService(BreedingValueRun, sqlite_session)
+        selects = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute",
+                     lambda conn, cursor, stmt, *args: stmt.startswith("SELECT") and selects.append(stmt))
+        
+        assert service.get_by_field("run_name", "run1") is None
+        assert service.get_by_field("run_name", "run1") is None
+        assert len(selects) == 1
+        
+        sqlite_session.add(BreedingValueRun(run_name="run1", trait_id=1, method="BLUP"))
+        run = service.get_by_field("run_name", "run1")
+        assert run is not None
+        assert service.get_by_field("run_name", "run1") is run
+        assert len(selects) == 2
+        
+        sqlite_session.commit()
+        assert service.exists(run.id) is True
+        assert service.exists(run.id + 1) is False
+        assert service.exists_by_field("run_name", "run1") is True
+        assert service.exists_by_field("run_name", "run2") is False
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun]], indirect=True)
+    def test_get_by_field_in_primes_cache(self, sqlite_session):
+        """测试批量按字段获取为一次查询，并预填 get_by_field 的会话缓存"""
+        from sqlalchemy import event
+        from services.base import BaseService
+        
+        for name in ("run1", "run2", "run3"):
+            sqlite_session.add(BreedingValueRun(run_name=name, trait_id=1, method="BLUP"))
+        sqlite_session.commit()
+        
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        service = BaseService(BreedingValueRun, sqlite_session)
+        
+        found = service.get_by_field_in("run_name", ["run1", "run3", "missing", "run1"])
+        assert sorted(found) == ["run1", "run3"]
+        assert len(statements) == 1
+        
+        assert service.get_by_field("run_name", "run3") is found["run3"]
+        assert service.get_by_field("run_name", "missing") is None
+        assert len(statements) == 1
+        assert service.get_by_field_in("run_name", []) == {}
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    def test_filters_use_column_map(self, sqlite_session):
+        """测试过滤/排序按映射列解析，未知键忽略"""
+        from sqlalchemy import event
+        from services.base import BaseService
+        from models.farm import Farm
+        
+        BreedingValueResult.bulk_insert(sqlite_session, [
+            {"run_id": run_id, "animal_id": i, "ebv": 0.1 * i, "reliability": 0.8, "accuracy": 0.9}
+            for run_id in (1, 2) for i in range(1, 4)
+        ])
+        sqlite_session.commit()
+        
+        service = BaseService(BreedingValueResult, sqlite_session)
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        assert service.count(filters={"run_id": 1, "no_such_field": 1, "animal_id": None}) == 3
+        # 直接 count(*)，不包 SELECT ... 子查询
+        assert statements[0].startswith("SELECT count(*) AS count_1 \nFROM breeding_value_results \nWHERE")
+        results = service.get_multi(filters={"run_id": 2}, order_by="ebv", order_desc=False)
+        assert [r.animal_id for r in results] == [1, 2, 3]
+        
+        # 属性名与列名不同的列按属性名解析
+        farm_columns = BaseService(Farm, sqlite_session)._columns
+        assert "metadata_" in farm_columns and "metadata" not in farm_columns
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun]], indirect=True)
+    def test_soft_deleted_excluded_by_session_criteria(self, sqlite_session):
+        """测试软删除记录由会话统一过滤，include_deleted 可读回"""
+        from sqlalchemy import select
+        from services.base import BaseService
+        
+        for name in ("kept", "gone"):
+            sqlite_session.add(BreedingValueRun(run_name=name, trait_id=1, method="BLUP"))
+        sqlite_session.commit()
+        
+        service = BaseService(BreedingValueRun, sqlite_session)
+        assert service.delete(2) is True
+        
+        assert service.get(2) is None
+        assert service.get_by_field("run_name", "gone") is None
+        assert [r.id for r in service.get_multi()] == [1]
+        assert [dict(r) for r in service.get_multi_mappings(["id"])] == [{"id": 1}]
+        assert service.search("o", field="run_name") == []
+        assert service.count() == 1
+        assert service.exists(2) is False
+        assert sqlite_session.scalars(select(BreedingValueRun.id)).all() == [1]
+        assert sqlite_session.scalars(
+            select(BreedingValueRun.id).execution_options(include_deleted=True)
+        ).all() == [1, 2]
+        
+        assert service.restore(2).run_name == "gone"
+        assert service.count() == 2
+    
+    @pytest.mark.parametrize("sqlite_session", [[FeedType, FeedInventory]], indirect=True)
+    def test_soft_deleted_lookup_parent_keeps_children(self, monkeypatch, sqlite_session):
+        """测试字典表父行软删除后，引用它的记录仍出现在列表/详情中且与计数一致"""
+        from config import settings
+        from services.feed_service import FeedInventoryService
+        
+        monkeypatch.setattr(settings, "DICTIONARY_CACHE_ENABLED", False)
+        sqlite_session.add_all([
+            FeedType(id=1, feed_code="F1", name="玉米", category="concentrate"),
+            FeedInventory(id=1, farm_id=1, feed_type_id=1, current_quantity=50),
+        ])
+        sqlite_session.commit()
+        sqlite_session.get(FeedType, 1).soft_delete()
+        sqlite_session.commit()
+        sqlite_session.expunge_all()
+        
+        service = FeedInventoryService(sqlite_session)
+        assert service.count() == 1
+        assert [i.id for i in service.get_multi()] == [1]
+        inventory = service.get(1)
+        assert inventory is not None and inventory.feed_type.feed_code == "F1"
+        # 直接查询字典表仍过滤已删除行
+        assert sqlite_session.query(FeedType).all() == []
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    def test_update_field_single_statement(self, sqlite_session):
+        """测试单字段更新为一条 UPDATE ... RETURNING"""
+        from sqlalchemy import event
+        from services.base import BaseService
+        
+        run = BreedingValueRun(run_name="run1", trait_id=1, method="BLUP")
+        sqlite_session.add(run)
+        sqlite_session.commit()
+        run_id = run.id
+        
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute",
+                     lambda conn, cursor, stmt, *args: statements.append(stmt))
+        service = BaseService(BreedingValueRun, sqlite_session)
+        updated = service.update_field(run_id, "status", "completed")
+        
+        assert len(statements) == 1
+        assert statements[0].startswith("UPDATE") and "RETURNING" in statements[0]
+        assert updated is run and updated.status == "completed"
+        assert service.update_field(run_id + 1, "status", "failed") is None
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+    def test_eager_loads(self, monkeypatch, sqlite_session):
+        """测试 eager_loads 声明的关系在严格模式下仍预加载"""
+        from sqlalchemy.exc import InvalidRequestError
+        from sqlalchemy.orm import selectinload
+        from config import settings
+        from services.base import BaseService
+        
+        class RunService(BaseService):
+            eager_loads = (selectinload(BreedingValueRun.results),)
+        
+        run = BreedingValueRun(run_name="run1", trait_id=1, method="BLUP")
+        run.results.append(BreedingValueResult(animal_id=1, ebv=0.5, reliability=0.8, accuracy=0.9))
+        sqlite_session.add(run)
+        sqlite_session.commit()
+        run_id = run.id
+        sqlite_session.expunge_all()
+        
+        monkeypatch.setattr(settings, "ORM_RAISE_ON_LAZY_LOAD", True)
+        service = RunService(BreedingValueRun, sqlite_session)
+        assert len(service.get_multi()[0].results) == 1
+        sqlite_session.expunge_all()
+        assert len(service.get(run_id).results) == 1
+        sqlite_session.expunge_all()
+        
+        plain = BaseService(BreedingValueRun, sqlite_session)
+        loaded = plain.get_multi(with_options=[selectinload(BreedingValueRun.results)])[0]
+        assert len(loaded.results) == 1
+        sqlite_session.expunge_all()
+        with pytest.raises(InvalidRequestError):
+            plain.get_multi()[0].results
 
 
 # ============================================================================
@@ -250,6 +491,38 @@ class TestFarmService:
         assert dashboard["farm_id"] == farm.id
         assert dashboard["farm_name"] == "仪表板测试"
         assert "capacity_usage" in dashboard
+    
+    @pytest.mark.parametrize("sqlite_session", [[Farm, AnimalLocation]], indirect=True)
+    def test_stock_count_statements(self, sqlite_session):
+        """测试存栏量更新/校正均为单条 UPDATE 相关子查询"""
+        from sqlalchemy import event
+        from services.farm_service import FarmService
+        
+        now = datetime.now()
+        sqlite_session.add_all([
+            Farm(id=farm_id, organization_id=1, code=f"F{farm_id}", name=f"羊场{farm_id}",
+                 farm_type="breeding", current_stock=0)
+            for farm_id in (1, 2, 3)
+        ])
+        sqlite_session.add_all([
+            AnimalLocation(animal_id=animal_id, farm_id=1 if animal_id < 4 else 2, barn_id=1,
+                           entry_date=now, exit_date=now if animal_id == 1 else None)
+            for animal_id in range(1, 6)
+        ])
+        sqlite_session.commit()
+        
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        service = FarmService(sqlite_session)
+        
+        assert service.update_stock_count(1) == 2
+        assert service.update_stock_count(99) == 0
+        # 羊场1已校正、羊场3本就为0，只改羊场2
+        assert service.reconcile_stock_counts() == 1
+        assert len(statements) == 3 and all(sql.startswith("UPDATE farms") for sql in statements)
+        
+        stocks = dict(sqlite_session.query(Farm.id, Farm.current_stock))
+        assert stocks == {1: 2, 2: 2, 3: 0}
 
 
 # ============================================================================
@@ -317,6 +590,753 @@ class TestBarnService:
         barn.current_count = 5
         db_session.commit()
         assert service.is_full(barn.id) == False
+    
+    @pytest.mark.parametrize("sqlite_session", [[Barn]], indirect=True)
+    def test_get_available_capacity_by_farm(self, sqlite_session):
+        """测试多羊场空位一次查询并按羊场分组"""
+        from sqlalchemy import event
+        from services.farm_service import BarnService
+        
+        for barn_id, farm_id, count, status in ((11, 1, 9, "active"), (10, 1, 7, "active"),
+                                                (12, 1, 10, "active"), (20, 2, 5, "active"),
+                                                (21, 2, 0, "maintenance"), (30, 3, 10, "active")):
+            sqlite_session.add(Barn(id=barn_id, farm_id=farm_id, code=f"B{barn_id}", name=f"羊舍{barn_id}",
+                                    barn_type="fattening", capacity=10, current_count=count, status=status))
+        sqlite_session.commit()
+        
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        service = BarnService(sqlite_session)
+        
+        capacity = service.get_available_capacity_by_farm([1, 2, 3, 4])
+        
+        # 满舍、停用舍不计，羊场内按羊舍ID排序
+        assert capacity == {1: [(10, 3), (11, 1)], 2: [(20, 5)], 3: [], 4: []}
+        assert len(statements) == 1
+        assert service.get_available_capacity_by_farm([]) == {}
+        assert len(statements) == 1
+
+
+# ============================================================================
+# AnimalLocationService测试
+# ============================================================================
+
+class TestAnimalLocationService:
+    """动物位置服务测试"""
+    
+    @pytest.mark.parametrize("sqlite_session", [[AnimalLocation]], indirect=True)
+    def test_stream_barn_animals(self, monkeypatch, sqlite_session):
+        """测试流式读取在舍动物按批取回，结果与列表查询一致"""
+        from datetime import datetime
+        from services import farm_service
+        from services.farm_service import AnimalLocationService
+        
+        now = datetime.now()
+        for animal_id in range(1, 8):
+            sqlite_session.add(AnimalLocation(
+                animal_id=animal_id, farm_id=1, barn_id=1 if animal_id < 7 else 2,
+                entry_date=now, exit_date=now if animal_id == 1 else None
+            ))
+        sqlite_session.commit()
+        sqlite_session.expunge_all()
+        
+        monkeypatch.setattr(farm_service, "STREAM_BATCH_SIZE", 2)
+        service = AnimalLocationService(sqlite_session)
+        result = service.stream_barn_animals(1)
+        
+        assert [len(batch) for batch in result.partitions()] == [2, 2, 1]
+        assert sorted(loc.animal_id for loc in service.stream_barn_animals(1)) == [2, 3, 4, 5, 6]
+        assert {loc.animal_id for loc in service.get_barn_animals(1)} == {2, 3, 4, 5, 6}
+
+
+# ============================================================================
+# BreedingValueResultService测试
+# ============================================================================
+
+@pytest.mark.parametrize("sqlite_session", [[BreedingValueRun, BreedingValueResult]], indirect=True)
+class TestBreedingValueResultService:
+    """育种值结果服务测试 (SQLite 3.25+ 支持窗口函数)"""
+    
+    def test_recompute_percentiles(self, sqlite_session):
+        """测试按运行批次重算百分位排名"""
+        from services.breeding_value_service import BreedingValueResultService
+        
+        for run_id in (1, 2):
+            sqlite_session.add(BreedingValueRun(id=run_id, run_name=f"run{run_id}", trait_id=1, method="BLUP"))
+        for animal_id, ebv in enumerate([0.5, -1.0, 2.0, 1.0, 1.5], start=1):
+            sqlite_session.add(BreedingValueResult(
+                run_id=1, animal_id=animal_id, ebv=ebv, reliability=0.8, accuracy=0.9
+            ))
+        sqlite_session.add(BreedingValueResult(run_id=2, animal_id=1, ebv=9.0, reliability=0.8, accuracy=0.9))
+        
+        service = BreedingValueResultService(sqlite_session)
+        updated = service.recompute_percentiles(1)
+        
+        assert updated == 5
+        ranks = {r.animal_id: r.percentile_rank for r in service.get_by_run(1)}
+        assert ranks == {2: 0.0, 1: 25.0, 4: 50.0, 5: 75.0, 3: 100.0}
+        
+        # 其他批次不受影响
+        other = service.get_by_run(2)[0]
+        assert other.percentile_rank is None
+    
+    def test_create_batch(self, sqlite_session):
+        """测试批量创建 (单条INSERT ... RETURNING，由调用方提交)"""
+        from sqlalchemy import event
+        from services.breeding_value_service import BreedingValueResultService
+        from models.breeding_value import BreedingValueResult
+        
+        class ResultCreate:
+            def __init__(self, animal_id, ebv):
+                self.data = {"animal_id": animal_id, "ebv": ebv, "reliability": 0.8, "accuracy": 0.9}
+            
+            def model_dump(self):
+                return dict(self.data)
+        
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute",
+                     lambda conn, cursor, stmt, *args: statements.append(stmt))
+        
+        service = BreedingValueResultService(sqlite_session)
+        created = service.create_batch([ResultCreate(i, 0.1 * i) for i in range(1, 4)], run_id=7)
+        
+        assert [r.animal_id for r in created] == [1, 2, 3]
+        assert all(r.id is not None and r.run_id == 7 and r.created_at is not None for r in created)
+        assert len(statements) == 1 and "RETURNING" in statements[0]
+        assert service.create_batch([]) == []
+        
+        sqlite_session.commit()
+        assert sqlite_session.query(BreedingValueResult).filter_by(run_id=7).count() == 3
+
+
+# ============================================================================
+# 字典缓存测试
+# ============================================================================
+
+class _FakeRedis:
+    """最小化的内存Redis替身 (仅哈希命令)"""
+    
+    def __init__(self):
+        self.hashes = {}
+    
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+    
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+    
+    def expire(self, key, seconds):
+        pass
+    
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+    
+    def pipeline(self):
+        return self
+    
+    def execute(self):
+        pass
+
+
+class TestDictionaryCache:
+    """字典表缓存测试"""
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun]], indirect=True)
+    def test_get_and_invalidate_on_commit(self, sqlite_session):
+        """测试缓存命中及提交后失效"""
+        from services.dictionary_cache import DictionaryCache
+        
+        run = BreedingValueRun(run_name="run1", trait_id=1, method="BLUP")
+        sqlite_session.add(run)
+        sqlite_session.commit()
+        
+        redis = _FakeRedis()
+        cache = DictionaryCache(BreedingValueRun, "run_name", client=redis).watch()
+        
+        assert cache.get(sqlite_session, run.id)["method"] == "BLUP"
+        assert cache.get(sqlite_session, 999) is None
+        assert redis.hget("dict:breeding_value_runs:run_name", "run1") is not None
+        
+        # 绕过ORM改库: 缓存仍返回旧值
+        sqlite_session.execute(BreedingValueRun.__table__.update().values(method="GBLUP"))
+        sqlite_session.commit()
+        assert cache.get_by_code(sqlite_session, "run1")["method"] == "BLUP"
+        
+        # ORM写入提交后整表失效
+        run.trait_id = 2
+        sqlite_session.commit()
+        assert redis.hashes == {}
+        assert cache.get_by_code(sqlite_session, "run1")["method"] == "GBLUP"
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun]], indirect=True)
+    def test_named_list_cached_until_commit(self, sqlite_session):
+        """测试具名列表缓存命中、返回副本及提交后失效"""
+        from sqlalchemy import event
+        from services.dictionary_cache import DictionaryCache
+        
+        sqlite_session.add_all([
+            BreedingValueRun(run_name="run1", trait_id=1, method="BLUP"),
+            BreedingValueRun(run_name="run2", trait_id=1, method="GBLUP"),
+        ])
+        sqlite_session.commit()
+        
+        redis = _FakeRedis()
+        cache = DictionaryCache(
+            BreedingValueRun, "run_name", client=redis, lists={"blup": BreedingValueRun.method == "BLUP"}
+        ).watch()
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        
+        first = cache.get_list(sqlite_session, "blup")
+        assert [row["run_name"] for row in first] == ["run1"]
+        first.clear()
+        assert [row["run_name"] for row in cache.get_list(sqlite_session, "blup")] == ["run1"]
+        assert len(statements) == 1
+        
+        run2 = sqlite_session.query(BreedingValueRun).filter_by(run_name="run2").one()
+        run2.method = "BLUP"
+        sqlite_session.commit()
+        assert redis.hashes == {}
+        assert [row["run_name"] for row in cache.get_list(sqlite_session, "blup")] == ["run1", "run2"]
+    
+    @pytest.mark.parametrize("sqlite_session", [[BreedingValueRun]], indirect=True)
+    def test_update_field_invalidates_on_commit(self, sqlite_session):
+        """测试 update_field 的ORM批量UPDATE提交后同样失效 (不触发映射器事件)"""
+        from services.base import BaseService
+        from services.dictionary_cache import DictionaryCache
+        
+        sqlite_session.add(BreedingValueRun(id=1, run_name="run1", trait_id=1, method="BLUP"))
+        sqlite_session.commit()
+        
+        redis = _FakeRedis()
+        cache = DictionaryCache(
+            BreedingValueRun, "run_name", client=redis, lists={"blup": BreedingValueRun.method == "BLUP"}
+        ).watch()
+        assert cache.get(sqlite_session, 1)["method"] == "BLUP"
+        assert len(cache.get_list(sqlite_session, "blup")) == 1
+        
+        BaseService(BreedingValueRun, sqlite_session).update_field(1, "method", "GBLUP")
+        
+        assert redis.hashes == {}
+        assert cache.get(sqlite_session, 1)["method"] == "GBLUP"
+        assert cache.get_list(sqlite_session, "blup") == []
+
+
+# ============================================================================
+# IoTDataService测试
+# ============================================================================
+
+class TestIoTDataService:
+    """IoT数据服务测试"""
+    
+    def test_bulk_ingest_single_statement(self):
+        """测试批量写入为一次多行INSERT、一次提交"""
+        from unittest.mock import MagicMock
+        from sqlalchemy.dialects import postgresql
+        from services.iot_service import IoTDataService
+        
+        db = MagicMock()
+        rows = [{"device_id": i, "data_type": "temperature", "value": 20.5} for i in range(3)]
+        
+        assert IoTDataService(db).bulk_ingest(rows) == 3
+        db.execute.assert_called_once()
+        stmt, params = db.execute.call_args[0]
+        assert params is rows
+        assert str(stmt.compile(dialect=postgresql.dialect())).startswith("INSERT INTO iot_data")
+        db.commit.assert_called_once()
+        db.add.assert_not_called()
+        
+        assert IoTDataService(db).bulk_ingest([]) == 0
+        db.execute.assert_called_once()
+    
+    def test_stream_reduce_matches_numpy(self):
+        """测试分批流式统计与整体计算一致，游标按批读取"""
+        from datetime import datetime
+        from unittest.mock import MagicMock
+        import numpy as np
+        from services.iot_service import IoTDataService, IOT_STREAM_BATCH_SIZE
+        
+        values = np.random.default_rng(0).normal(38.5, 0.6, 25)
+        db = MagicMock()
+        db.execute.return_value.partitions.return_value = [
+            [(v,) for v in values[i:i + 10]] for i in range(0, len(values), 10)
+        ]
+        
+        stats = IoTDataService(db).stream_reduce(1, "temperature", datetime(2024, 1, 1), datetime(2024, 1, 2))
+        
+        assert stats == {
+            "count": 25,
+            "average": round(float(values.mean()), 2),
+            "std": round(float(values.std(ddof=1)), 2),
+            "minimum": round(float(values.min()), 2),
+            "maximum": round(float(values.max()), 2)
+        }
+        stmt = db.execute.call_args[0][0]
+        assert stmt.get_execution_options()["yield_per"] == IOT_STREAM_BATCH_SIZE
+        assert [c.name for c in stmt.selected_columns] == ["value"]
+        
+        db.execute.return_value.partitions.return_value = []
+        assert IoTDataService(db).stream_reduce(1, "temperature", datetime(2024, 1, 1), datetime(2024, 1, 2))["count"] == 0
+
+
+# ============================================================================
+# IoT写入缓冲测试
+# ============================================================================
+
+class TestIoTIngestBuffer:
+    """IoT数据写入缓冲测试"""
+    
+    def test_flush_by_batch_size_and_stop(self):
+        """测试满批量刷写、分片写入及关闭时刷写剩余数据"""
+        import asyncio
+        from unittest.mock import MagicMock
+        from services.iot_ingest import IoTIngestBuffer
+        
+        written = []
+        model = MagicMock()
+        model.bulk_insert.side_effect = lambda session, rows: written.append(list(rows))
+        sessions = []
+        
+        def session_factory():
+            sessions.append(MagicMock())
+            return sessions[-1]
+        
+        buffer = IoTIngestBuffer(model=model, session_factory=session_factory,
+                                 batch_size=4, flush_interval=60, shards=2)
+        rows = [{"device_id": i, "value": i} for i in range(1, 6)]
+        
+        async def scenario():
+            buffer.start()
+            await buffer.add(rows[:3])
+            assert written == [] and buffer.pending == 3
+            await buffer.add(rows[3:4])
+            assert buffer.pending == 0
+            await buffer.add(rows[4:])
+            await buffer.stop()
+        
+        asyncio.run(scenario())
+        
+        # 前4行按 device_id % 2 分为两片，关闭时写出第5行
+        assert sorted(sorted(r["device_id"] for r in batch) for batch in written) == [[1, 3], [2, 4], [5]]
+        assert all(s.commit.called and s.close.called for s in sessions)
+        assert buffer.pending == 0
+    
+    def test_failed_shard_retried_row_by_row(self):
+        """测试分片整批失败时逐行重试，只剔除坏行"""
+        import asyncio
+        from unittest.mock import MagicMock
+        from services.iot_ingest import IoTIngestBuffer
+        
+        written = []
+        
+        def bulk_insert(session, rows):
+            if any(r["value"] is None for r in rows):
+                raise ValueError("null value")
+            written.append([r["device_id"] for r in rows])
+        
+        model = MagicMock()
+        model.bulk_insert.side_effect = bulk_insert
+        session = MagicMock()
+        buffer = IoTIngestBuffer(model=model, session_factory=lambda: session,
+                                 batch_size=100, flush_interval=60, shards=1)
+        
+        async def scenario():
+            await buffer.add([{"device_id": 1, "value": 1.0}, {"device_id": 2, "value": None},
+                              {"device_id": 3, "value": 3.0}])
+            return await buffer.flush()
+        
+        assert asyncio.run(scenario()) == 2
+        assert written == [[1], [3]]
+        assert buffer.rejected == 1
+        assert session.begin_nested.return_value.rollback.call_count == 1
+    
+    def test_heartbeats_coalesced_into_one_update(self):
+        """测试窗口内心跳去重，合并为一条 UPDATE ... WHERE id IN"""
+        import asyncio
+        from unittest.mock import MagicMock
+        from sqlalchemy.dialects import postgresql
+        from services.iot_ingest import HeartbeatBuffer
+        
+        session = MagicMock()
+        session.execute.return_value.rowcount = 2
+        buffer = HeartbeatBuffer(session_factory=lambda: session, flush_interval=60)
+        for device_id in (3, 5, 3, 3):
+            buffer.mark(device_id)
+        assert buffer.pending == 2
+        
+        assert asyncio.run(buffer.flush()) == 2
+        assert buffer.pending == 0
+        session.execute.assert_called_once()
+        stmt = session.execute.call_args[0][0]
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert sql.startswith("UPDATE iot_devices SET")
+        assert "iot_devices.id IN (__[POSTCOMPILE_id_1])" in sql
+        assert sorted(stmt.compile().params["id_1"]) == [3, 5]
+        # 与 update_heartbeat / get_stale 同取应用时钟，而非数据库 now()
+        assert isinstance(stmt.compile().params["last_heartbeat"], datetime)
+        session.commit.assert_called_once()
+        session.close.assert_called_once()
+        
+        assert asyncio.run(buffer.flush()) == 0
+        session.execute.assert_called_once()
+
+
+# ============================================================================
+# GrowthRecordService测试
+# ============================================================================
+
+class TestGrowthRecordService:
+    """生长记录服务测试"""
+    
+    @pytest.mark.parametrize("sqlite_session", [[GrowthRecord]], indirect=True)
+    def test_batch_create_single_insert_returning(self, sqlite_session):
+        """测试批量创建为一条 INSERT ... RETURNING，不逐条 refresh"""
+        from sqlalchemy import event
+        from services.growth_service import GrowthRecordService
+        
+        rows = [
+            {"animal_id": 1, "measurement_date": date(2024, 1, 1), "measurement_type": "routine", "body_weight": 30},
+            {"animal_id": 2, "measurement_date": date(2024, 1, 1), "measurement_type": "routine", "body_weight": 32},
+        ]
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        service = GrowthRecordService(sqlite_session)
+        
+        records = service.batch_create(rows)
+        
+        assert len(records) == 2 and len(statements) == 1
+        assert statements[0].startswith("INSERT INTO growth_records") and "RETURNING" in statements[0]
+        stored = sqlite_session.query(GrowthRecord.id, GrowthRecord.animal_id, GrowthRecord.body_weight)
+        assert sorted(stored) == [(records[0].id, 1, 30), (records[1].id, 2, 32)]
+        
+        assert service.batch_create([]) == []
+    
+    @pytest.mark.parametrize("sqlite_session", [[GrowthRecord]], indirect=True)
+    def test_calculate_adg_bulk(self, sqlite_session):
+        """测试批量日增重: 一次窗口查询取各自最近两次测定，单条/同日记录为None"""
+        from sqlalchemy import event
+        from services.growth_service import GrowthRecordService
+        
+        for animal_id, day, weight, deleted in ((1, date(2024, 2, 1), 10, False), (1, date(2024, 3, 1), 30, False),
+                                                (1, date(2024, 3, 11), 35, False),
+                                                (2, date(2024, 3, 1), 20, False), (2, date(2024, 3, 11), 25, False),
+                                                (2, date(2024, 3, 21), 99, True),
+                                                (3, date(2024, 3, 11), 20, False),
+                                                (4, date(2024, 3, 11), 20, False), (4, date(2024, 3, 11), 21, False)):
+            sqlite_session.add(GrowthRecord(animal_id=animal_id, measurement_date=day, measurement_type="routine",
+                                            body_weight=weight, is_deleted=deleted))
+        sqlite_session.commit()
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        service = GrowthRecordService(sqlite_session)
+        
+        assert service.calculate_adg_bulk([1, 2, 3, 4, 5]) == {1: 0.5, 2: 0.5, 3: None, 4: None}
+        assert len(statements) == 1
+        assert "lag(growth_records.body_weight) OVER (PARTITION BY growth_records.animal_id" in statements[0]
+        assert "row_number() OVER" in statements[0]
+        
+        assert service.calculate_adg(1) == 0.5
+        assert service.calculate_adg_bulk([]) == {}
+    
+    @pytest.mark.parametrize("sqlite_session", [[GrowthRecord]], indirect=True)
+    def test_growth_curve_columns_only(self, sqlite_session):
+        """测试生长曲线只查询所需列"""
+        from sqlalchemy import event
+        from services.growth_service import GrowthRecordService
+        
+        sqlite_session.add_all([
+            GrowthRecord(animal_id=1, measurement_date=date(2024, 4, 1), measurement_type="routine",
+                         age_days=91, body_weight=25.0, body_length=60.1),
+            GrowthRecord(animal_id=1, measurement_date=date(2024, 1, 1), measurement_type="birth",
+                         age_days=0, body_weight=4.2, chest_girth=35.5),
+            GrowthRecord(animal_id=2, measurement_date=date(2024, 1, 1), measurement_type="birth",
+                         age_days=0, body_weight=4.0),
+        ])
+        sqlite_session.commit()
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        
+        curve = GrowthRecordService(sqlite_session).get_growth_curve(1)
+        
+        assert curve == [
+            {"date": "2024-01-01", "age_days": 0, "weight": 4.2, "body_length": None, "chest_girth": 35.5},
+            {"date": "2024-04-01", "age_days": 91, "weight": 25.0, "body_length": 60.1, "chest_girth": None},
+        ]
+        assert len(statements) == 1 and statements[0].startswith(
+            "SELECT growth_records.measurement_date, growth_records.age_days, growth_records.body_weight, "
+            "growth_records.body_length, growth_records.chest_girth \nFROM growth_records"
+        )
+    
+    def test_population_summary_single_query(self):
+        """
+        测试全群体汇总为一条聚合查询，分位数在库内计算
+        
+        percentile_cont ... WITHIN GROUP 为PostgreSQL语法，SQLite 无法执行，此处按 PostgreSQL 方言编译语句断言
+        """
+        from types import SimpleNamespace
+        from unittest.mock import MagicMock
+        from sqlalchemy.dialects import postgresql
+        from services.growth_service import GrowthRecordService
+        
+        db = MagicMock()
+        db.execute.return_value.one.return_value = SimpleNamespace(
+            total=12, birth=4.23, weaning=None, day120=38.04, avg_adg=0.2514,
+            adg_p25=0.2, adg_p50=0.25, adg_p75=0.31, avg_bcs=3.14, bcs_p50=3.0
+        )
+        
+        summary = GrowthRecordService(db).get_population_summary()
+        
+        assert summary["total_records"] == 12
+        assert summary["avg_birth_weight"] == 4.2
+        assert summary["avg_weaning_weight"] is None
+        assert summary["avg_daily_gain"] == 0.251
+        assert summary["adg_quartiles"] == [0.2, 0.25, 0.31]
+        assert summary["median_body_condition"] == 3.0
+        db.execute.assert_called_once()
+        sql = str(db.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+        assert "percentile_cont(%(percentile_cont_2)s) WITHIN GROUP (ORDER BY growth_records.average_daily_gain)" in sql
+        assert "FILTER (WHERE growth_records.age_days BETWEEN" in sql
+    
+    @pytest.mark.parametrize("sqlite_session", [[GrowthRecord]], indirect=True)
+    def test_get_by_animal_keyset(self, sqlite_session):
+        """测试按 (测量日期, ID) 键集翻页"""
+        from sqlalchemy import event
+        from services.growth_service import GrowthRecordService
+        
+        for day in (1, 1, 2, 3, 3):
+            sqlite_session.add(GrowthRecord(animal_id=7, measurement_date=date(2024, 3, day),
+                                            measurement_type="routine", body_weight=30 + day))
+        sqlite_session.add(GrowthRecord(animal_id=8, measurement_date=date(2024, 3, 3),
+                                        measurement_type="routine", body_weight=40))
+        sqlite_session.commit()
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        service = GrowthRecordService(sqlite_session)
+        
+        first = service.get_by_animal(7, limit=2)
+        assert [(r.measurement_date.day, r.id) for r in first] == [(3, 5), (3, 4)]
+        last = first[-1]
+        second = service.get_by_animal(7, limit=2, before=(last.measurement_date, last.id))
+        assert [(r.measurement_date.day, r.id) for r in second] == [(2, 3), (1, 2)]
+        last = second[-1]
+        third = service.get_by_animal(7, limit=2, before=(last.measurement_date, last.id))
+        assert [(r.measurement_date.day, r.id) for r in third] == [(1, 1)]
+        # 翻页以 (测量日期, ID) 行值比较定位，而非跳过前几页
+        assert "(growth_records.measurement_date, growth_records.id) < (?, ?)" in statements[1]
+        
+        # 列投影: 只 SELECT 所需列，返回字典行
+        projected = service.get_by_animal(7, limit=1, fields=["measurement_date", "body_weight"])
+        assert [dict(row) for row in projected] == [{"measurement_date": date(2024, 3, 3), "body_weight": 33}]
+        assert statements[-1].startswith(
+            "SELECT growth_records.measurement_date AS measurement_date, "
+            "growth_records.body_weight AS body_weight \nFROM growth_records"
+        )
+
+
+# ============================================================================
+# HealthRecordService测试
+# ============================================================================
+
+class TestHealthRecordService:
+    """健康/接种记录服务测试"""
+    
+    def test_record_lists_preload_dictionaries(self, monkeypatch):
+        """测试健康/接种记录列表在严格模式下仍联接加载疾病/疫苗类型"""
+        from sqlalchemy import event
+        from sqlalchemy.dialects import postgresql
+        from sqlalchemy.orm import Session
+        from config import settings
+        from services.health_service import HealthRecordService, VaccinationRecordService
+        
+        class Captured(Exception):
+            pass
+        
+        def capture(state):
+            raise Captured(str(state.statement.compile(dialect=postgresql.dialect())))
+        
+        monkeypatch.setattr(settings, "ORM_RAISE_ON_LAZY_LOAD", True)
+        session = Session()
+        event.listen(session, "do_orm_execute", capture)
+        
+        with pytest.raises(Captured) as health:
+            HealthRecordService(session).get_by_animal(1)
+        assert "LEFT OUTER JOIN diseases" in str(health.value)
+        
+        with pytest.raises(Captured) as vaccination:
+            VaccinationRecordService(session).get_by_animal(1)
+        assert "JOIN vaccine_types" in str(vaccination.value)
+        assert "LEFT OUTER JOIN vaccine_types" not in str(vaccination.value)
+
+
+# ============================================================================
+# FeedInventoryService测试
+# ============================================================================
+
+class TestFeedInventoryService:
+    """饲料库存服务测试"""
+    
+    @pytest.mark.parametrize("sqlite_session", [[FeedInventory]], indirect=True)
+    def test_update_quantity_atomic(self, sqlite_session):
+        """测试库存增减为单条原子 UPDATE，按羊场区分"""
+        from decimal import Decimal
+        from sqlalchemy import event
+        from services.feed_service import FeedInventoryService
+        
+        sqlite_session.add_all([
+            FeedInventory(farm_id=1, feed_type_id=5, current_quantity=100),
+            FeedInventory(farm_id=2, feed_type_id=5, current_quantity=100),
+        ])
+        sqlite_session.commit()
+        
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        service = FeedInventoryService(sqlite_session)
+        
+        assert service.update_quantity(5, Decimal("-30.5"), farm_id=1) is True
+        assert service.update_quantity(5, Decimal("10"), farm_id=1) is True
+        assert len(statements) == 2 and all(sql.startswith("UPDATE") for sql in statements)
+        assert service.update_quantity(6, Decimal("1"), farm_id=1) is False
+        assert service.update_quantity(5, Decimal("1"), farm_id=3) is False
+        
+        quantities = dict(sqlite_session.query(FeedInventory.farm_id, FeedInventory.current_quantity))
+        assert quantities == {1: Decimal("79.50"), 2: Decimal("100.00")}
+
+
+# ============================================================================
+# 统计查询测试
+# ============================================================================
+
+class TestStatistics:
+    """统计查询测试"""
+    
+    @pytest.mark.parametrize("sqlite_session", [[AutoWeighingRecord]], indirect=True)
+    def test_weighing_by_animal_keyset(self, sqlite_session):
+        """测试称重记录按时间游标翻页，页间不重不漏"""
+        from datetime import datetime, timedelta
+        from services.iot_service import AutoWeighingService
+        
+        start = datetime(2024, 1, 1)
+        sqlite_session.add_all([
+            AutoWeighingRecord(animal_id=1, device_id=1, weighing_time=start + timedelta(days=i), raw_weight=30 + i)
+            for i in range(5)
+        ])
+        sqlite_session.commit()
+        
+        service = AutoWeighingService(sqlite_session)
+        pages, before = [], None
+        while True:
+            page = service.get_by_animal(1, limit=2, before=before)
+            if not page:
+                break
+            pages.append([int(r.raw_weight) for r in page])
+            before = page[-1].weighing_time
+        
+        assert pages == [[34, 33], [32, 31], [30]]
+    
+    @pytest.mark.parametrize("sqlite_session", [[AutoWeighingRecord]], indirect=True)
+    def test_weighing_statistics_single_query(self, sqlite_session):
+        """测试称重统计为一次聚合查询"""
+        from datetime import datetime, timedelta
+        from sqlalchemy import event
+        from services.iot_service import AutoWeighingService
+        
+        now = datetime.now()
+        for weight, when, synced in ((40, now, False), (50, now - timedelta(days=2), True),
+                                     (60, now - timedelta(days=3), False)):
+            sqlite_session.add(AutoWeighingRecord(device_id=1, weighing_time=when, raw_weight=weight,
+                                                  corrected_weight=weight, synced_to_growth_record=synced))
+        sqlite_session.commit()
+        
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        stats = AutoWeighingService(sqlite_session).get_statistics()
+        
+        assert len(statements) == 1
+        assert stats == {
+            "total_records": 3,
+            "today_weighings": 1,
+            "unsynced_count": 2,
+            "average_weight": 50.0
+        }
+    
+    @pytest.mark.parametrize("sqlite_session", [[FeedType, FeedInventory]], indirect=True)
+    def test_inventory_statistics_single_query(self, monkeypatch, sqlite_session):
+        """测试库存统计的低库存数、库存金额与列表条件一致且为一次查询"""
+        from sqlalchemy import event
+        from config import settings
+        from services.feed_service import FeedInventoryService
+        
+        monkeypatch.setattr(settings, "DICTIONARY_CACHE_ENABLED", False)
+        sqlite_session.add_all([
+            FeedType(id=1, feed_code="F1", name="玉米", category="concentrate", unit_price=2),
+            FeedType(id=2, feed_code="F2", name="苜蓿", category="roughage", unit_price=3),
+            FeedInventory(farm_id=1, feed_type_id=1, current_quantity=50, min_quantity=100),
+            FeedInventory(farm_id=1, feed_type_id=2, current_quantity=200, min_quantity=100),
+        ])
+        sqlite_session.commit()
+        
+        service = FeedInventoryService(sqlite_session)
+        statements = []
+        event.listen(sqlite_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        stats = service.get_statistics()
+        
+        assert len(statements) == 1
+        assert stats == {
+            "total_feed_types": 2,
+            "low_stock_count": len(service.get_low_stock()),
+            "total_inventory_value": 700.0
+        }
+        assert stats["low_stock_count"] == 1
+    
+    @pytest.mark.parametrize("sqlite_session", [[GrowthRecord]], indirect=True)
+    def test_growth_statistics_from_monthly_view(self, sqlite_session):
+        """测试生长统计: 刷新月份之前读汇总视图，之后实时聚合；从未刷新时全部实时聚合"""
+        from datetime import timedelta
+        from models.base import stats_view_refreshes
+        from models.growth import growth_stats_monthly
+        from services.growth_service import GrowthRecordService
+        
+        # 物化视图在SQLite上以同结构普通表代替
+        growth_stats_monthly.create(sqlite_session.get_bind())
+        stats_view_refreshes.create(sqlite_session.get_bind())
+        month_start = date.today().replace(day=1)
+        prev_month = (month_start - timedelta(days=1)).replace(day=1)
+        old_month = (prev_month - timedelta(days=1)).replace(day=1)
+        
+        for measured, measurement_type, weight in ((old_month, "routine", 99), (prev_month, "routine", 30),
+                                                   (month_start, "routine", 40), (month_start, "routine", 50),
+                                                   (month_start, "weaning", 20)):
+            sqlite_session.add(GrowthRecord(animal_id=1, measurement_date=measured, measurement_type=measurement_type,
+                                            body_weight=weight, average_daily_gain=0.2, body_condition_score=3))
+        sqlite_session.execute(growth_stats_monthly.insert(), [
+            dict(month=old_month, measurement_type="routine", record_count=100, weight_sum=3000.0, weight_count=100,
+                 adg_sum=20.0, adg_count=80, bcs_sum=300.0, bcs_count=100),
+            # 刷新所在月份的视图行不读，改为实时聚合
+            dict(month=prev_month, measurement_type="routine", record_count=7, weight_sum=700.0, weight_count=7,
+                 adg_sum=0.0, adg_count=0, bcs_sum=0.0, bcs_count=0),
+        ])
+        sqlite_session.commit()
+        service = GrowthRecordService(sqlite_session)
+        
+        assert service.get_statistics("routine") == {
+            "total_records": 4,
+            "this_month_records": 2,
+            "average_weight": round(219 / 4, 2),
+            "average_adg": 0.2,
+            "average_body_condition": 3.0
+        }
+        
+        sqlite_session.execute(stats_view_refreshes.insert().values(
+            view_name="growth_stats_monthly", refreshed_at=datetime.combine(prev_month, datetime.min.time())
+        ))
+        assert service.get_statistics("routine") == {
+            "total_records": 103,
+            "this_month_records": 2,
+            "average_weight": round(3120 / 103, 2),
+            "average_adg": round(20.6 / 83, 3),
+            "average_body_condition": round(309 / 103, 1)
+        }
 
 
 # ============================================================================
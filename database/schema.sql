@@ -166,7 +166,7 @@ CREATE TABLE pedigree (
     sire_id INTEGER REFERENCES animals(id),              -- 父亲ID
     dam_id INTEGER REFERENCES animals(id),               -- 母亲ID
     generation INTEGER,                                  -- 世代数
-    inbreeding_coefficient DECIMAL(10,6),                -- 近交系数
+    inbreeding_coefficient REAL,                         -- 近交系数 (float4)
     pedigree_completeness DECIMAL(5,2),                  -- 系谱完整度(%)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -537,7 +537,6 @@ CREATE INDEX idx_pedigree_sire ON pedigree(sire_id);
 CREATE INDEX idx_pedigree_dam ON pedigree(dam_id);
 
 -- 表型数据索引
-CREATE INDEX idx_phenotype_animal ON phenotype_records(animal_id);
 CREATE INDEX idx_phenotype_trait ON phenotype_records(trait_id);
 CREATE INDEX idx_phenotype_date ON phenotype_records(measurement_date);
 CREATE INDEX idx_phenotype_animal_trait ON phenotype_records(animal_id, trait_id);
@@ -744,7 +743,7 @@ CREATE TABLE farms (
     capacity INTEGER,                                     -- 设计存栏量
     current_stock INTEGER DEFAULT 0,                     -- 当前存栏量
     area_hectares DECIMAL(10,2),                         -- 占地面积(公顷)
-    address TEXT,                                         -- 详细地址
+    address VARCHAR(200),                                 -- 详细地址
     longitude DECIMAL(10,7),                             -- 经度
     latitude DECIMAL(10,7),                              -- 纬度
     manager_name VARCHAR(100),                           -- 场长姓名
@@ -911,8 +910,8 @@ CREATE TABLE health_records (
     animal_id INTEGER NOT NULL REFERENCES animals(id) ON DELETE CASCADE,
     check_date DATE NOT NULL,
     check_type VARCHAR(50) NOT NULL,                     -- 类型: routine/diagnostic/emergency
-    body_temperature DECIMAL(4,1),                       -- 体温(℃)
-    body_weight DECIMAL(8,2),                            -- 体重(kg)
+    body_temperature DOUBLE PRECISION,                   -- 体温(℃)
+    body_weight DOUBLE PRECISION,                        -- 体重(kg)
     body_condition_score DECIMAL(3,1),                   -- 体况评分(1-5)
     respiratory_rate INTEGER,                            -- 呼吸频率
     heart_rate INTEGER,                                  -- 心率
@@ -1109,16 +1108,16 @@ CREATE TABLE growth_records (
     animal_id INTEGER NOT NULL REFERENCES animals(id) ON DELETE CASCADE,
     measurement_date DATE NOT NULL,
     age_days INTEGER,                                    -- 日龄
-    body_weight DECIMAL(8,2),                            -- 体重(kg)
-    body_height DECIMAL(6,2),                            -- 体高(cm)
-    body_length DECIMAL(6,2),                            -- 体长(cm)
-    chest_girth DECIMAL(6,2),                            -- 胸围(cm)
-    chest_depth DECIMAL(6,2),                            -- 胸深(cm)
-    chest_width DECIMAL(6,2),                            -- 胸宽(cm)
-    hip_width DECIMAL(6,2),                              -- 臀宽(cm)
-    cannon_circumference DECIMAL(6,2),                   -- 管围(cm)
-    backfat_thickness DECIMAL(5,2),                      -- 背膘厚(mm) - 超声波
-    loin_eye_area DECIMAL(6,2),                          -- 眼肌面积(cm²) - 超声波
+    body_weight DOUBLE PRECISION,                        -- 体重(kg)
+    body_height DOUBLE PRECISION,                        -- 体高(cm)
+    body_length DOUBLE PRECISION,                        -- 体长(cm)
+    chest_girth DOUBLE PRECISION,                        -- 胸围(cm)
+    chest_depth DOUBLE PRECISION,                        -- 胸深(cm)
+    chest_width DOUBLE PRECISION,                        -- 胸宽(cm)
+    hip_width DOUBLE PRECISION,                          -- 臀宽(cm)
+    cannon_circumference DOUBLE PRECISION,               -- 管围(cm)
+    backfat_thickness DOUBLE PRECISION,                  -- 背膘厚(mm) - 超声波
+    loin_eye_area DOUBLE PRECISION,                      -- 眼肌面积(cm²) - 超声波
     ultrasound_used BOOLEAN DEFAULT FALSE,
     measurement_method VARCHAR(50),                      -- 测定方法
     recorded_by INTEGER REFERENCES users(id),
@@ -1181,7 +1180,7 @@ CREATE TABLE iot_data (
     time TIMESTAMPTZ NOT NULL,
     device_id INTEGER NOT NULL REFERENCES iot_devices(id),
     metric_type VARCHAR(50) NOT NULL,                    -- 指标类型: weight/temperature/humidity/activity
-    metric_value DECIMAL(15,4) NOT NULL,                 -- 指标值
+    metric_value DOUBLE PRECISION NOT NULL,              -- 指标值
     unit VARCHAR(20),                                    -- 单位
     animal_id INTEGER REFERENCES animals(id),            -- 关联动物(如称重数据)
     quality VARCHAR(20) DEFAULT 'good',                  -- 数据质量: good/suspect/error
@@ -1216,7 +1215,7 @@ CREATE TABLE auto_weighing_records (
 
 -- 羊场管理索引
 CREATE INDEX idx_farms_org ON farms(organization_id);
-CREATE INDEX idx_barns_farm ON barns(farm_id);
+CREATE INDEX idx_barns_farm_available ON barns(farm_id, status, current_count, capacity);
 CREATE INDEX idx_animal_locations_animal ON animal_locations(animal_id);
 CREATE INDEX idx_animal_locations_farm ON animal_locations(farm_id);
 
@@ -1232,24 +1231,23 @@ CREATE INDEX idx_vaccination_records_animal ON vaccination_records(animal_id);
 CREATE INDEX idx_vaccination_records_date ON vaccination_records(vaccination_date);
 
 -- 繁殖管理索引
-CREATE INDEX idx_breeding_records_dam ON breeding_records(dam_id);
+CREATE INDEX idx_breeding_records_dam_date ON breeding_records(dam_id, breeding_date DESC);
 CREATE INDEX idx_breeding_records_sire ON breeding_records(sire_id);
-CREATE INDEX idx_breeding_records_date ON breeding_records(breeding_date);
 CREATE INDEX idx_pregnancy_records_animal ON pregnancy_records(animal_id);
-CREATE INDEX idx_lambing_records_dam ON lambing_records(dam_id);
+CREATE INDEX idx_lambing_records_dam_date ON lambing_records(dam_id, lambing_date DESC) INCLUDE (litter_size, born_alive);
 CREATE INDEX idx_lambing_records_date ON lambing_records(lambing_date);
 
 -- 生长发育索引
-CREATE INDEX idx_growth_records_animal ON growth_records(animal_id);
 CREATE INDEX idx_growth_records_date ON growth_records(measurement_date);
-CREATE INDEX idx_growth_records_animal_date ON growth_records(animal_id, measurement_date);
+CREATE INDEX idx_growth_records_animal_date ON growth_records(animal_id, measurement_date DESC, id DESC);
 
 -- 物联网索引
 CREATE INDEX idx_iot_devices_farm ON iot_devices(farm_id);
-CREATE INDEX idx_iot_devices_status ON iot_devices(status);
+CREATE INDEX idx_iot_devices_online_heartbeat ON iot_devices(last_heartbeat) WHERE status = 'online';
+CREATE INDEX idx_iot_devices_offline_heartbeat ON iot_devices(last_heartbeat) WHERE status != 'online';
 CREATE INDEX idx_iot_data_device ON iot_data(device_id);
 CREATE INDEX idx_iot_data_time ON iot_data(time DESC);
-CREATE INDEX idx_auto_weighing_animal ON auto_weighing_records(animal_id);
+CREATE UNIQUE INDEX uq_auto_weighing_animal_time ON auto_weighing_records(animal_id, weighing_time) WHERE animal_id IS NOT NULL;
 CREATE INDEX idx_auto_weighing_time ON auto_weighing_records(weighing_time);
 
 -- ============================================================================